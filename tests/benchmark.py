@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the main wagtail_review views, against data generated by the wagtail_review_seed
+command at several scales. Run from the repository root:
+
+    python tests/benchmark.py --scales 10,100,1000 --output benchmark.json
+
+Each scale is the number of pages created; the amount of data per page is set by the other options.
+A test database is created for the run (using the same settings as the test suite, so
+DATABASE_ENGINE etc. can be used to benchmark PostgreSQL), and the data for each scale is rolled
+back before moving on to the next. For each view, the wall time (minimum and median over
+--repeat runs), the number of database queries and the peak memory allocated by Python are recorded.
+
+To compare against an earlier run, e.g. on another commit:
+
+    python tests/benchmark.py --output new.json --compare benchmark.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.settings'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core import mail  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+
+import swapper  # noqa: E402
+import wagtail  # noqa: E402
+
+from wagtail_review.models import Annotation  # noqa: E402
+
+Review = swapper.load_model('wagtail_review', 'Review')
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function is passed the BenchmarkData for the current scale, and
+    returns the function to be timed.
+    """
+    def register(setup_func):
+        BENCHMARKS[name] = setup_func
+        return setup_func
+    return register
+
+
+class BenchmarkData:
+    """
+    Looks up the objects used by the benchmarks from the seeded data: the page with the most recent
+    review, and a reviewer from that review who has made annotations
+    """
+    def __init__(self, submitter):
+        self.submitter = submitter
+        self.client = Client()
+        self.client.force_login(submitter)
+
+        self.review = Review.objects.filter(status='open').order_by('-pk').first()
+        self.page = self.review.page
+        annotation = Annotation.objects.filter(reviewer__review=self.review).select_related('reviewer').first()
+        self.reviewer = annotation.reviewer
+        self.api_credentials = {
+            'HTTP_X_WAGTAILREVIEW_MODE': 'respond',
+            'HTTP_X_WAGTAILREVIEW_REVIEWER': str(self.reviewer.pk),
+            'HTTP_X_WAGTAILREVIEW_TOKEN': self.reviewer.response_token,
+        }
+
+    def get(self, url, params=None, **extra):
+        response = self.client.get(url, params or {}, **extra)
+        if response.status_code != 200:
+            raise AssertionError("%s returned status %d" % (url, response.status_code))
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+@benchmark('dashboard')
+def dashboard(data):
+    return lambda: data.get('/admin/wagtail_review/reviews/')
+
+
+@benchmark('audit_trail')
+def audit_trail(data):
+    return lambda: data.get('/admin/wagtail_review/reviews/%d/' % data.page.pk)
+
+
+@benchmark('annotations_api.search')
+def annotations_api_search(data):
+    return lambda: data.get('/review/api/search/', {'limit': 100}, **data.api_credentials)
+
+
+@benchmark('annotations_api.index')
+def annotations_api_index(data):
+    return lambda: data.get('/review/api/annotations/', **data.api_credentials)
+
+
+@benchmark('autocomplete_users')
+def autocomplete_users(data):
+    return lambda: data.get('/admin/wagtail_review/autocomplete_users/', {'q': 'smith'})
+
+
+@benchmark('send_request_emails')
+def send_request_emails(data):
+    def run():
+        mail.outbox = []
+        # a fresh instance, so that the deserialised page revision is not reused between runs
+        Review.objects.get(pk=data.review.pk).send_request_emails()
+    return run
+
+
+def measure(func, repeat):
+    # the first run warms up caches, and is not counted
+    func()
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    # count now, as the query log is cleared by the next request
+    query_count = len(queries)
+
+    tracemalloc.start()
+    try:
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'time_min': min(times),
+        'time_median': statistics.median(times),
+        'queries': query_count,
+        'peak_memory': peak,
+    }
+
+
+def run_scale(scale, options, benchmark_names):
+    results = {}
+    with transaction.atomic():
+        submitter = User.objects.create_superuser(username='benchmark', email='benchmark@example.com', password='password')
+        call_command(
+            'wagtail_review_seed', pages=scale, reviews_per_page=options.reviews_per_page,
+            reviewers_per_review=options.reviewers_per_review, annotations_per_reviewer=options.annotations_per_reviewer,
+            ranges_per_annotation=options.ranges_per_annotation, users=options.users, submitter='benchmark',
+            seed=scale, verbosity=0
+        )
+        data = BenchmarkData(submitter)
+
+        for name in benchmark_names:
+            cache.clear()
+            results[name] = measure(BENCHMARKS[name](data), options.repeat)
+            print("%6d pages  %-24s %8.1f ms %6d queries %10d bytes" % (
+                scale, name, results[name]['time_median'] * 1000, results[name]['queries'], results[name]['peak_memory']
+            ))
+
+        transaction.set_rollback(True)
+    return results
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """
+    Print the change in each measurement between two sets of results
+    """
+    print("\nChanges since %s:" % (old['environment'].get('git_commit') or "previous run"))
+    for scale, benchmarks in new['results'].items():
+        for name, result in benchmarks.items():
+            old_result = old['results'].get(scale, {}).get(name)
+            if old_result is None:
+                continue
+            print("%6s pages  %-24s %+7.1f%% time  %+5d queries  %+7.1f%% memory" % (
+                scale, name,
+                (result['time_median'] / old_result['time_median'] - 1) * 100,
+                result['queries'] - old_result['queries'],
+                (result['peak_memory'] / old_result['peak_memory'] - 1) * 100 if old_result['peak_memory'] else 0,
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wagtail_review views at several scales")
+    parser.add_argument('--scales', default='10,100', help="Comma-separated numbers of pages to benchmark with")
+    parser.add_argument('--reviews-per-page', type=int, default=3)
+    parser.add_argument('--reviewers-per-review', type=int, default=3)
+    parser.add_argument('--annotations-per-reviewer', type=int, default=20)
+    parser.add_argument('--ranges-per-annotation', type=int, default=1)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5, help="Number of timed runs of each benchmark")
+    parser.add_argument(
+        '--benchmark', action='append', choices=sorted(BENCHMARKS), dest='benchmarks',
+        help="Only run this benchmark (may be given more than once)"
+    )
+    parser.add_argument('--output', help="File to write the results to, as JSON")
+    parser.add_argument('--compare', help="JSON file of earlier results to compare against")
+    options = parser.parse_args()
+
+    scales = [int(scale) for scale in options.scales.split(',')]
+    benchmark_names = options.benchmarks or list(BENCHMARKS)
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        output = {
+            'environment': {
+                'git_commit': get_git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'wagtail': wagtail.__version__,
+                'database': connection.vendor,
+            },
+            'options': {
+                'reviews_per_page': options.reviews_per_page,
+                'reviewers_per_review': options.reviewers_per_review,
+                'annotations_per_reviewer': options.annotations_per_reviewer,
+                'ranges_per_annotation': options.ranges_per_annotation,
+                'users': options.users,
+                'repeat': options.repeat,
+            },
+            # keyed by scale as a string, to survive a round trip through JSON
+            'results': {str(scale): run_scale(scale, options, benchmark_names) for scale in scales},
+        }
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if options.compare:
+        with open(options.compare) as f:
+            compare(json.load(f), output)
+
+
+if __name__ == '__main__':
+    main()
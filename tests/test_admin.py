@@ -1,18 +1,28 @@
 import json
+from unittest import mock
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
 from django.core import mail
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-from wagtail.models import Page
+from wagtail.models import GroupPagePermission, Page, Site
 
+from wagtail_review.autocomplete import get_user_search_backend
 from wagtail_review.models import Review
+from wagtail_review.wagtail_hooks import ReviewsMenuItem
+from tests.models import SimplePage
 
 
 class TestAdminViews(TestCase):
     fixtures = ['test.json']
 
     def setUp(self):
+        cache.clear()
         self.admin_user = User.objects.create_superuser(
             username='admin', email='admin@example.com', password='password'
         )
@@ -177,31 +187,329 @@ class TestAdminViews(TestCase):
         email_recipients = set(email.to[0] for email in mail.outbox)
         self.assertEqual(email_recipients, {'someone@example.com', 'spongebob@example.com'})
 
+    def test_submit_does_not_render_preview(self):
+        # the page is only rendered when a reviewer visits it, keeping the submit request short
+        with mock.patch.object(SimplePage, 'serve_preview') as serve_preview:
+            response = self.client.post('/admin/pages/add/tests/simplepage/2/', {
+                'title': "Subpage submitted",
+                'slug': 'subpage-submitted',
+
+                'create_review_reviewers-TOTAL_FORMS': 1,
+                'create_review_reviewers-INITIAL_FORMS': 0,
+                'create_review_reviewers-MIN_NUM_FORMS': 0,
+                'create_review_reviewers-MAX_NUM_FORMS': 1000,
+
+                'create_review_reviewers-0-user': '',
+                'create_review_reviewers-0-email': 'someone@example.com',
+                'create_review_reviewers-0-DELETE': '',
+
+                'action-submit-for-review': '1',
+            })
+
+        self.assertRedirects(response, '/admin/pages/2/')
+        revision = Page.objects.get(slug='subpage-submitted').get_latest_revision()
+        self.assertTrue(Review.objects.filter(page_revision=revision).exists())
+        self.assertFalse(serve_preview.called)
+
     def test_reviews_index(self):
-        revision = self.homepage.save_revision()
-        review = Review.objects.create(page_revision=revision, submitter=self.admin_user)
-        review.reviewers.create(user=self.admin_user)
-        review.reviewers.create(user=User.objects.get(username='spongebob'))
+        with self.captureOnCommitCallbacks(execute=True):
+            revision = self.homepage.save_revision()
+            review = Review.objects.create(page_revision=revision, submitter=self.admin_user)
+            review.reviewers.create(user=self.admin_user)
+            review.reviewers.create(user=User.objects.get(username='spongebob'))
         response = self.client.get('/admin/wagtail_review/reviews/')
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, '<a href="/admin/wagtail_review/reviews/%d/">Home</a>' % self.homepage.pk, html=True)
         self.assertContains(response, '<td class="status">Open</td>', html=True)
 
+    def test_reviews_index_query_count(self):
+        def create_review(page):
+            with self.captureOnCommitCallbacks(execute=True):
+                review = Review.objects.create(page_revision=page.save_revision(), submitter=self.admin_user)
+                review.reviewers.create(user=self.admin_user)
+            return review
+
+        create_review(self.homepage)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/wagtail_review/reviews/')
+        self.assertEqual(response.status_code, 200)
+        query_count = len(queries)
+
+        for i in range(5):
+            page = self.homepage.add_child(instance=SimplePage(title="Page %d" % i, slug="page-%d" % i))
+            review = create_review(page)
+            if i % 2:
+                with self.captureOnCommitCallbacks(execute=True):
+                    review.status = 'closed'
+                    review.save()
+
+        with self.assertNumQueries(query_count):
+            response = self.client.get('/admin/wagtail_review/reviews/')
+        self.assertContains(response, '<td class="status">Open</td>', count=4, html=True)
+        self.assertContains(response, '<td class="status">Closed</td>', count=2, html=True)
+
     def test_review_audit_trail(self):
-        revision = self.homepage.save_revision()
-        review = Review.objects.create(page_revision=revision, submitter=self.admin_user)
-        review.reviewers.create(user=self.admin_user)
-        review.reviewers.create(user=User.objects.get(username='spongebob'))
+        with self.captureOnCommitCallbacks(execute=True):
+            revision = self.homepage.save_revision()
+            review = Review.objects.create(page_revision=revision, submitter=self.admin_user)
+            review.reviewers.create(user=self.admin_user)
+            review.reviewers.create(user=User.objects.get(username='spongebob'))
         response = self.client.get('/admin/wagtail_review/reviews/%d/' % self.homepage.pk)
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Review requested by admin')
         self.assertContains(response, '<td>Spongebob Squarepants</td>')
         self.assertContains(response, '<td>Awaiting response</td>')
 
+    def test_review_audit_trail_query_count(self):
+        spongebob = User.objects.get(username='spongebob')
+        homer = User.objects.get(username='homer')
+
+        def create_review():
+            with self.captureOnCommitCallbacks(execute=True):
+                review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+                review.reviewers.create(user=self.admin_user)
+                review.reviewers.create(user=spongebob).responses.create(result='approve', comment="Looks good")
+                review.reviewers.create(user=homer)
+                review.reviewers.create(email='someone@example.com')
+            return review
+
+        create_review()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/wagtail_review/reviews/%d/' % self.homepage.pk)
+        self.assertEqual(response.status_code, 200)
+        query_count = len(queries)
+
+        for i in range(4):
+            create_review()
+
+        with self.assertNumQueries(query_count):
+            response = self.client.get('/admin/wagtail_review/reviews/%d/' % self.homepage.pk)
+        self.assertContains(response, '<td>Spongebob Squarepants</td>', count=5)
+        self.assertContains(response, '<td>Looks good</td>', count=5)
+        self.assertContains(response, '<td>Homer Simpson</td>', count=5)
+        self.assertContains(response, '<td>someone@example.com</td>', count=5)
+        self.assertNotContains(response, '<td>admin</td>')
+
+    def test_review_audit_trail_pagination(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(25):
+                Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+
+        response = self.client.get('/admin/wagtail_review/reviews/%d/' % self.homepage.pk)
+        self.assertEqual(len(response.context['reviews']), 20)
+        self.assertContains(response, 'Page 1 of 2.')
+
+        response = self.client.get('/admin/wagtail_review/reviews/%d/?p=2' % self.homepage.pk)
+        self.assertEqual(len(response.context['reviews']), 5)
+
     def test_view_review(self):
-        revision = self.homepage.save_revision()
+        Site.objects.update(hostname="testserver")
+        page = self.homepage.add_child(instance=SimplePage(title="Simple page", slug="simple-page"))
+        revision = page.save_revision()
         review = Review.objects.create(page_revision=revision, submitter=self.admin_user)
         review.reviewers.create(user=self.admin_user)
         review.reviewers.create(user=User.objects.get(username='spongebob'))
         response = self.client.get('/admin/wagtail_review/reviews/%d/view/' % review.pk)
         self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "'X-WagtailReview-mode': 'comment'")
+        self.assertContains(response, "/review/api/")
+
+
+class TestUserAutocomplete(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        cache.clear()
+        get_user_search_backend.cache_clear()
+        self.addCleanup(get_user_search_backend.cache_clear)
+
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.assertTrue(self.client.login(username='admin', password='password'))
+        User.objects.create_user(username='mhouse', first_name='Mrs', last_name='Homeroom')
+        User.objects.create_user(username='homerj', first_name='Homer', last_name='Jay')
+
+    def get_usernames(self, q):
+        response = self.client.get('/admin/wagtail_review/autocomplete_users/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [result['username'] for result in json.loads(response.content)['results']]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(self.get_usernames('omer'), ['homer', 'homerj', 'mhouse'])
+        self.assertEqual(self.get_usernames('homer'), ['homer', 'homerj', 'mhouse'])
+        self.assertEqual(self.get_usernames('jay home'), ['homerj'])
+        self.assertEqual(self.get_usernames('room'), ['mhouse'])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.get_usernames('homer simpson'), ['homer'])
+        self.assertEqual(self.get_usernames('homer squarepants'), [])
+
+    def test_empty_query(self):
+        self.assertEqual(self.get_usernames(''), [])
+
+    @override_settings(WAGTAILREVIEW_AUTOCOMPLETE_LIMIT=2)
+    def test_limit(self):
+        self.assertEqual(self.get_usernames('homer'), ['homer', 'homerj'])
+
+    @override_settings(WAGTAILREVIEW_AUTOCOMPLETE_BACKEND='wagtail_review.autocomplete.InMemoryPrefixUserSearchBackend')
+    def test_in_memory_backend(self):
+        self.assertEqual(self.get_usernames('Homer'), ['homer', 'homerj', 'mhouse'])
+        self.assertEqual(self.get_usernames('simp hom'), ['homer'])
+        # only the start of each word is matched
+        self.assertEqual(self.get_usernames('omer'), [])
+
+        # the index is built once, and rebuilt after users change
+        backend = get_user_search_backend()
+        with self.assertNumQueries(1):
+            self.assertEqual([user.username for user in backend.search(['jay'], 20)], ['homerj'])
+        User.objects.filter(username='homerj').get().delete()
+        self.assertEqual(self.get_usernames('jay'), [])
+
+    @override_settings(WAGTAILREVIEW_AUTOCOMPLETE_BACKEND='wagtail_review.autocomplete.NoSuchBackend')
+    def test_invalid_backend(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_user_search_backend()
+
+
+class TestReviewsMenuItem(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.editor = User.objects.get(username='spongebob')
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.menu_item = ReviewsMenuItem('Reviews', '/admin/wagtail_review/reviews/')
+
+    def is_shown(self, user):
+        request = RequestFactory().get('/admin/')
+        request.user = user
+        return self.menu_item.is_shown(request)
+
+    def test_is_shown_is_cached(self):
+        self.assertFalse(self.is_shown(self.admin_user))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.is_shown(self.admin_user))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.is_shown(self.admin_user))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertFalse(self.is_shown(self.admin_user))
+
+    def test_invalidated_on_permission_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+        self.assertFalse(self.is_shown(self.editor))
+
+        editors = Group.objects.create(name="Review testers")
+        GroupPagePermission.objects.create(
+            group=editors, page=self.homepage, permission=Permission.objects.get(codename='change_page')
+        )
+        self.editor.groups.add(editors)
+        self.editor = User.objects.get(pk=self.editor.pk)
+        self.assertTrue(self.is_shown(self.editor))
+
+        self.editor.groups.remove(editors)
+        self.editor = User.objects.get(pk=self.editor.pk)
+        self.assertFalse(self.is_shown(self.editor))
+
+    def test_invalidated_on_permission_change_in_group_edit_view(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+        editors = Group.objects.create(name="Review testers")
+        self.editor.groups.add(editors)
+        self.editor = User.objects.get(pk=self.editor.pk)
+        self.assertFalse(self.is_shown(self.editor))
+
+        # the group edit view creates page permissions with bulk_create, which sends no post_save signal
+        self.client.force_login(self.admin_user)
+        edit_url = reverse('wagtailusers_groups:edit', args=[editors.pk])
+        response = self.client.get(edit_url)
+        data = {'name': editors.name}
+        for panel in response.context['permission_panels']:
+            if hasattr(panel, 'management_form'):
+                for name, value in panel.management_form.initial.items():
+                    data['%s-%s' % (panel.prefix, name)] = value
+        data.update({
+            'page_permissions-TOTAL_FORMS': 1,
+            'page_permissions-0-page': self.homepage.pk,
+            'page_permissions-0-permissions': ['change_page'],
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(edit_url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(GroupPagePermission.objects.filter(group=editors, page=self.homepage).exists())
+
+        self.editor = User.objects.get(pk=self.editor.pk)
+        self.assertTrue(self.is_shown(self.editor))
+
+
+class TestSearchAnnotations(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        homepage = Page.objects.get(url_path='/home/')
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(page_revision=homepage.save_revision(), submitter=self.admin_user)
+            self.reviewer = review.reviewers.create(user=User.objects.get(username='spongebob'))
+        self.reviewer.annotations.create(quote="Welcome to our site", text="The heading needs rewording")
+        self.reviewer.annotations.create(quote="Lorem ipsum", text="Replace this placeholder text")
+
+    def search(self, q, **params):
+        response = self.client.get('/admin/wagtail_review/reviews/comments/', dict(params, q=q))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_search(self):
+        self.assertTrue(self.client.login(username='admin', password='password'))
+        response = self.search("heading")
+        self.assertContains(response, "The heading needs rewording")
+        self.assertNotContains(response, "Replace this placeholder text")
+
+        # quotes are searched too, and all terms must match
+        response = self.search("lorem placeholder")
+        self.assertContains(response, "Replace this placeholder text")
+        self.assertNotContains(response, "The heading needs rewording")
+
+        response = self.search("lorem heading")
+        self.assertContains(response, "Sorry, no comments match")
+
+    def test_no_query(self):
+        self.assertTrue(self.client.login(username='admin', password='password'))
+        response = self.search("")
+        self.assertNotContains(response, "The heading needs rewording")
+        self.assertNotContains(response, "Sorry, no comments match")
+
+    def test_pagination(self):
+        self.assertTrue(self.client.login(username='admin', password='password'))
+        for i in range(25):
+            self.reviewer.annotations.create(quote="Lorem ipsum", text="Placeholder %d" % i)
+
+        response = self.search("placeholder")
+        self.assertEqual(len(response.context['annotations']), 20)
+        response = self.search("placeholder", p=2)
+        self.assertEqual(len(response.context['annotations']), 6)
+
+    def test_only_editable_pages_are_searched(self):
+        editors = Group.objects.create(name="Review editors")
+        editors.permissions.add(Permission.objects.get(codename='access_admin'))
+        user = User.objects.create_user(username='editor', password='password')
+        user.groups.add(editors)
+        self.assertTrue(self.client.login(username='editor', password='password'))
+
+        response = self.search("heading")
+        self.assertNotContains(response, "The heading needs rewording")
+
+        GroupPagePermission.objects.create(
+            group=editors, page=Page.objects.get(url_path='/home/'),
+            permission=Permission.objects.get(codename='change_page')
+        )
+        response = self.search("heading")
+        self.assertContains(response, "The heading needs rewording")
@@ -0,0 +1,880 @@
+import asyncio
+import datetime
+import json
+import re
+import sqlite3
+import threading
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from wagtail.models import Page, Site
+
+from wagtail_review.annotation_search import (
+    SEARCH_FIELDS, ContainsAnnotationSearchBackend, PostgresAnnotationSearchBackend, SQLiteAnnotationSearchBackend,
+    get_annotation_search_backend, get_default_annotation_search_backend_class, sqlite_has_fts_table
+)
+from wagtail_review.credentials import _is_revoked, get_api_token, is_signed_token
+from wagtail_review.events import InProcessEventBackend, get_event_backend
+from wagtail_review.models import Annotation, DeletedAnnotation, Review, Reviewer
+from tests.models import SimplePage
+
+
+def sqlite_supports_fts5():
+    db = sqlite3.connect(':memory:')
+    try:
+        db.execute('CREATE VIRTUAL TABLE fts5_test USING fts5(content)')
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        db.close()
+    return True
+
+
+class AnnotationsAPITestMixin:
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+        self.reviewer = Reviewer.objects.create(review=self.review, user=User.objects.get(username='spongebob'))
+
+    def get_credentials(self, mode='respond'):
+        return {
+            'HTTP_X_WAGTAILREVIEW_MODE': mode,
+            'HTTP_X_WAGTAILREVIEW_REVIEWER': str(self.reviewer.id),
+            'HTTP_X_WAGTAILREVIEW_TOKEN': self.reviewer.view_token if mode == 'view' else self.reviewer.response_token,
+        }
+
+    def create_annotation(self, text="A comment", reviewer=None, ranges=1):
+        annotation = Annotation.objects.create(reviewer=reviewer or self.reviewer, quote="Home", text=text)
+        for i in range(ranges):
+            annotation.ranges.create(start='/h1[1]', start_offset=i, end='/h1[1]', end_offset=i + 4)
+        return annotation
+
+
+class TestSearch(AnnotationsAPITestMixin, TestCase):
+    def search(self, **params):
+        response = self.client.get('/review/api/search/', params, **self.get_credentials())
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_credentials_required(self):
+        response = self.client.get('/review/api/search/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_search_all(self):
+        annotations = [self.create_annotation("Comment %d" % i) for i in range(3)]
+        data = self.search()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual([row['id'] for row in data['rows']], [annotation.id for annotation in annotations])
+        self.assertEqual(data['rows'][0]['text'], "Comment 0")
+        self.assertEqual(data['rows'][0]['user'], {'id': self.reviewer.id, 'name': "Spongebob Squarepants"})
+        self.assertNotIn('next', data)
+
+    def test_limit_and_offset(self):
+        annotations = [self.create_annotation("Comment %d" % i) for i in range(5)]
+        data = self.search(limit=2, offset=1)
+        self.assertEqual(data['total'], 5)
+        self.assertEqual([row['id'] for row in data['rows']], [annotations[1].id, annotations[2].id])
+
+    def test_keyset_pagination(self):
+        annotations = [self.create_annotation("Comment %d" % i) for i in range(5)]
+
+        ids = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['after'] = cursor
+            data = self.search(**params)
+            self.assertEqual(data['total'], 5)
+            ids += [row['id'] for row in data['rows']]
+            cursor = data['next']
+            if cursor is None:
+                break
+
+        self.assertEqual(ids, [annotation.id for annotation in annotations])
+
+    def test_field_filters(self):
+        self.create_annotation("First")
+        other_reviewer = Reviewer.objects.create(review=self.review, email='bob@example.com')
+        other_annotation = self.create_annotation("Second", reviewer=other_reviewer)
+
+        data = self.search(text="Second")
+        self.assertEqual([row['id'] for row in data['rows']], [other_annotation.id])
+        data = self.search(user=other_reviewer.id)
+        self.assertEqual([row['id'] for row in data['rows']], [other_annotation.id])
+
+    def test_full_text_filters(self):
+        heading = Annotation.objects.create(reviewer=self.reviewer, quote="Welcome home", text="Rewrite the headings")
+        placeholder = Annotation.objects.create(reviewer=self.reviewer, quote="Lorem ipsum", text="Remove placeholder")
+
+        def search_ids(**params):
+            return {row['id'] for row in self.search(**params)['rows']}
+
+        self.assertEqual(search_ids(text="headings"), {heading.id})
+        self.assertEqual(search_ids(text="placeholder remove"), {placeholder.id})
+        self.assertEqual(search_ids(text="lorem"), set())
+        self.assertEqual(search_ids(quote="lorem"), {placeholder.id})
+        self.assertEqual(search_ids(any="lorem"), {placeholder.id})
+        self.assertEqual(search_ids(any="placeholder ipsum"), {placeholder.id})
+        self.assertEqual(search_ids(any="welcome placeholder"), set())
+        self.assertEqual(search_ids(any=""), {heading.id, placeholder.id})
+        # search syntax is not interpreted
+        self.assertEqual(search_ids(any='"lorem" OR text:* NEAR('), set())
+
+    def test_invalid_parameters(self):
+        for params in [{'limit': 'ten'}, {'offset': -1}, {'after': 'not-a-cursor'}]:
+            response = self.client.get('/review/api/search/', params, **self.get_credentials())
+            self.assertEqual(response.status_code, 400)
+
+    def test_annotations_from_other_reviews_excluded(self):
+        other_review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+        self.create_annotation(reviewer=Reviewer.objects.create(review=other_review, email='bob@example.com'))
+        self.assertEqual(self.search()['total'], 0)
+
+
+class TestAnnotationSearchBackends(AnnotationsAPITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.heading = Annotation.objects.create(reviewer=self.reviewer, quote="Welcome home", text="Rewrite the Headings")
+        self.placeholder = Annotation.objects.create(reviewer=self.reviewer, quote="Lorem ipsum", text="Remove placeholder")
+
+    def assertSearchResults(self, backend, query, expected, fields=SEARCH_FIELDS):
+        self.assertEqual(set(backend.search(Annotation.objects.all(), query, fields)), set(expected))
+
+    def test_contains_backend(self):
+        backend = ContainsAnnotationSearchBackend()
+        self.assertSearchResults(backend, "heading", [self.heading])
+        self.assertSearchResults(backend, "IPSUM remove", [self.placeholder])
+        self.assertSearchResults(backend, "ipsum", [], fields=['text'])
+
+    def test_sqlite_backend(self):
+        if connection.vendor != 'sqlite' or not sqlite_has_fts_table():
+            self.skipTest("SQLite with FTS5 is required")
+
+        backend = SQLiteAnnotationSearchBackend()
+        # whole words are matched after stemming
+        self.assertSearchResults(backend, "heading", [self.heading])
+        self.assertSearchResults(backend, "eading", [])
+        self.assertSearchResults(backend, "IPSUM remove", [self.placeholder])
+        self.assertSearchResults(backend, "ipsum", [], fields=['text'])
+
+        # the index is kept up to date by triggers
+        self.heading.text = "Fine as it is"
+        self.heading.save()
+        self.assertSearchResults(backend, "heading", [])
+        self.assertSearchResults(backend, "fine", [self.heading])
+        self.placeholder.delete()
+        self.assertSearchResults(backend, "ipsum", [])
+
+    def test_sqlite_search_index_installed(self):
+        # The triggers maintaining the FTS5 table are dropped whenever a migration rebuilds the annotation
+        # table, so this fails if such a migration does not recreate them
+        if connection.vendor != 'sqlite' or not sqlite_supports_fts5():
+            self.skipTest("SQLite with FTS5 is required")
+
+        self.assertTrue(sqlite_has_fts_table())
+        self.assertIs(get_default_annotation_search_backend_class(), SQLiteAnnotationSearchBackend)
+
+    def test_sqlite_search_index_missing_trigger(self):
+        if connection.vendor != 'sqlite' or not sqlite_has_fts_table():
+            self.skipTest("SQLite with FTS5 is required")
+
+        sqlite_has_fts_table.cache_clear()
+        self.addCleanup(sqlite_has_fts_table.cache_clear)
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER wagtail_review_annotation_fts_update")
+        self.assertIs(get_default_annotation_search_backend_class(), ContainsAnnotationSearchBackend)
+
+    def test_postgres_backend(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("PostgreSQL is required")
+
+        backend = PostgresAnnotationSearchBackend()
+        self.assertSearchResults(backend, "heading", [self.heading])
+        self.assertSearchResults(backend, "IPSUM remove", [self.placeholder])
+        self.assertSearchResults(backend, "ipsum", [], fields=['text'])
+
+    @override_settings(WAGTAILREVIEW_ANNOTATION_SEARCH_BACKEND='wagtail_review.annotation_search.ContainsAnnotationSearchBackend')
+    def test_backend_setting(self):
+        get_annotation_search_backend.cache_clear()
+        self.addCleanup(get_annotation_search_backend.cache_clear)
+        self.assertIsInstance(get_annotation_search_backend(), ContainsAnnotationSearchBackend)
+
+        with override_settings(WAGTAILREVIEW_ANNOTATION_SEARCH_BACKEND='wagtail_review.annotation_search.NoSuchBackend'):
+            get_annotation_search_backend.cache_clear()
+            with self.assertRaises(ImproperlyConfigured):
+                get_annotation_search_backend()
+
+
+class TestCreate(AnnotationsAPITestMixin, TestCase):
+    def get_annotation_data(self, text, range_count=2):
+        return {
+            'quote': "Home",
+            'text': text,
+            'ranges': [
+                {'start': '/h1[1]', 'startOffset': i, 'end': '/h1[1]', 'endOffset': i + 4}
+                for i in range(range_count)
+            ],
+        }
+
+    def test_create(self):
+        response = self.client.post(
+            '/review/api/annotations/', json.dumps(self.get_annotation_data("New")),
+            content_type='application/json', **self.get_credentials()
+        )
+        annotation = Annotation.objects.get()
+        self.assertRedirects(
+            response, '/review/api/annotations/%d/' % annotation.id, fetch_redirect_response=False
+        )
+        self.assertEqual(annotation.reviewer, self.reviewer)
+        self.assertEqual(annotation.ranges.count(), 2)
+
+    def post_batch(self, data, mode='respond'):
+        return self.client.post(
+            '/review/api/annotations/batch/', json.dumps(data),
+            content_type='application/json', **self.get_credentials(mode)
+        )
+
+    def test_batch_create(self):
+        data = [self.get_annotation_data("Comment %d" % i, range_count=i + 1) for i in range(10)]
+
+        # reviewer credentials, review, savepoint, annotations insert, ranges insert, savepoint release
+        with self.assertNumQueries(6):
+            response = self.post_batch(data)
+        self.assertEqual(response.status_code, 201)
+        ids = json.loads(response.content)['ids']
+
+        annotations = Annotation.objects.in_bulk(ids)
+        for i, annotation_id in enumerate(ids):
+            annotation = annotations[annotation_id]
+            self.assertEqual(annotation.reviewer, self.reviewer)
+            self.assertEqual(annotation.text, "Comment %d" % i)
+            self.assertEqual(
+                [r.as_json_data() for r in annotation.ranges.order_by('id')], data[i]['ranges']
+            )
+
+    def test_batch_create_invalid(self):
+        data = [self.get_annotation_data("Valid"), {'text': "No ranges"}]
+        self.assertEqual(self.post_batch(data).status_code, 400)
+        self.assertEqual(self.post_batch({'text': "Not a list"}).status_code, 400)
+        for invalid_data in [
+            {'quote': None}, {'text': None}, {'text': 42}, {'quote': ["Home"]},
+            {'ranges': None}, {'ranges': ["/h1[1]"]},
+        ]:
+            data = [dict(self.get_annotation_data("Invalid"), **invalid_data)]
+            self.assertEqual(self.post_batch(data).status_code, 400)
+        self.assertEqual(self.post_batch(["Not an object"]).status_code, 400)
+        self.assertFalse(Annotation.objects.exists())
+
+    def test_batch_create_permissions(self):
+        self.assertEqual(self.post_batch([self.get_annotation_data("New")], mode='view').status_code, 403)
+
+        self.review.status = 'closed'
+        self.review.save()
+        self.assertEqual(self.post_batch([self.get_annotation_data("New")]).status_code, 403)
+        self.assertFalse(Annotation.objects.exists())
+
+
+class TestItem(AnnotationsAPITestMixin, TestCase):
+    def put(self, annotation, data, method='put', mode='respond'):
+        return getattr(self.client, method)(
+            '/review/api/annotations/%d/' % annotation.id, json.dumps(data),
+            content_type='application/json', **self.get_credentials(mode)
+        )
+
+    def test_update(self):
+        annotation = self.create_annotation(ranges=3)
+        ranges = [r.as_json_data() for r in annotation.ranges.order_by('id')]
+        kept_range_ids = list(annotation.ranges.order_by('id').values_list('id', flat=True)[:2])
+        new_range = {'start': '/p[1]', 'startOffset': 0, 'end': '/p[1]', 'endOffset': 10}
+
+        # reviewer credentials, review, annotation, ranges, savepoint, range delete, range insert,
+        # annotation update, savepoint release, ranges for the response
+        with self.assertNumQueries(10):
+            response = self.put(annotation, {
+                'text': "Updated", 'quote': "Home", 'ranges': ranges[:2] + [new_range],
+            })
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['text'], "Updated")
+        self.assertEqual(data['ranges'], ranges[:2] + [new_range])
+
+        annotation.refresh_from_db()
+        self.assertEqual(annotation.text, "Updated")
+        self.assertEqual(
+            [r.as_json_data() for r in annotation.ranges.order_by('id')], ranges[:2] + [new_range]
+        )
+        # unchanged ranges are kept rather than recreated
+        self.assertEqual(list(annotation.ranges.order_by('id').values_list('id', flat=True)[:2]), kept_range_ids)
+
+    def test_partial_update(self):
+        annotation = self.create_annotation(ranges=2)
+        updated_at = annotation.updated_at
+        response = self.put(annotation, {'text': "Patched"}, method='patch')
+        self.assertEqual(response.status_code, 200)
+
+        annotation.refresh_from_db()
+        self.assertEqual(annotation.text, "Patched")
+        self.assertEqual(annotation.quote, "Home")
+        self.assertEqual(annotation.ranges.count(), 2)
+        self.assertGreater(annotation.updated_at, updated_at)
+
+    def test_invalid_update(self):
+        annotation = self.create_annotation()
+        response = self.put(annotation, {'ranges': [{'start': '/p[1]'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(annotation.ranges.count(), 1)
+
+        for data in [
+            ["Not", "an", "object"], "Not an object", None, {'text': ["Not a string"]}, {'quote': 42}, {'ranges': "/p[1]"}
+        ]:
+            for method in ['put', 'patch']:
+                response = self.put(annotation, data, method=method)
+                self.assertEqual(response.status_code, 400)
+
+        annotation.refresh_from_db()
+        self.assertEqual((annotation.quote, annotation.text), ("Home", "A comment"))
+
+    def test_delete(self):
+        annotation = self.create_annotation(ranges=2)
+        response = self.client.delete('/review/api/annotations/%d/' % annotation.id, **self.get_credentials())
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Annotation.objects.filter(id=annotation.id).exists())
+        self.assertTrue(DeletedAnnotation.objects.filter(annotation_id=annotation.id).exists())
+
+    def test_permissions(self):
+        annotation = self.create_annotation()
+        other_annotation = self.create_annotation(
+            reviewer=Reviewer.objects.create(review=self.review, email='bob@example.com')
+        )
+
+        # view-only credentials
+        self.assertEqual(self.put(annotation, {'text': "Updated"}, mode='view').status_code, 403)
+        # another reviewer's annotation
+        self.assertEqual(self.put(other_annotation, {'text': "Updated"}).status_code, 403)
+        response = self.client.delete('/review/api/annotations/%d/' % other_annotation.id, **self.get_credentials())
+        self.assertEqual(response.status_code, 403)
+
+        # closed review
+        self.review.status = 'closed'
+        self.review.save()
+        self.assertEqual(self.put(annotation, {'text': "Updated"}).status_code, 403)
+
+        annotation.refresh_from_db()
+        self.assertEqual(annotation.text, "A comment")
+
+
+class TestIncrementalSync(AnnotationsAPITestMixin, TestCase):
+    def sync(self, since):
+        response = self.client.get('/review/api/search/', {'since': since}, **self.get_credentials())
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    @override_settings(WAGTAILREVIEW_SYNC_SAFETY_WINDOW=0)
+    def test_sync(self):
+        first = self.create_annotation("First")
+        second = self.create_annotation("Second")
+
+        data = self.sync('')
+        self.assertEqual([row['id'] for row in data['rows']], [first.id, second.id])
+        self.assertEqual(data['deleted'], [])
+        self.assertEqual(data['cursor'], "%s,%d" % (data['rows'][-1]['updated'], second.id))
+        cursor = data['cursor']
+
+        # nothing has changed
+        data = self.sync(cursor)
+        self.assertEqual(data['rows'], [])
+        self.assertEqual(data['deleted'], [])
+        self.assertEqual(data['cursor'], cursor)
+
+        # updates, additions and deletions
+        first.text = "First updated"
+        first.save()
+        third = self.create_annotation("Third")
+        second_id, third_id = second.id, third.id
+        second.delete()
+
+        data = self.sync(cursor)
+        self.assertEqual([row['text'] for row in data['rows']], ["First updated", "Third"])
+        self.assertEqual(data['deleted'], [second_id])
+        cursor = data['cursor']
+
+        self.assertEqual(self.sync(cursor)['rows'], [])
+        third.delete()
+        self.assertEqual(self.sync(cursor)['deleted'], [third_id])
+
+    def test_cursor_held_back_by_safety_window(self):
+        first = self.create_annotation("First")
+        data = self.sync('')
+        self.assertEqual(data['cursor'].split(',')[1], '0')
+        self.assertLess(data['cursor'], data['rows'][-1]['updated'])
+        self.assertFalse(data['reset'])
+
+        # a change made before the last sync, but committed after it
+        late = self.create_annotation("Late")
+        Annotation.objects.filter(pk=late.pk).update(updated_at=first.updated_at - datetime.timedelta(seconds=30))
+
+        # changes within the safety window are returned again
+        data = self.sync(data['cursor'])
+        self.assertEqual([row['text'] for row in data['rows']], ["Late", "First"])
+
+    def test_full_page_cursor_not_held_back(self):
+        first = self.create_annotation("First")
+        self.create_annotation("Second")
+        response = self.client.get('/review/api/search/', {'since': '', 'limit': 1}, **self.get_credentials())
+        data = json.loads(response.content)
+        self.assertEqual(data['cursor'], "%s,%d" % (data['rows'][-1]['updated'], first.id))
+
+    def test_reset_for_cursor_older_than_retention(self):
+        first = self.create_annotation("First")
+        data = self.sync('2020-01-01T00:00:00+00:00,0')
+        self.assertTrue(data['reset'])
+        self.assertEqual([row['id'] for row in data['rows']], [first.id])
+
+        data = self.sync(data['cursor'])
+        self.assertFalse(data['reset'])
+
+    def test_prune_deleted_annotations(self):
+        old, new = self.create_annotation(), self.create_annotation()
+        old_id, new_id = old.id, new.id
+        old.delete()
+        new.delete()
+        DeletedAnnotation.objects.filter(annotation_id=old_id).update(
+            deleted_at=timezone.now() - datetime.timedelta(days=31)
+        )
+
+        call_command('wagtail_review_prune_deleted_annotations', verbosity=0)
+        self.assertEqual(list(DeletedAnnotation.objects.values_list('annotation_id', flat=True)), [new_id])
+
+    def test_deleting_review_leaves_no_tombstones(self):
+        self.create_annotation()
+        self.review.delete()
+        self.assertFalse(DeletedAnnotation.objects.exists())
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/review/api/search/', {'since': '2020-01-01T00:00:00,1'}, **self.get_credentials())
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(WAGTAILREVIEW_SIGNED_CREDENTIALS=True)
+class TestSignedCredentials(AnnotationsAPITestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        _is_revoked.cache_clear()
+
+    def get_credentials(self, mode='respond', token=None):
+        return {
+            'HTTP_X_WAGTAILREVIEW_MODE': mode,
+            'HTTP_X_WAGTAILREVIEW_REVIEWER': str(self.reviewer.id),
+            'HTTP_X_WAGTAILREVIEW_TOKEN': token or get_api_token(self.reviewer, mode),
+        }
+
+    def test_signed_token(self):
+        self.create_annotation()
+        token = get_api_token(self.reviewer, 'respond')
+        self.assertNotEqual(token, self.reviewer.response_token)
+
+        # first request checks the token has not been revoked
+        response = self.client.get('/review/api/search/', **self.get_credentials(token=token))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['total'], 1)
+
+        # ETag aggregate, review, annotations, ranges - no reviewer lookup
+        with self.assertNumQueries(4):
+            response = self.client.get('/review/api/search/', **self.get_credentials(token=token))
+        self.assertEqual(response.status_code, 200)
+
+    def test_unsigned_token_still_accepted(self):
+        response = self.client.get('/review/api/search/', **self.get_credentials(token=self.reviewer.response_token))
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_tokens(self):
+        other_reviewer = Reviewer.objects.create(review=self.review, email='bob@example.com')
+        for credentials in [
+            # tampered
+            self.get_credentials(token=get_api_token(self.reviewer, 'respond') + 'x'),
+            # wrong mode
+            self.get_credentials(mode='respond', token=get_api_token(self.reviewer, 'view')),
+            # another reviewer's token
+            self.get_credentials(token=get_api_token(other_reviewer, 'respond')),
+        ]:
+            response = self.client.get('/review/api/search/', **credentials)
+            self.assertEqual(response.status_code, 403)
+
+    def test_expired_token(self):
+        credentials = self.get_credentials()
+        with override_settings(WAGTAILREVIEW_SIGNED_CREDENTIALS_MAX_AGE=-1):
+            response = self.client.get('/review/api/search/', **credentials)
+        self.assertEqual(response.status_code, 403)
+
+    def test_revoked_token(self):
+        credentials = self.get_credentials()
+        self.reviewer.response_token = 'newtoken'
+        self.reviewer.save()
+        response = self.client.get('/review/api/search/', **credentials)
+        self.assertEqual(response.status_code, 403)
+
+    def test_frontend_view_outputs_signed_token(self):
+        page = self.homepage.add_child(instance=SimplePage(title="Simple page", slug="simple-page"))
+        review = Review.objects.create(page_revision=page.save_revision(), submitter=self.admin_user)
+        self.reviewer = Reviewer.objects.create(review=review, email='bob@example.com')
+        Site.objects.update(hostname="testserver")
+
+        response = self.client.get('/review/view/%d/%s/' % (self.reviewer.id, self.reviewer.view_token))
+        self.assertEqual(response.status_code, 200)
+        token = re.search(r"'X-WagtailReview-token': '([^']+)'", response.content.decode()).group(1)
+        self.assertTrue(is_signed_token(token))
+
+        response = self.client.get('/review/api/search/', **self.get_credentials(mode='view', token=token))
+        self.assertEqual(response.status_code, 200)
+
+
+class TestQueryCount(AnnotationsAPITestMixin, TestCase):
+    def create_annotations(self, count):
+        reviewers = [
+            self.reviewer,
+            Reviewer.objects.create(review=self.review, user=User.objects.get(username='homer')),
+            Reviewer.objects.create(review=self.review, email='bob@example.com'),
+        ]
+        for i in range(count):
+            self.create_annotation("Comment %d" % i, reviewer=reviewers[i % len(reviewers)], ranges=2)
+
+    def test_index_and_search_query_count(self):
+        self.create_annotations(12)
+
+        # reviewer credentials, ETag aggregate, review, annotations with reviewers and users, ranges
+        with self.assertNumQueries(5):
+            response = self.client.get('/review/api/annotations/', **self.get_credentials())
+        self.assertEqual(len(json.loads(response.content)), 12)
+
+        with self.assertNumQueries(5):
+            response = self.client.get('/review/api/search/', **self.get_credentials())
+        rows = json.loads(response.content)['rows']
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(
+            {row['user']['name'] for row in rows},
+            {"Spongebob Squarepants", "Homer Simpson", "bob@example.com"}
+        )
+
+    def test_item_query_count(self):
+        annotation = self.create_annotation(ranges=2)
+
+        # reviewer credentials, ETag aggregate, annotation with reviewer and user, ranges
+        with self.assertNumQueries(4):
+            response = self.client.get('/review/api/annotations/%d/' % annotation.id, **self.get_credentials())
+        self.assertEqual(json.loads(response.content)['user']['name'], "Spongebob Squarepants")
+
+
+class TestConditionalGet(AnnotationsAPITestMixin, TestCase):
+    def test_etag(self):
+        annotation = self.create_annotation()
+
+        for url in ['/review/api/annotations/', '/review/api/search/', '/review/api/annotations/%d/' % annotation.id]:
+            with self.subTest(url=url):
+                response = self.client.get(url, **self.get_credentials())
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertNotIn('no-store', response['Cache-Control'])
+                etag = response['ETag']
+                self.assertRegex(etag, r'^"\w+"$')
+
+                # reviewer credentials, ETag aggregate
+                with self.assertNumQueries(2):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.get_credentials())
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_etag_changes(self):
+        annotation = self.create_annotation()
+        etag = self.client.get('/review/api/search/', **self.get_credentials())['ETag']
+
+        def assertModified():
+            response = self.client.get('/review/api/search/', HTTP_IF_NONE_MATCH=etag, **self.get_credentials())
+            self.assertEqual(response.status_code, 200)
+            return response['ETag']
+
+        # query parameters
+        self.assertNotEqual(
+            self.client.get('/review/api/search/', {'limit': 1}, **self.get_credentials())['ETag'], etag
+        )
+
+        # updated annotation
+        annotation.text = "Updated"
+        annotation.save()
+        etag = assertModified()
+
+        # new annotation
+        other_annotation = self.create_annotation()
+        etag = assertModified()
+
+        # deleted annotation
+        other_annotation.delete()
+        assertModified()
+
+
+class TestStreamingResponses(AnnotationsAPITestMixin, TestCase):
+    def get_content(self, url, params=None, streaming=False):
+        with override_settings(WAGTAILREVIEW_STREAM_ANNOTATIONS=streaming):
+            response = self.client.get(url, params or {}, **self.get_credentials())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.streaming, streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response.getvalue()
+
+    def assertStreamedContentEqual(self, url, params=None):
+        self.assertEqual(
+            self.get_content(url, params, streaming=True),
+            self.get_content(url, params, streaming=False),
+        )
+
+    def test_empty(self):
+        self.assertStreamedContentEqual('/review/api/annotations/')
+        self.assertStreamedContentEqual('/review/api/search/')
+        self.assertStreamedContentEqual('/review/api/search/', {'limit': 2})
+
+    def test_index(self):
+        for i in range(3):
+            self.create_annotation("Comment \"%d\" \u2603" % i, ranges=2)
+        self.assertStreamedContentEqual('/review/api/annotations/')
+
+    def test_search(self):
+        for i in range(5):
+            self.create_annotation("Comment %d" % i)
+        self.assertStreamedContentEqual('/review/api/search/')
+        self.assertStreamedContentEqual('/review/api/search/', {'limit': 2})
+        self.assertStreamedContentEqual('/review/api/search/', {'limit': 2, 'offset': 4})
+        self.assertStreamedContentEqual('/review/api/search/', {'limit': 10})
+
+
+@override_settings(WAGTAILREVIEW_EVENTS_MAX_AGE=0)
+class TestEvents(AnnotationsAPITestMixin, TestCase):
+    def get_events(self, since='', **headers):
+        params = {'mode': 'respond', 'reviewer': self.reviewer.id, 'token': self.reviewer.response_token}
+        if since is not None:
+            params['since'] = since
+        response = self.client.get('/review/api/events/', params, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        return [
+            (re.search(r'^id: (.*)$', event, re.M).group(1), json.loads(re.search(r'^data: (.*)$', event, re.M).group(1)))
+            for event in content.split('\n\n') if event.startswith('id: ')
+        ]
+
+    def test_credentials_required(self):
+        response = self.client.get('/review/api/events/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/review/api/events/', {'since': 'nonsense'}, **self.get_credentials())
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(WAGTAILREVIEW_SYNC_SAFETY_WINDOW=0)
+    def test_changes_since_cursor(self):
+        first = self.create_annotation("First")
+        [(cursor, data)] = self.get_events()
+        self.assertEqual([row['id'] for row in data['rows']], [first.id])
+        self.assertEqual(data['cursor'], cursor)
+
+        # nothing has changed
+        self.assertEqual(self.get_events(cursor), [])
+
+        second = self.create_annotation("Second")
+        first_id = first.id
+        first.delete()
+        [(new_cursor, data)] = self.get_events(cursor)
+        self.assertEqual([row['text'] for row in data['rows']], ["Second"])
+        self.assertEqual(data['deleted'], [first_id])
+
+        # a reconnecting EventSource sends the last event ID, which takes precedence over 'since'
+        self.assertEqual(self.get_events(cursor, HTTP_LAST_EVENT_ID=new_cursor), [])
+
+    @override_settings(
+        WAGTAILREVIEW_EVENTS_MAX_AGE=0.3, WAGTAILREVIEW_EVENTS_POLL_INTERVAL=0.05,
+        WAGTAILREVIEW_EVENTS_BACKEND='wagtail_review.events.DatabasePollingEventBackend'
+    )
+    def test_changes_within_safety_window_sent_once(self):
+        annotation = self.create_annotation("First")
+        events = self.get_events()
+        self.assertEqual([[row['id'] for row in data['rows']] for cursor, data in events], [[annotation.id]])
+
+    @override_settings(WAGTAILREVIEW_EVENTS_MAX_AGE=0.3)
+    def test_keepalive(self):
+        with mock.patch('wagtail_review.views.annotations_api.EVENTS_KEEPALIVE_INTERVAL', 0.1):
+            response = self.client.get('/review/api/events/', **self.get_credentials())
+            content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn(': keepalive\n\n', content)
+
+    def test_annotation_changes_are_published(self):
+        backend = get_event_backend()
+        subscription = backend.subscribe(self.review.pk)
+        self.addCleanup(subscription.close)
+        other_review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.admin_user)
+        other_reviewer = other_review.reviewers.create(email='bob@example.com')
+
+        # changes are only published when the transaction is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_annotation(reviewer=other_reviewer)
+        self.assertFalse(subscription.wait(0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            annotation = self.create_annotation()
+        self.assertTrue(subscription.wait(0))
+        self.assertFalse(subscription.wait(0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            annotation.delete()
+        self.assertTrue(subscription.wait(0))
+
+    def test_batch_create_is_published(self):
+        subscription = get_event_backend().subscribe(self.review.pk)
+        self.addCleanup(subscription.close)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/review/api/annotations/batch/',
+                json.dumps([{'quote': "Home", 'text': "Batch", 'ranges': []}]),
+                content_type='application/json', **self.get_credentials()
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(subscription.wait(0))
+
+    def test_in_process_backend_unsubscribe(self):
+        backend = InProcessEventBackend()
+        subscription = backend.subscribe(self.review.pk)
+        subscription.close()
+        self.assertEqual(dict(backend.subscribers), {})
+        backend.publish(self.review.pk)
+        self.assertFalse(subscription.wait(0))
+
+    @override_settings(
+        WAGTAILREVIEW_EVENTS_BACKEND='wagtail_review.events.DatabasePollingEventBackend',
+        WAGTAILREVIEW_EVENTS_POLL_INTERVAL=0
+    )
+    def test_database_polling_backend(self):
+        get_event_backend.cache_clear()
+        self.addCleanup(get_event_backend.cache_clear)
+
+        subscription = get_event_backend().subscribe(self.review.pk)
+        self.assertTrue(subscription.wait(1))
+        subscription.close()
+
+        annotation = self.create_annotation()
+        [(cursor, data)] = self.get_events()
+        self.assertEqual([row['id'] for row in data['rows']], [annotation.id])
+
+
+# The asynchronous views in wagtail_review.async_urls must behave identically to the synchronous ones
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncSearch(TestSearch):
+    pass
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncCreate(TestCreate):
+    pass
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncItem(TestItem):
+    pass
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncIncrementalSync(TestIncrementalSync):
+    pass
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncSignedCredentials(TestSignedCredentials):
+    pass
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncConditionalGet(TestConditionalGet):
+    pass
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncStreamingResponses(AnnotationsAPITestMixin, TestCase):
+    async def get_content(self, url, params=None, streaming=False):
+        params = dict(params or {}, mode='respond', reviewer=self.reviewer.id, token=self.reviewer.response_token)
+        with override_settings(WAGTAILREVIEW_STREAM_ANNOTATIONS=streaming):
+            response = await self.async_client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.streaming, streaming)
+            if streaming:
+                return b''.join([chunk async for chunk in response.streaming_content])
+            return response.content
+
+    async def assertStreamedContentEqual(self, url, params=None):
+        self.assertEqual(
+            await self.get_content(url, params, streaming=True),
+            await self.get_content(url, params, streaming=False),
+        )
+
+    async def test_index(self):
+        await self.assertStreamedContentEqual('/review/api/annotations/')
+        for i in range(3):
+            await sync_to_async(self.create_annotation)("Comment \"%d\" ☃" % i, ranges=2)
+        await self.assertStreamedContentEqual('/review/api/annotations/')
+
+    @mock.patch('wagtail_review.views.async_annotations_api.STREAMING_CHUNK_SIZE', 2)
+    async def test_search(self):
+        for i in range(5):
+            await sync_to_async(self.create_annotation)("Comment %d" % i)
+        await self.assertStreamedContentEqual('/review/api/search/')
+        await self.assertStreamedContentEqual('/review/api/search/', {'limit': 2})
+        await self.assertStreamedContentEqual('/review/api/search/', {'limit': 2, 'offset': 4})
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls', WAGTAILREVIEW_EVENTS_MAX_AGE=0)
+class TestAsyncEvents(AnnotationsAPITestMixin, TestCase):
+    async def get_events(self, since=''):
+        response = await self.async_client.get('/review/api/events/', {
+            'mode': 'respond', 'reviewer': self.reviewer.id, 'token': self.reviewer.response_token, 'since': since
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('no-cache', response['Cache-Control'])
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        return [
+            json.loads(re.search(r'^data: (.*)$', event, re.M).group(1))
+            for event in content.split('\n\n') if event.startswith('id: ')
+        ]
+
+    @override_settings(WAGTAILREVIEW_SYNC_SAFETY_WINDOW=0)
+    async def test_changes_since_cursor(self):
+        annotation = await sync_to_async(self.create_annotation)("First")
+        [data] = await self.get_events()
+        self.assertEqual([row['id'] for row in data['rows']], [annotation.id])
+        self.assertEqual(await self.get_events(data['cursor']), [])
+
+    async def test_invalid_cursor(self):
+        response = await self.async_client.get('/review/api/events/', {
+            'mode': 'respond', 'reviewer': self.reviewer.id, 'token': self.reviewer.response_token, 'since': 'nonsense'
+        })
+        self.assertEqual(response.status_code, 400)
+
+    async def test_in_process_subscription_await_change(self):
+        backend = InProcessEventBackend()
+        subscription = backend.subscribe(self.review.pk)
+        self.addCleanup(subscription.close)
+        self.assertFalse(await subscription.await_change(0))
+
+        # changes are usually published from another thread, once a transaction is committed
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, threading.Thread(target=backend.publish, args=(self.review.pk, )).start)
+        self.assertTrue(await subscription.await_change(5))
+        self.assertFalse(await subscription.await_change(0))
@@ -1,16 +1,28 @@
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
 
 from wagtail.models import Page, Site
 
+from wagtail_review import preview
 from wagtail_review.models import Review, Reviewer
 from tests.models import SimplePage
 
 
 class TestFrontendViews(TestCase):
     fixtures = ['test.json']
+    # whether the annotation UI listens to the event stream without WAGTAILREVIEW_EVENTS_STREAM set
+    events_stream_by_default = False
 
     def setUp(self):
+        cache.clear()
         self.admin_user = User.objects.create_superuser(
             username='admin', email='admin@example.com', password='password'
         )
@@ -72,8 +84,186 @@ class TestFrontendViews(TestCase):
         self.assertEqual(review_response.result, 'approve')
         self.assertEqual(review_response.comment, 'comment')
 
+    def test_live_updates(self):
+        url = '/review/respond/%d/%s/' % (self.reviewer.id, self.reviewer.response_token)
+        events_url = 'eventsUrl: "/review/api/events/"'
+
+        response = self.client.get(url)
+        self.assertContains(response, "app.include(annotatorExt.liveUpdates,")
+        if self.events_stream_by_default:
+            self.assertContains(response, events_url)
+        else:
+            # poll for changes instead
+            self.assertNotContains(response, events_url)
+
+        with override_settings(WAGTAILREVIEW_EVENTS_STREAM=True):
+            self.assertContains(self.client.get(url), events_url)
+        with override_settings(WAGTAILREVIEW_EVENTS_STREAM=False):
+            self.assertNotContains(self.client.get(url), events_url)
+
     def test_live_page_has_no_annotator_js(self):
         response = self.client.get('/simple-page/')
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "<h1>Simple page original</h1>")
         self.assertNotContains(response, "var app = new annotator.App();")
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncFrontendViews(TestFrontendViews):
+    events_stream_by_default = True
+
+
+@override_settings(WAGTAILREVIEW_PREVIEW_CACHE_TIMEOUT=3600)
+class TestPreviewCache(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.page = SimplePage(title="Simple page submitted", slug="simple-page")
+        self.homepage.add_child(instance=self.page)
+        self.review = Review.objects.create(page_revision=self.page.save_revision(), submitter=self.admin_user)
+        self.reviewer = Reviewer.objects.create(review=self.review, user=User.objects.get(username='spongebob'))
+        self.other_reviewer = Reviewer.objects.create(review=self.review, email='bob@example.com')
+
+        Site.objects.update(hostname="testserver")
+
+    def get_respond_page(self, reviewer):
+        return self.client.get('/review/respond/%d/%s/' % (reviewer.id, reviewer.response_token))
+
+    def test_page_is_rendered_once_per_revision(self):
+        with mock.patch.object(preview, 'render_preview', wraps=preview.render_preview) as render_preview:
+            response = self.get_respond_page(self.reviewer)
+            other_response = self.get_respond_page(self.other_reviewer)
+
+        self.assertEqual(render_preview.call_count, 1)
+        self.assertContains(response, "<h1>Simple page submitted</h1>")
+        self.assertContains(response, "'X-WagtailReview-reviewer': '%d'" % self.reviewer.id)
+        self.assertContains(other_response, "<h1>Simple page submitted</h1>")
+        self.assertContains(other_response, "'X-WagtailReview-reviewer': '%d'" % self.other_reviewer.id)
+        self.assertNotContains(other_response, preview.PREVIEW_PLACEHOLDER)
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_modes_are_cached_separately(self):
+        with mock.patch.object(preview, 'render_preview', wraps=preview.render_preview) as render_preview:
+            self.get_respond_page(self.reviewer)
+            response = self.client.get('/review/view/%d/%s/' % (self.reviewer.id, self.reviewer.view_token))
+
+        self.assertEqual(render_preview.call_count, 2)
+        self.assertContains(response, "app.include(annotatorExt.viewerModeUi);")
+
+    def test_review_status_is_not_cached(self):
+        self.get_respond_page(self.reviewer)
+        self.review.status = 'closed'
+        self.review.save()
+
+        response = self.get_respond_page(self.reviewer)
+        self.assertContains(response, "This review is now closed")
+
+    @override_settings(WAGTAILREVIEW_PREVIEW_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        with mock.patch.object(preview, 'render_preview', wraps=preview.render_preview) as render_preview:
+            response = self.get_respond_page(self.reviewer)
+            self.get_respond_page(self.reviewer)
+
+        self.assertEqual(render_preview.call_count, 0)
+        self.assertContains(response, "<h1>Simple page submitted</h1>")
+        self.assertContains(response, "app.include(annotator.ui.main,")
+
+    def test_cache_disabled_by_default(self):
+        with self.settings():
+            del settings.WAGTAILREVIEW_PREVIEW_CACHE_TIMEOUT
+            self.assertEqual(preview.get_preview_cache_timeout(), 0)
+
+
+@override_settings(
+    WAGTAILREVIEW_SNAPSHOT_STORAGE='review_snapshots',
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        'review_snapshots': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+    }
+)
+class TestPreviewSnapshots(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.page = SimplePage(title="Simple page submitted", slug="simple-page")
+        self.homepage.add_child(instance=self.page)
+        self.revision = self.page.save_revision()
+        self.review = Review.objects.create(page_revision=self.revision, submitter=self.admin_user)
+        self.reviewer = Reviewer.objects.create(review=self.review, user=User.objects.get(username='spongebob'))
+        self.other_reviewer = Reviewer.objects.create(review=self.review, email='bob@example.com')
+
+        Site.objects.update(hostname="testserver")
+
+    def get_respond_page(self, reviewer):
+        response = self.client.get('/review/respond/%d/%s/' % (reviewer.id, reviewer.response_token))
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_respond_view_serves_snapshot(self):
+        with mock.patch.object(preview, 'render_preview', wraps=preview.render_preview) as render_preview:
+            response, content = self.get_respond_page(self.reviewer)
+            other_response, other_content = self.get_respond_page(self.other_reviewer)
+
+        self.assertEqual(render_preview.call_count, 1)
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertIn("<h1>Simple page submitted</h1>", content)
+        self.assertIn("'X-WagtailReview-reviewer': '%d'" % self.reviewer.id, content)
+        self.assertIn("<h1>Simple page submitted</h1>", other_content)
+        self.assertIn("'X-WagtailReview-reviewer': '%d'" % self.other_reviewer.id, other_content)
+        self.assertNotIn(preview.PREVIEW_PLACEHOLDER, other_content)
+
+    def test_delete_snapshots(self):
+        storage = preview.get_snapshot_storage()
+        path = preview.get_snapshot_path(self.revision.id, 'respond')
+
+        self.assertTrue(preview.save_snapshot(self.revision, 'respond'))
+        self.assertTrue(storage.exists(path))
+
+        # the snapshot is kept while another review of the same revision exists
+        other_review = Review.objects.create(page_revision=self.revision, submitter=self.admin_user)
+        self.review.delete()
+        self.assertTrue(storage.exists(path))
+        other_review.delete()
+        self.assertFalse(storage.exists(path))
+
+    def test_snapshots_need_a_named_storage(self):
+        # snapshots are never written to the (usually public) default storage
+        with override_settings(WAGTAILREVIEW_SNAPSHOT_STORAGE=None):
+            self.assertFalse(preview.use_preview_snapshots())
+            response = self.client.get('/review/respond/%d/%s/' % (self.reviewer.id, self.reviewer.response_token))
+        self.assertFalse(response.streaming)
+        self.assertContains(response, "<h1>Simple page submitted</h1>")
+
+    def test_write_snapshot_replaces_existing_file(self):
+        with tempfile.TemporaryDirectory() as location:
+            storage = FileSystemStorage(location=location)
+            path = preview.get_snapshot_path(self.revision.id, 'respond')
+
+            # as if another request saved the snapshot first
+            preview.write_snapshot(storage, path, b'first')
+            preview.write_snapshot(storage, path, b'second')
+
+            with storage.open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'second')
+            # no renamed copies or temporary files are left behind
+            self.assertEqual(os.listdir(os.path.dirname(storage.path(path))), [os.path.basename(path)])
+
+    def test_placeholder_split_across_reads(self):
+        snapshot = io.BytesIO(('<p>before</p>%s<p>after</p>' % preview.PREVIEW_PLACEHOLDER).encode('utf-8'))
+        with mock.patch.object(preview, 'SNAPSHOT_CHUNK_SIZE', 16):
+            content = b''.join(preview._iter_snapshot(snapshot, '<div>review</div>'))
+
+        self.assertEqual(content, b'<p>before</p><div>review</div><p>after</p>')
@@ -1,10 +1,21 @@
+import importlib
+from unittest import mock
+
+from django.apps import apps
 from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from wagtail.models import Page
 
-from wagtail_review.models import Review, Reviewer
+from wagtail_review.models import EmailOutbox, PageReviewSummary, Review, Reviewer
+from tests.models import SimplePage
 
 
 class TestReviewerModel(TestCase):
@@ -53,3 +64,441 @@ class TestReviewerModel(TestCase):
             reviewer.get_view_url(absolute=True),
             'http://test.local/review/view/%d/%s/' % (reviewer.id, reviewer.view_token)
         )
+
+
+class TestGetPagesWithReviewsForUser(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.page = self.homepage.add_child(instance=SimplePage(title="Simple page", slug="simple-page"))
+
+    def test_pages_without_reviews_are_excluded(self):
+        self.assertEqual(list(Review.get_pages_with_reviews_for_user(self.superuser)), [])
+
+    def test_ordered_by_last_review_requested_at(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.superuser)
+            Review.objects.create(page_revision=self.page.save_revision(), submitter=self.superuser)
+
+        pages = list(Review.get_pages_with_reviews_for_user(self.superuser))
+        self.assertEqual([page.pk for page in pages], [self.page.pk, self.homepage.pk])
+
+        # a new review on the homepage moves it to the top
+        with self.captureOnCommitCallbacks(execute=True):
+            latest_review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.superuser)
+        pages = list(Review.get_pages_with_reviews_for_user(self.superuser))
+        self.assertEqual([page.pk for page in pages], [self.homepage.pk, self.page.pk])
+        self.assertEqual(pages[0].last_review_requested_at, latest_review.created_at)
+
+    def test_annotations_follow_reviews_added_and_closed(self):
+        def get_annotations():
+            # a single query, however many reviews the pages have
+            with self.assertNumQueries(1):
+                return {
+                    page.pk: (page.has_open_review, page.last_review_requested_at)
+                    for page in Review.get_pages_with_reviews_for_user(self.superuser)
+                }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            homepage_review = Review.objects.create(
+                page_revision=self.homepage.save_revision(), submitter=self.superuser
+            )
+        self.assertEqual(get_annotations(), {self.homepage.pk: (True, homepage_review.created_at)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            page_reviews = [
+                Review.objects.create(page_revision=self.page.save_revision(), submitter=self.superuser)
+                for i in range(10)
+            ]
+        self.assertEqual(get_annotations(), {
+            self.homepage.pk: (True, homepage_review.created_at),
+            self.page.pk: (True, page_reviews[-1].created_at),
+        })
+
+        # closing one of the page's reviews leaves it with open reviews
+        with self.captureOnCommitCallbacks(execute=True):
+            page_reviews[-1].status = 'closed'
+            page_reviews[-1].save()
+        self.assertEqual(get_annotations()[self.page.pk], (True, page_reviews[-1].created_at))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            homepage_review.status = 'closed'
+            homepage_review.save()
+        self.assertEqual(get_annotations(), {
+            self.homepage.pk: (False, homepage_review.created_at),
+            self.page.pk: (True, page_reviews[-1].created_at),
+        })
+
+
+class TestPageReviewSummary(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.submitter = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.homepage = Page.objects.get(url_path='/home/').specific
+
+    def create_review(self):
+        review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        review.reviewers.create(user=self.submitter)
+        return review
+
+    def test_summary_maintained_by_signals(self):
+        self.assertFalse(PageReviewSummary.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review = self.create_review()
+            reviewer = review.reviewers.create(user=User.objects.get(username='spongebob'))
+            review.reviewers.create(email='bob@example.com')
+
+        summary = PageReviewSummary.objects.get(page=self.homepage)
+        self.assertEqual(summary.last_review_requested_at, review.created_at)
+        self.assertEqual(summary.open_review_count, 1)
+        self.assertEqual(summary.closed_review_count, 0)
+        self.assertEqual(summary.reviewer_count, 2)
+        self.assertEqual(summary.pending_response_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reviewer.responses.create(result='approve', comment="Looks good")
+        summary.refresh_from_db()
+        self.assertEqual(summary.pending_response_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.status = 'closed'
+            review.save()
+        summary.refresh_from_db()
+        self.assertEqual(summary.open_review_count, 0)
+        self.assertEqual(summary.closed_review_count, 1)
+        self.assertEqual(summary.pending_response_count, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertFalse(PageReviewSummary.objects.exists())
+
+    def test_summary_updated_once_per_transaction(self):
+        with mock.patch.object(PageReviewSummary, 'update_for_pages') as update_for_pages:
+            with self.captureOnCommitCallbacks(execute=True):
+                review = self.create_review()
+                for i in range(5):
+                    review.reviewers.create(email='reviewer%d@example.com' % i)
+                self.assertFalse(update_for_pages.called)
+            update_for_pages.assert_called_once_with({self.homepage.pk})
+
+            update_for_pages.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                review.delete()
+            update_for_pages.assert_called_once_with({self.homepage.pk})
+
+    def test_summary_update_after_rollback(self):
+        page = self.homepage.add_child(instance=SimplePage(title="Simple page", slug="simple-page"))
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Review.objects.create(page_revision=page.save_revision(), submitter=self.submitter)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            # changes after the rolled back savepoint are still recorded
+            self.create_review()
+
+        self.assertEqual(
+            list(PageReviewSummary.objects.values_list('page_id', flat=True)), [self.homepage.pk]
+        )
+
+    def test_summary_update_for_page_changed_in_rolled_back_savepoint(self):
+        revision = self.homepage.save_revision()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Review.objects.create(page_revision=revision, submitter=self.submitter)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            # the same page is changed again, after the update scheduled for it was discarded
+            Review.objects.create(page_revision=revision, submitter=self.submitter)
+
+        self.assertEqual(PageReviewSummary.objects.get(page=self.homepage).open_review_count, 1)
+
+    def test_update_for_pages_existing_summary(self):
+        # as if created by a concurrent transaction since the change was made
+        with self.captureOnCommitCallbacks(execute=False):
+            review = self.create_review()
+            review.reviewers.create(email='bob@example.com')
+        PageReviewSummary.objects.create(page=self.homepage, last_review_requested_at=review.created_at)
+
+        PageReviewSummary.update_for_pages([self.homepage.pk])
+        summary = PageReviewSummary.objects.get()
+        self.assertEqual(summary.open_review_count, 1)
+        self.assertEqual(summary.reviewer_count, 1)
+
+    def test_rebuild_command(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            review = self.create_review()
+            review.reviewers.create(email='bob@example.com')
+        expected = PageReviewSummary.objects.values().get()
+
+        PageReviewSummary.objects.all().delete()
+        call_command('wagtail_review_rebuild_summaries', verbosity=0)
+        self.assertEqual(PageReviewSummary.objects.values().get(), expected)
+
+    def test_page_deletion(self):
+        page = self.homepage.add_child(instance=SimplePage(title="Simple page", slug="simple-page"))
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(page_revision=page.save_revision(), submitter=self.submitter)
+            review.reviewers.create(email='bob@example.com')
+        self.assertTrue(PageReviewSummary.objects.filter(page=page).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            page.delete()
+        self.assertFalse(PageReviewSummary.objects.exists())
+
+
+class TestReviewPage(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.submitter = User.objects.first()
+
+    def test_page_is_populated_on_save(self):
+        review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        self.assertEqual(review.page_id, self.homepage.pk)
+        self.assertEqual(Review.objects.get(page=self.homepage), review)
+
+    def test_page_follows_page_revision(self):
+        review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        other_page = self.homepage.add_child(instance=SimplePage(title="Other page", slug="other-page"))
+
+        review = Review.objects.get(pk=review.pk)
+        review.page_revision = other_page.save_revision()
+        review.save()
+        self.assertEqual(Review.objects.get(pk=review.pk).page_id, other_page.pk)
+
+        # also when only the revision ID is set
+        review = Review.objects.get(pk=review.pk)
+        review.page_revision_id = self.homepage.latest_revision_id
+        review.save(update_fields=['page_revision'])
+        self.assertEqual(Review.objects.get(pk=review.pk).page_id, self.homepage.pk)
+
+    def test_revision_not_fetched_when_unchanged(self):
+        review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        review = Review.objects.get(pk=review.pk)
+        review.status = 'closed'
+        # only the UPDATE query, without fetching the revision
+        with self.assertNumQueries(1):
+            review.save(update_fields=['status'])
+
+    def test_populate_review_pages_migration(self):
+        review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        Review.objects.update(page=None)
+
+        migration = importlib.import_module('wagtail_review.migrations.0008_review_page')
+        migration.populate_review_pages(apps, None)
+
+        review.refresh_from_db()
+        self.assertEqual(review.page_id, self.homepage.pk)
+
+
+class TestSendRequestEmails(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.submitter = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.homepage = Page.objects.get(url_path='/home/').specific
+
+    def create_review(self, reviewer_count):
+        review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        review.reviewers.create(user=self.submitter)
+        for i in range(reviewer_count):
+            user, created = User.objects.get_or_create(
+                username='reviewer%d' % i, defaults={'email': 'reviewer%d@example.com' % i}
+            )
+            review.reviewers.create(user=user)
+        return Review.objects.get(pk=review.pk)
+
+    def test_send_request_emails(self):
+        review = self.create_review(3)
+        with mock.patch.object(
+            locmem.EmailBackend, '__init__', autospec=True, side_effect=locmem.EmailBackend.__init__
+        ) as create_connection:
+            review.send_request_emails()
+
+        # all messages are sent over one connection
+        self.assertEqual(create_connection.call_count, 1)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['reviewer0@example.com', 'reviewer1@example.com', 'reviewer2@example.com']
+        )
+        reviewer = review.reviewers.get(user__username='reviewer0')
+        message = next(message for message in mail.outbox if message.to == ['reviewer0@example.com'])
+        self.assertIn(reviewer.get_respond_url(absolute=True), message.body)
+        self.assertEqual(message.extra_headers['Auto-Submitted'], 'auto-generated')
+
+    def test_revision_deserialised_once(self):
+        review = self.create_review(3)
+        with mock.patch.object(
+            type(review.page_revision), 'as_object', autospec=True, side_effect=type(review.page_revision).as_object
+        ) as as_object:
+            review.send_request_emails()
+
+        self.assertEqual(as_object.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_query_count_independent_of_reviewer_count(self):
+        def count_reviewer_queries(review):
+            # ignore page / revision loading, which depends on wagtail's own caches
+            with CaptureQueriesContext(connection) as queries:
+                review.send_request_emails()
+            return len([
+                query for query in queries.captured_queries
+                if 'auth_user' in query['sql'] or 'wagtail_review_reviewer' in query['sql']
+            ])
+
+        self.assertEqual(
+            count_reviewer_queries(self.create_review(1)),
+            count_reviewer_queries(self.create_review(5))
+        )
+        self.assertEqual(len(mail.outbox), 6)
+
+
+@override_settings(WAGTAILREVIEW_EMAIL_OUTBOX=True)
+class TestEmailOutbox(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.submitter = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        self.review.reviewers.create(user=self.submitter)
+        self.review.reviewers.create(user=User.objects.get(username='spongebob'))
+        self.review.reviewers.create(email='bob@example.com')
+
+    def test_emails_are_queued(self):
+        self.review.send_request_emails()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            set(EmailOutbox.objects.values_list('recipient', flat=True)),
+            {'spongebob@example.com', 'bob@example.com'}
+        )
+
+        call_command('wagtail_review_send_emails', verbosity=0)
+        self.assertEqual(set(email.to[0] for email in mail.outbox), {'spongebob@example.com', 'bob@example.com'})
+        self.assertEqual(mail.outbox[0].extra_headers['Auto-Submitted'], 'auto-generated')
+        self.assertFalse(EmailOutbox.objects.filter(sent_at__isnull=True).exists())
+        self.assertFalse(EmailOutbox.objects.filter(next_attempt_at__isnull=False).exists())
+
+        # already-sent messages are not sent again
+        call_command('wagtail_review_send_emails', verbosity=0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_failed_emails_are_retried(self):
+        self.review.send_request_emails()
+
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=ConnectionError("SMTP went away")):
+            self.assertEqual(EmailOutbox.send_queued_emails(), (0, 2))
+
+        outbox_message = EmailOutbox.objects.first()
+        self.assertEqual(outbox_message.attempts, 1)
+        self.assertEqual(outbox_message.last_error, "SMTP went away")
+        self.assertGreater(outbox_message.next_attempt_at, timezone.now())
+
+        # not due for retry yet
+        self.assertEqual(EmailOutbox.send_queued_emails(), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(EmailOutbox.send_queued_emails(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_messages_claimed_while_sending(self):
+        self.review.send_request_emails()
+        send = mail.EmailMessage.send
+
+        def send_while_other_worker_runs(message):
+            # the claim has been committed, so another worker finds nothing to send
+            self.assertFalse(EmailOutbox.objects.filter(next_attempt_at__lte=timezone.now()).exists())
+            self.assertEqual(EmailOutbox.send_queued_emails(), (0, 0))
+            return send(message)
+
+        with mock.patch('django.core.mail.EmailMessage.send', autospec=True, side_effect=send_while_other_worker_runs):
+            self.assertEqual(EmailOutbox.send_queued_emails(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_expired_claims_are_retried(self):
+        self.review.send_request_emails()
+        # claimed by a worker that died before sending
+        now = timezone.now()
+        self.assertEqual(len(EmailOutbox.claim_queued_emails(100, now)), 2)
+        self.assertEqual(EmailOutbox.send_queued_emails(), (0, 0))
+
+        with mock.patch('django.utils.timezone.now', return_value=now + EmailOutbox.LEASE_DURATION):
+            self.assertEqual(EmailOutbox.send_queued_emails(), (2, 0))
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(CommandError):
+            call_command('wagtail_review_send_emails', batch_size=0, verbosity=0)
+
+    def test_gives_up_after_max_attempts(self):
+        self.review.send_request_emails()
+        EmailOutbox.objects.update(attempts=EmailOutbox.MAX_ATTEMPTS - 1)
+
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=ConnectionError("SMTP went away")):
+            self.assertEqual(EmailOutbox.send_queued_emails(), (0, 2))
+
+        self.assertFalse(EmailOutbox.objects.filter(next_attempt_at__isnull=False).exists())
+
+
+class TestSeedCommand(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.submitter = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.homepage = Page.objects.get(url_path='/home/')
+
+    def test_seed(self):
+        call_command(
+            'wagtail_review_seed', pages=3, reviews_per_page=2, reviewers_per_review=2, annotations_per_reviewer=4,
+            ranges_per_annotation=2, response_rate=1, users=5, parent=self.homepage.pk, seed=1, verbosity=0
+        )
+
+        self.homepage.refresh_from_db()
+        pages = self.homepage.get_children()
+        self.assertEqual(pages.count(), 3)
+        reviews = Review.objects.filter(page__in=pages)
+        self.assertEqual(reviews.count(), 6)
+        self.assertEqual(reviews.filter(status='open').count(), 3)
+        for review in reviews:
+            self.assertEqual(review.page_revision.object_id, str(review.page_id))
+            self.assertTrue(review.reviewers.filter(user=self.submitter).exists())
+            self.assertEqual(review.get_non_responding_reviewers().count(), 0)
+            self.assertEqual(review.get_annotations().count(), 8)
+            self.assertEqual(len(review.get_annotations()[0].ranges.all()), 2)
+
+        # the dashboard summaries are up to date
+        self.assertEqual(
+            set(Review.get_pages_with_reviews_for_user(self.submitter).values_list('pk', flat=True)),
+            set(pages.values_list('pk', flat=True))
+        )
+
+        # pages do not clash with those from a previous run
+        call_command('wagtail_review_seed', pages=1, parent=self.homepage.pk, verbosity=0)
+        self.homepage.refresh_from_db()
+        self.assertEqual(self.homepage.get_children().count(), 4)
+
+    def test_seed_page_type(self):
+        call_command('wagtail_review_seed', pages=2, page_type='tests.SimplePage', parent=self.homepage.pk, verbosity=0)
+        self.homepage.refresh_from_db()
+        self.assertEqual(SimplePage.objects.child_of(self.homepage).count(), 2)
+
+        with self.assertRaisesMessage(CommandError, "Unknown page type 'tests.NoSuchPage'"):
+            call_command('wagtail_review_seed', page_type='tests.NoSuchPage', verbosity=0)
+        with self.assertRaisesMessage(CommandError, "'auth.User' is not a page type"):
+            call_command('wagtail_review_seed', page_type='auth.User', verbosity=0)
@@ -0,0 +1,278 @@
+import json
+import re
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+import swapper
+
+from wagtail.models import Site
+
+from wagtail_review.models import Annotation
+
+Review = swapper.load_model('wagtail_review', 'Review')
+
+# Options for the wagtail_review_seed command giving fixtures of increasing size. Each is seeded on
+# top of the last, and the views are requested for the objects created most recently, so that both
+# the total amount of data and the amount shown by each view grow from one size to the next. The
+# smallest has two of everything, as some queries are only needed once there is more than one (such
+# as fetching the previous revision of a page).
+FIXTURE_SIZES = [
+    {
+        'pages': 2, 'reviews_per_page': 2, 'reviewers_per_review': 2, 'annotations_per_reviewer': 2,
+        'ranges_per_annotation': 2, 'response_rate': 0.5, 'users': 4,
+    },
+    {
+        'pages': 3, 'reviews_per_page': 3, 'reviewers_per_review': 4, 'annotations_per_reviewer': 3,
+        'ranges_per_annotation': 2, 'response_rate': 0.5, 'users': 6,
+    },
+    {
+        'pages': 5, 'reviews_per_page': 5, 'reviewers_per_review': 6, 'annotations_per_reviewer': 6,
+        'ranges_per_annotation': 3, 'response_rate': 0.5, 'users': 10,
+    },
+]
+
+
+def normalise_sql(sql):
+    """
+    Replace the literal values in an SQL statement, so that the queries repeated for each object
+    in an N+1 are grouped together
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\(\?(?:, \?)+\)', '(...)', sql)
+
+
+async def read_async_streaming_content(response):
+    return b''.join([chunk async for chunk in response.streaming_content])
+
+
+def format_queries(queries):
+    counts = Counter(normalise_sql(query['sql']) for query in queries)
+    return '\n'.join('%5dx  %s' % (count, sql) for sql, count in counts.most_common())
+
+
+class FixtureData:
+    """
+    The objects most recently created by wagtail_review_seed: the open review of the last page
+    created, and a reviewer on that review who has made annotations
+    """
+    def __init__(self, options):
+        self.options = options
+        self.review = Review.objects.filter(status='open').order_by('-pk').first()
+        self.page = self.review.page
+        self.annotation = Annotation.objects.filter(
+            reviewer__review=self.review
+        ).select_related('reviewer').order_by('-pk').first()
+        self.reviewer = self.annotation.reviewer
+        # a word that appears in at least one annotation, for searches
+        self.search_term = self.annotation.text.split()[0]
+
+    def get_credentials(self, mode='respond'):
+        return {
+            'HTTP_X_WAGTAILREVIEW_MODE': mode,
+            'HTTP_X_WAGTAILREVIEW_REVIEWER': str(self.reviewer.pk),
+            'HTTP_X_WAGTAILREVIEW_TOKEN': (
+                self.reviewer.response_token if mode == 'respond' else self.reviewer.view_token
+            ),
+        }
+
+
+class QueryBudgetTestMixin:
+    """
+    Checks that the number of queries made by a view does not grow with the amount of data, by making
+    the same request against each of FIXTURE_SIZES in turn. Optionally, the number of queries can
+    also be held to a fixed budget. On failure, the queries made against the largest fixture are
+    reported, with repeated queries grouped together.
+    """
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.client.force_login(self.admin_user)
+        # the site hostname must match the test client's for pages to be previewed
+        Site.objects.update(hostname='testserver')
+
+    def seed(self, options):
+        call_command(
+            'wagtail_review_seed', page_type='tests.SimplePage', submitter='admin', seed=0, verbosity=0, **options
+        )
+        return FixtureData(options)
+
+    def request(self, method, path, data=None, status_code=200, **extra):
+        response = getattr(self.client, method)(path, data, **extra)
+        self.assertEqual(
+            response.status_code, status_code,
+            "%s %s returned status %d" % (method.upper(), path, response.status_code)
+        )
+        if response.streaming and response.is_async:
+            async_to_sync(read_async_streaming_content)(response)
+        elif response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def assertQueryBudget(self, view_name, make_request, budget=None, clear_cache=False):
+        """
+        Call make_request, passing the FixtureData for each size of fixture in turn, and fail if
+        the number of queries it makes changes between sizes, or exceeds the budget. If clear_cache
+        is true, the cache is cleared before the request is counted, for views (such as page
+        previews) that would otherwise serve the counted request from the cache.
+        """
+        counts = []
+        for options in FIXTURE_SIZES:
+            data = self.seed(options)
+            cache.clear()
+            # the first request warms up caches, and is not counted
+            make_request(data)
+            if clear_cache:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                make_request(data)
+            # copy now, as the query log is cleared by the next request
+            captured_queries = list(queries.captured_queries)
+            counts.append(len(captured_queries))
+
+            if len(set(counts)) > 1:
+                self.fail(
+                    "%s made %s queries with increasing amounts of data; the queries made with %s were:\n%s" % (
+                        view_name, ', '.join(str(count) for count in counts), options, format_queries(captured_queries)
+                    )
+                )
+            if budget is not None and counts[-1] > budget:
+                self.fail(
+                    "%s made %d queries, over its budget of %d; the queries made were:\n%s" % (
+                        view_name, counts[-1], budget, format_queries(captured_queries)
+                    )
+                )
+
+
+class TestAdminQueryBudgets(QueryBudgetTestMixin, TestCase):
+    # Admin pages are built from Wagtail's own views and templates, whose queries vary between
+    # Wagtail versions, so only the growth of their query counts is checked
+
+    def test_dashboard(self):
+        self.assertQueryBudget('dashboard', lambda data: self.request('get', '/admin/wagtail_review/reviews/'))
+
+    def test_audit_trail(self):
+        self.assertQueryBudget('audit_trail', lambda data: self.request(
+            'get', '/admin/wagtail_review/reviews/%d/' % data.page.pk
+        ))
+
+    def test_search_annotations(self):
+        self.assertQueryBudget('search_annotations', lambda data: self.request(
+            'get', '/admin/wagtail_review/reviews/comments/', {'q': data.search_term}
+        ))
+
+    def test_view_review_page(self):
+        self.assertQueryBudget('view_review_page', lambda data: self.request(
+            'get', '/admin/wagtail_review/reviews/%d/view/' % data.review.pk
+        ), clear_cache=True)
+
+    def test_create_review(self):
+        self.assertQueryBudget('create_review', lambda data: self.request(
+            'get', '/admin/wagtail_review/create_review/'
+        ))
+
+    def test_autocomplete_users(self):
+        self.assertQueryBudget('autocomplete_users', lambda data: self.request(
+            'get', '/admin/wagtail_review/autocomplete_users/', {'q': 'smith'}
+        ), budget=4)
+
+    def test_close_review(self):
+        self.assertQueryBudget('close_review', lambda data: self.request(
+            'post', '/admin/wagtail_review/reviews/%d/close/' % data.review.pk, status_code=302
+        ))
+
+    def test_reopen_review(self):
+        self.assertQueryBudget('reopen_review', lambda data: self.request(
+            'post', '/admin/wagtail_review/reviews/%d/reopen/' % data.review.pk, status_code=302
+        ))
+
+    def test_close_and_publish(self):
+        self.assertQueryBudget('close_and_publish', lambda data: self.request(
+            'post', '/admin/wagtail_review/reviews/%d/close_and_publish/' % data.review.pk, status_code=302
+        ))
+
+
+class TestFrontendQueryBudgets(QueryBudgetTestMixin, TestCase):
+    def test_view(self):
+        self.assertQueryBudget('view', lambda data: self.request(
+            'get', '/review/view/%d/%s/' % (data.reviewer.pk, data.reviewer.view_token)
+        ), clear_cache=True)
+
+    def test_respond(self):
+        self.assertQueryBudget('respond', lambda data: self.request(
+            'get', '/review/respond/%d/%s/' % (data.reviewer.pk, data.reviewer.response_token)
+        ), clear_cache=True)
+
+
+@override_settings(WAGTAILREVIEW_EVENTS_MAX_AGE=0)
+class TestAnnotationsAPIQueryBudgets(QueryBudgetTestMixin, TestCase):
+    def test_root(self):
+        self.assertQueryBudget('annotations_api.root', lambda data: self.request(
+            'get', '/review/api/', **data.get_credentials()
+        ), budget=0)
+
+    def test_index(self):
+        self.assertQueryBudget('annotations_api.index', lambda data: self.request(
+            'get', '/review/api/annotations/', **data.get_credentials()
+        ), budget=5)
+
+    def test_search(self):
+        self.assertQueryBudget('annotations_api.search', lambda data: self.request(
+            'get', '/review/api/search/', {'limit': 100}, **data.get_credentials()
+        ), budget=6)
+
+    def test_search_text(self):
+        self.assertQueryBudget('annotations_api.search (text)', lambda data: self.request(
+            'get', '/review/api/search/', {'any': data.search_term, 'limit': 100}, **data.get_credentials()
+        ), budget=6)
+
+    def test_search_since(self):
+        self.assertQueryBudget('annotations_api.search (since)', lambda data: self.request(
+            'get', '/review/api/search/', {'since': '', 'limit': 100}, **data.get_credentials()
+        ), budget=5)
+
+    def test_events(self):
+        self.assertQueryBudget('annotations_api.events', lambda data: self.request(
+            'get', '/review/api/events/', {'since': ''}, **data.get_credentials()
+        ), budget=4)
+
+    def test_item(self):
+        self.assertQueryBudget('annotations_api.item', lambda data: self.request(
+            'get', '/review/api/annotations/%d/' % data.annotation.pk, **data.get_credentials()
+        ), budget=4)
+
+    def test_batch(self):
+        def post_batch(data):
+            annotations = [
+                {
+                    'quote': "Heading",
+                    'text': "Comment %d" % i,
+                    'ranges': [
+                        {'start': '/h1[1]', 'startOffset': j, 'end': '/h1[1]', 'endOffset': j + 4}
+                        for j in range(data.options['ranges_per_annotation'])
+                    ],
+                }
+                for i in range(data.options['annotations_per_reviewer'])
+            ]
+            self.request(
+                'post', '/review/api/annotations/batch/', json.dumps(annotations),
+                content_type='application/json', status_code=201, **data.get_credentials()
+            )
+
+        self.assertQueryBudget('annotations_api.batch', post_batch, budget=6)
+
+
+@override_settings(ROOT_URLCONF='tests.async_urls')
+class TestAsyncAnnotationsAPIQueryBudgets(TestAnnotationsAPIQueryBudgets):
+    pass
@@ -0,0 +1,103 @@
+"""
+Checks that the main queries made by wagtail_review can use the indexes declared on its models.
+
+Each query is passed to the database's query planner with QuerySet.explain(), and the plan is
+checked for the name of the index it is expected to use. This runs on SQLite by default; to
+check PostgreSQL, run the test suite with DATABASE_ENGINE=django.db.backends.postgresql (plus
+DATABASE_NAME, DATABASE_USER etc. as required). On PostgreSQL, sequential scans are disabled
+while each query is explained, as the planner would otherwise prefer them for the handful of
+rows in the test database. Other databases are skipped.
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count, Max
+from django.test import TestCase
+
+from wagtail.models import Page
+
+from wagtail_review.annotation_search import get_annotation_search_backend, sqlite_has_fts_table
+from wagtail_review.models import Annotation, PageReviewSummary, Response, Review, Reviewer
+
+
+class TestQueryPlans(TestCase):
+    fixtures = ['test.json']
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest("Query plans are only checked on SQLite and PostgreSQL")
+
+        self.submitter = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password'
+        )
+        self.homepage = Page.objects.get(url_path='/home/').specific
+        self.review = Review.objects.create(page_revision=self.homepage.save_revision(), submitter=self.submitter)
+        self.reviewer = self.review.reviewers.create(user=self.submitter)
+        self.review.reviewers.create(email='bob@example.com')
+
+    def get_index_name(self, model, columns):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        return next(
+            name for name, constraint in constraints.items()
+            if constraint['index'] and constraint['columns'] == columns
+        )
+
+    def explain(self, queryset):
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            return queryset.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def assertUsesIndex(self, queryset, model, columns):
+        plan = self.explain(queryset)
+        self.assertIn(self.get_index_name(model, columns), plan)
+        return plan
+
+    def test_dashboard(self):
+        pages = Review.get_pages_with_reviews_for_user(self.submitter)
+        self.assertUsesIndex(pages, PageReviewSummary, ['last_review_requested_at'])
+
+    def test_page_has_open_review(self):
+        reviews = Review.objects.filter(page_id=self.homepage.pk, status='open')
+        self.assertUsesIndex(reviews, Review, ['page_id', 'status', 'created_at'])
+
+    def test_audit_trail(self):
+        reviews = Review.objects.filter(page_id=self.homepage.pk).order_by('created_at', 'pk')
+        plan = self.explain(reviews)
+        self.assertTrue(
+            self.get_index_name(Review, ['page_id']) in plan
+            or self.get_index_name(Review, ['page_id', 'status', 'created_at']) in plan
+        )
+
+    def test_reviewer_for_user(self):
+        reviewers = self.review.reviewers.filter(user=self.submitter)
+        self.assertUsesIndex(reviewers, Reviewer, ['review_id', 'user_id'])
+
+    def test_non_responding_reviewers(self):
+        self.assertUsesIndex(self.review.get_non_responding_reviewers(), Response, ['reviewer_id', 'created_at'])
+
+    def test_annotations_by_reviewer(self):
+        annotations = Annotation.objects.filter(reviewer=self.reviewer).order_by('updated_at', 'id')
+        plan = self.assertUsesIndex(annotations, Annotation, ['reviewer_id', 'updated_at', 'id'])
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_annotations_etag(self):
+        annotations = Annotation.objects.filter(reviewer__review_id=self.review.pk).values('reviewer__review_id').annotate(
+            last_updated_at=Max('updated_at'), count=Count('id')
+        )
+        self.assertUsesIndex(annotations, Annotation, ['reviewer_id', 'updated_at', 'id'])
+
+    def test_annotation_search(self):
+        annotations = get_annotation_search_backend().search(Annotation.objects.all(), "heading")
+        plan = self.explain(annotations)
+        if connection.vendor == 'postgresql':
+            self.assertIn('wagtail_rev_ann_fts', plan)
+        elif sqlite_has_fts_table():
+            self.assertIn('wagtail_review_annotation_fts VIRTUAL TABLE INDEX', plan)
@@ -11,6 +11,7 @@ urlpatterns = [
     path('create_review/', admin_views.create_review, name='create_review'),
     path('autocomplete_users/', admin_views.autocomplete_users, name='autocomplete_users'),
     path('reviews/', admin_views.DashboardView.as_view(), name='dashboard'),
+    path('reviews/comments/', admin_views.search_annotations, name='search_annotations'),
     path('reviews/<int:pk>/', admin_views.AuditTrailView.as_view(), name='audit_trail'),
     path('reviews/<int:review_id>/view/', admin_views.view_review_page, name='view_review_page'),
     path('reviews/<int:review_id>/close/', admin_views.close_review, name='close_review'),
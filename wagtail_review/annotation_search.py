@@ -0,0 +1,122 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# fields of Annotation that can be searched
+SEARCH_FIELDS = ('text', 'quote')
+
+# text search configuration used by the PostgreSQL backend, which must match the indexes
+# created by migration 0009_annotation_search
+POSTGRES_SEARCH_CONFIG = 'english'
+
+# SQLite FTS5 table indexing annotation text and quotes, created and kept up to date with
+# triggers by migration 0009_annotation_search
+SQLITE_FTS_TABLE = 'wagtail_review_annotation_fts'
+SQLITE_FTS_TRIGGERS = (
+    'wagtail_review_annotation_fts_insert',
+    'wagtail_review_annotation_fts_delete',
+    'wagtail_review_annotation_fts_update',
+)
+
+
+@lru_cache(maxsize=None)
+def sqlite_has_fts_table():
+    """
+    Return whether the database has the FTS5 table and the triggers that keep it up to date. The
+    migration skips creating them if SQLite was compiled without FTS5, and the triggers are dropped
+    if the annotation table is rebuilt by a later migration, leaving the index out of date.
+    """
+    names = (SQLITE_FTS_TABLE, ) + SQLITE_FTS_TRIGGERS
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s)" % ', '.join(['%s'] * len(names)), names
+        )
+        return cursor.fetchone()[0] == len(names)
+
+
+def get_default_annotation_search_backend_class():
+    if connection.vendor == 'postgresql':
+        return PostgresAnnotationSearchBackend
+    elif connection.vendor == 'sqlite' and sqlite_has_fts_table():
+        return SQLiteAnnotationSearchBackend
+    else:
+        return ContainsAnnotationSearchBackend
+
+
+@lru_cache(maxsize=None)
+def get_annotation_search_backend():
+    """
+    Get the annotation search backend from the ``WAGTAILREVIEW_ANNOTATION_SEARCH_BACKEND`` setting,
+    or the best one for the database in use if it is not set.
+    """
+    backend_name = getattr(settings, 'WAGTAILREVIEW_ANNOTATION_SEARCH_BACKEND', None)
+    if backend_name is None:
+        return get_default_annotation_search_backend_class()()
+
+    try:
+        backend_class = import_string(backend_name)
+    except ImportError:
+        raise ImproperlyConfigured(
+            "WAGTAILREVIEW_ANNOTATION_SEARCH_BACKEND refers to a backend '%s' that is not available" % backend_name
+        )
+    return backend_class()
+
+
+class ContainsAnnotationSearchBackend:
+    """
+    Finds annotations where every search term appears somewhere in one of the searched fields.
+    Works on any database, but has to scan every annotation being searched.
+    """
+    def search(self, annotations, query, fields=SEARCH_FIELDS):
+        """
+        Filter a queryset of annotations to those matching the search query in any of the given fields
+        """
+        for term in query.split():
+            condition = Q()
+            for field in fields:
+                condition |= Q(**{'%s__icontains' % field: term})
+            annotations = annotations.filter(condition)
+        return annotations
+
+
+class PostgresAnnotationSearchBackend(ContainsAnnotationSearchBackend):
+    """
+    Finds annotations matching all search terms (after stemming) using PostgreSQL full text search,
+    with GIN indexes on the text, the quote, and the two combined.
+    """
+    def search(self, annotations, query, fields=SEARCH_FIELDS):
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+
+        if not query.split():
+            return annotations
+
+        # the vector must be built exactly as in the index for the index to be used
+        alias = 'search_vector_%s' % '_'.join(fields)
+        return annotations.alias(**{
+            alias: SearchVector(*fields, config=POSTGRES_SEARCH_CONFIG)
+        }).filter(**{
+            alias: SearchQuery(query, config=POSTGRES_SEARCH_CONFIG, search_type='plain')
+        })
+
+
+class SQLiteAnnotationSearchBackend(ContainsAnnotationSearchBackend):
+    """
+    Finds annotations with a word matching each search term (after stemming) in an SQLite FTS5 table
+    """
+    def search(self, annotations, query, fields=SEARCH_FIELDS):
+        terms = query.split()
+        if not terms:
+            return annotations
+
+        # quote each term so that it is matched as a string, rather than parsed as FTS5 query syntax
+        match = '{%s} : (%s)' % (
+            ' '.join(fields), ' AND '.join('"%s"' % term.replace('"', '""') for term in terms)
+        )
+        return annotations.filter(id__in=RawSQL(
+            'SELECT rowid FROM %s WHERE %s MATCH %%s' % (SQLITE_FTS_TABLE, SQLITE_FTS_TABLE), [match]
+        ))
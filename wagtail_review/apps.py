@@ -6,3 +6,7 @@ class WagtailReviewAppConfig(AppConfig):
     name = "wagtail_review"
     verbose_name = "wagtail-review"
     default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        from wagtail_review.signal_handlers import register_signal_handlers
+        register_signal_handlers()
@@ -0,0 +1,16 @@
+from django.urls import path
+from wagtail_review.views import async_annotations_api, async_frontend
+
+# Asynchronous equivalent of wagtail_review.urls, for projects served under ASGI
+app_name = 'wagtail_review'
+
+urlpatterns = [
+    path('view/<int:reviewer_id>/<slug:token>/', async_frontend.view, name='view'),
+    path('respond/<int:reviewer_id>/<slug:token>/', async_frontend.respond, name='respond'),
+    path('api/', async_annotations_api.root, name='annotations_api_root'),
+    path('api/search/', async_annotations_api.search, name='annotations_api_search'),
+    path('api/events/', async_annotations_api.events, name='annotations_api_events'),
+    path('api/annotations/', async_annotations_api.index, name='annotations_api_index'),
+    path('api/annotations/batch/', async_annotations_api.batch, name='annotations_api_batch'),
+    path('api/annotations/<int:id>/', async_annotations_api.item, name='annotations_api_item'),
+]
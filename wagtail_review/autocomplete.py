@@ -0,0 +1,127 @@
+import bisect
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from wagtail_review.cache import get_user_search_index_version
+
+SEARCH_FIELD_NAMES = ['username', 'first_name', 'last_name', 'email']
+
+
+def get_autocomplete_limit():
+    return getattr(settings, 'WAGTAILREVIEW_AUTOCOMPLETE_LIMIT', 20)
+
+
+@lru_cache(maxsize=None)
+def get_user_search_fields():
+    """
+    Return the names of the fields out of SEARCH_FIELD_NAMES that exist on the user model
+    """
+    model_fields = {f.name for f in get_user_model()._meta.get_fields()}
+    return tuple(name for name in SEARCH_FIELD_NAMES if name in model_fields)
+
+
+@lru_cache(maxsize=None)
+def get_user_search_backend():
+    """
+    Get the user autocomplete backend from the ``WAGTAILREVIEW_AUTOCOMPLETE_BACKEND`` setting.
+    """
+    backend_name = getattr(
+        settings, 'WAGTAILREVIEW_AUTOCOMPLETE_BACKEND', 'wagtail_review.autocomplete.DatabaseUserSearchBackend'
+    )
+    try:
+        backend_class = import_string(backend_name)
+    except ImportError:
+        raise ImproperlyConfigured(
+            "WAGTAILREVIEW_AUTOCOMPLETE_BACKEND refers to a backend '%s' that is not available" % backend_name
+        )
+    return backend_class()
+
+
+class DatabaseUserSearchBackend:
+    """
+    Finds users where every search term appears in at least one of the search fields, with
+    users matching the most terms at the start of a field listed first
+    """
+    def __init__(self):
+        self.fields = get_user_search_fields()
+
+    def _match_any_field(self, term, lookup):
+        condition = Q()
+        for field in self.fields:
+            condition |= Q(**{'%s__%s' % (field, lookup): term})
+        return condition
+
+    def search(self, terms, limit):
+        User = get_user_model()
+        if not terms or not self.fields:
+            return User.objects.none()
+
+        users = User.objects.all()
+        rank = Value(0, output_field=IntegerField())
+        for term in terms:
+            users = users.filter(self._match_any_field(term, 'icontains'))
+            rank = rank + Case(
+                When(self._match_any_field(term, 'istartswith'), then=Value(1)),
+                default=Value(0), output_field=IntegerField()
+            )
+
+        return users.annotate(autocomplete_rank=rank).order_by('-autocomplete_rank', self.fields[0], 'pk')[:limit]
+
+
+class InMemoryPrefixUserSearchBackend(DatabaseUserSearchBackend):
+    """
+    Finds users where every search term is the start of a word in one of the search fields,
+    using a sorted list of words held in memory by each process. The list is rebuilt on the
+    next search after any user is saved or deleted.
+    """
+    def __init__(self):
+        super().__init__()
+        self.index_version = None
+        self.index = ([], [], {})
+
+    def build_index(self):
+        entries = []
+        sort_keys = {}
+        for row in get_user_model().objects.values_list('pk', *self.fields).iterator():
+            pk = row[0]
+            sort_keys[pk] = str(row[1] or '').lower()
+            for value in row[1:]:
+                for word in set(str(value or '').lower().split()):
+                    entries.append((word, pk))
+
+        entries.sort(key=lambda entry: entry[0])
+        return ([word for word, pk in entries], [pk for word, pk in entries], sort_keys)
+
+    def get_index(self):
+        version = get_user_search_index_version()
+        if version != self.index_version:
+            self.index = self.build_index()
+            self.index_version = version
+        return self.index
+
+    def search(self, terms, limit):
+        if not terms or not self.fields:
+            return []
+
+        words, user_ids, sort_keys = self.get_index()
+        matches = None
+        for term in terms:
+            term = term.lower()
+            term_matches = set()
+            for i in range(bisect.bisect_left(words, term), len(words)):
+                if not words[i].startswith(term):
+                    break
+                term_matches.add(user_ids[i])
+
+            matches = term_matches if matches is None else (matches & term_matches)
+            if not matches:
+                return []
+
+        user_ids = sorted(matches, key=lambda pk: (sort_keys[pk], pk))[:limit]
+        users = get_user_model().objects.in_bulk(user_ids)
+        return [users[pk] for pk in user_ids if pk in users]
@@ -0,0 +1,47 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+REVIEWS_MENU_VERSION_CACHE_KEY = 'wagtail_review:reviews_menu_version'
+USER_SEARCH_INDEX_VERSION_CACHE_KEY = 'wagtail_review:user_search_index_version'
+
+
+def get_reviews_menu_cache_timeout():
+    return getattr(settings, 'WAGTAILREVIEW_MENU_CACHE_TIMEOUT', 300)
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_reviews_menu_cache_key(user):
+    return 'wagtail_review:reviews_menu:%s:%s' % (_get_version(REVIEWS_MENU_VERSION_CACHE_KEY), user.pk)
+
+
+def invalidate_reviews_menu(user=None):
+    """
+    Discard the cached visibility of the 'Reviews' admin menu item for the given user,
+    or for all users if no user is given
+    """
+    if user is None:
+        # Switch to a new version number rather than deleting keys, since there is no way
+        # to find all per-user keys
+        cache.set(REVIEWS_MENU_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    else:
+        cache.delete(get_reviews_menu_cache_key(user))
+
+
+def get_user_search_index_version():
+    return _get_version(USER_SEARCH_INDEX_VERSION_CACHE_KEY)
+
+
+def invalidate_user_search_index():
+    """
+    Tell all processes to rebuild their in-memory user autocomplete index on next use
+    """
+    cache.set(USER_SEARCH_INDEX_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,90 @@
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+SIGNING_SALT = 'wagtail_review.credentials'
+
+# how long (in seconds) the result of checking a signed token against the reviewer record is cached
+REVOCATION_CHECK_INTERVAL = 60
+
+
+def use_signed_credentials():
+    return getattr(settings, 'WAGTAILREVIEW_SIGNED_CREDENTIALS', False)
+
+
+def get_signed_credentials_max_age():
+    return getattr(settings, 'WAGTAILREVIEW_SIGNED_CREDENTIALS_MAX_AGE', 60 * 60 * 24)
+
+
+def get_reviewer_token(reviewer, mode):
+    """
+    Return the reviewer's secret token for the given mode ('respond', 'comment' or 'view')
+    """
+    if mode in ('respond', 'comment'):
+        return reviewer.response_token
+    elif mode == 'view':
+        return reviewer.view_token
+
+
+def check_reviewer_token(reviewer, mode, token):
+    """
+    Compare a token against the reviewer's secret token for the given mode, in constant time
+    """
+    expected_token = get_reviewer_token(reviewer, mode)
+    return expected_token is not None and constant_time_compare(token, expected_token)
+
+
+def _fingerprint(token):
+    return salted_hmac(SIGNING_SALT, token).hexdigest()[:16]
+
+
+def get_api_token(reviewer, mode):
+    """
+    Return the token to be passed to the annotations API. If WAGTAILREVIEW_SIGNED_CREDENTIALS is
+    enabled, this is a signed, expiring token encoding the reviewer ID, review ID and mode, which can
+    be checked without looking up the reviewer record; otherwise it is the reviewer's secret token.
+    """
+    token = get_reviewer_token(reviewer, mode)
+    if not use_signed_credentials():
+        return token
+
+    return signing.dumps({
+        'reviewer': reviewer.id,
+        'review': reviewer.review_id,
+        'mode': mode,
+        # allows the signed token to be revoked by changing or deleting the reviewer's secret token
+        'fingerprint': _fingerprint(token),
+    }, salt=SIGNING_SALT)
+
+
+def is_signed_token(token):
+    # reviewer secret tokens are alphanumeric, while signed tokens contain ':' separators
+    return ':' in token
+
+
+@lru_cache(maxsize=1024)
+def _is_revoked(reviewer_id, mode, fingerprint, time_bucket):
+    # time_bucket is not used here, but is part of the cache key so that results expire
+    from wagtail_review.models import Reviewer
+
+    reviewer = Reviewer.objects.filter(id=reviewer_id).only('response_token', 'view_token').first()
+    return reviewer is None or not constant_time_compare(_fingerprint(get_reviewer_token(reviewer, mode)), fingerprint)
+
+
+def check_signed_token(token, reviewer_id, mode):
+    """
+    Verify a signed token as returned by get_api_token, for the given reviewer ID and mode.
+    Returns the review ID, or raises signing.BadSignature if the token is invalid, expired or revoked.
+    """
+    data = signing.loads(token, salt=SIGNING_SALT, max_age=get_signed_credentials_max_age())
+    if str(data['reviewer']) != str(reviewer_id) or data['mode'] != mode:
+        raise signing.BadSignature("Token does not match reviewer or mode")
+
+    time_bucket = int(time.time() // REVOCATION_CHECK_INTERVAL)
+    if _is_revoked(data['reviewer'], mode, data['fingerprint'], time_bucket):
+        raise signing.BadSignature("Token has been revoked")
+
+    return data['review']
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.urls import resolve, reverse
+from django.utils.module_loading import import_string
+
+
+def get_events_max_age():
+    return getattr(settings, 'WAGTAILREVIEW_EVENTS_MAX_AGE', 300)
+
+
+def get_events_url():
+    """
+    Return the URL of the event stream for the annotation UI to listen to, or None if it should
+    poll for changes instead. Event streams are used if WAGTAILREVIEW_EVENTS_STREAM is true, or
+    if it is not set and the events URL is served by the asynchronous views (wagtail_review.async_urls),
+    which wait for changes without holding a thread.
+    """
+    url = reverse('wagtail_review:annotations_api_events')
+    use_stream = getattr(settings, 'WAGTAILREVIEW_EVENTS_STREAM', None)
+    if use_stream is None:
+        use_stream = iscoroutinefunction(resolve(url).func)
+    return url if use_stream else None
+
+
+@lru_cache(maxsize=None)
+def get_event_backend():
+    """
+    Get the live annotation updates backend from the ``WAGTAILREVIEW_EVENTS_BACKEND`` setting.
+    """
+    backend_name = getattr(settings, 'WAGTAILREVIEW_EVENTS_BACKEND', 'wagtail_review.events.InProcessEventBackend')
+    try:
+        backend_class = import_string(backend_name)
+    except ImportError:
+        raise ImproperlyConfigured(
+            "WAGTAILREVIEW_EVENTS_BACKEND refers to a backend '%s' that is not available" % backend_name
+        )
+    return backend_class()
+
+
+def notify_review_changed(review_id):
+    """
+    Tell clients listening for live updates that annotations in the given review have been
+    created, updated or deleted, once the current transaction is committed
+    """
+    transaction.on_commit(lambda: get_event_backend().publish(review_id))
+
+
+class InProcessEventBackend:
+    """
+    Wakes up event streams in the same process as the change was made. Only suitable for single-process
+    deployments (such as a single ASGI worker); with several processes, reviewers connected to a
+    different process will only see changes made through that process.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def publish(self, review_id):
+        with self.lock:
+            subscribers = list(self.subscribers.get(review_id, ()))
+        for subscription in subscribers:
+            subscription.notify()
+
+    def subscribe(self, review_id):
+        subscription = InProcessSubscription(self, review_id)
+        with self.lock:
+            self.subscribers[review_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.review_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.review_id]
+
+
+class InProcessSubscription:
+    def __init__(self, backend, review_id):
+        self.backend = backend
+        self.review_id = review_id
+        self.changed = threading.Event()
+        # set up by await_change, for waking up a waiting event loop from whichever thread publishes the change
+        self.loop = None
+        self.async_changed = None
+
+    def notify(self):
+        self.changed.set()
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.async_changed.set)
+            except RuntimeError:
+                # the event loop has been closed
+                pass
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout seconds for a change to the review, returning True if there may have been one
+        """
+        changed = self.changed.wait(timeout)
+        if changed:
+            # only clear the flag once it has been seen, so that a change published just after timing out is not lost
+            self.changed.clear()
+        return changed
+
+    async def await_change(self, timeout):
+        """
+        Asynchronous version of wait(), which does not block the event loop's thread
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.async_changed = asyncio.Event()
+
+        if not self.changed.is_set():
+            try:
+                await asyncio.wait_for(self.async_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        self.async_changed.clear()
+        changed = self.changed.is_set()
+        if changed:
+            self.changed.clear()
+        return changed
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class DatabasePollingEventBackend:
+    """
+    Checks the database for changes every WAGTAILREVIEW_EVENTS_POLL_INTERVAL seconds (default 5),
+    regardless of which process made them
+    """
+    def publish(self, review_id):
+        pass
+
+    def subscribe(self, review_id):
+        return DatabasePollingSubscription(getattr(settings, 'WAGTAILREVIEW_EVENTS_POLL_INTERVAL', 5))
+
+
+class DatabasePollingSubscription:
+    def __init__(self, interval):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(self.interval, timeout))
+        return True
+
+    async def await_change(self, timeout):
+        await asyncio.sleep(min(self.interval, timeout))
+        return True
+
+    def close(self):
+        pass
@@ -0,0 +1,5 @@
+from django.conf import settings
+
+
+def use_email_outbox():
+    return getattr(settings, 'WAGTAILREVIEW_EMAIL_OUTBOX', False)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from wagtail_review.models import DeletedAnnotation
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the records of deleted annotations that are older than "
+        "WAGTAILREVIEW_DELETED_ANNOTATION_RETENTION, which are no longer needed for incremental sync"
+    )
+
+    def handle(self, *args, **options):
+        count = DeletedAnnotation.prune()
+        if options['verbosity'] >= 1:
+            self.stdout.write("Pruned %d records of deleted annotations." % count)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from wagtail_review.models import PageReviewSummary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-page review summaries used by the review dashboard"
+
+    def handle(self, *args, **options):
+        count = PageReviewSummary.rebuild()
+        if options['verbosity'] >= 1:
+            self.stdout.write("Rebuilt review summaries for %d pages." % count)
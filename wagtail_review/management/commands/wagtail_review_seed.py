@@ -0,0 +1,197 @@
+import random
+import uuid
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+import swapper
+
+from wagtail.models import Page, Site
+
+from wagtail_review.models import (
+    RESULT_CHOICES, Annotation, AnnotationRange, PageReviewSummary, Response, Reviewer, generate_token
+)
+
+WORDS = [
+    'heading', 'paragraph', 'image', 'caption', 'link', 'typo', 'wording', 'tone', 'layout', 'date',
+    'price', 'contact', 'address', 'summary', 'introduction', 'conclusion', 'quote', 'table', 'chart', 'list',
+]
+
+FIRST_NAMES = ['Alex', 'Sam', 'Charlie', 'Jo', 'Robin', 'Kim', 'Morgan', 'Jamie', 'Ali', 'Chris']
+LAST_NAMES = ['Smith', 'Jones', 'Taylor', 'Brown', 'Wilson', 'Evans', 'Thomas', 'Roberts', 'Walker', 'Wright']
+
+
+def bulk_create(objects):
+    """
+    Insert objects of one model, populating their IDs even where the database can't return
+    them from a bulk insert
+    """
+    if not objects:
+        return objects
+    if connection.features.can_return_rows_from_bulk_insert:
+        return type(objects[0]).objects.bulk_create(objects, batch_size=1000)
+    for obj in objects:
+        obj.save()
+    return objects
+
+
+class Command(BaseCommand):
+    help = (
+        "Create pages with reviews, reviewers, responses and annotations, for trying out or benchmarking "
+        "wagtail-review with large amounts of data. Not for use on a production site."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10, help="Number of pages to create")
+        parser.add_argument('--reviews-per-page', type=int, default=3, help="Number of reviews of each page")
+        parser.add_argument(
+            '--reviewers-per-review', type=int, default=3,
+            help="Number of reviewers for each review, besides the submitter"
+        )
+        parser.add_argument(
+            '--annotations-per-reviewer', type=int, default=5, help="Number of annotations made by each reviewer"
+        )
+        parser.add_argument(
+            '--ranges-per-annotation', type=int, default=1, help="Number of ranges in each annotation"
+        )
+        parser.add_argument(
+            '--response-rate', type=float, default=0.5,
+            help="Proportion of reviewers who have responded to each review, between 0 and 1"
+        )
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help="Number of user accounts to create, which are picked at random as reviewers"
+        )
+        parser.add_argument(
+            '--parent', type=int, default=None,
+            help="ID of the page to create pages under (default: the root page of the default site)"
+        )
+        parser.add_argument(
+            '--page-type', default='wagtailcore.Page',
+            help=(
+                "Page model to create, as app_label.ModelName; "
+                "use a type with a template for the pages to be previewable"
+            )
+        )
+        parser.add_argument(
+            '--submitter', default=None,
+            help="Username of the user submitting the reviews (default: the first superuser)"
+        )
+        parser.add_argument('--seed', type=int, default=None, help="Random seed, to generate the same data each time")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        Review = swapper.load_model('wagtail_review', 'Review')
+        rng = random.Random(options['seed'])
+
+        try:
+            if options['submitter']:
+                submitter = User.objects.get(**{User.USERNAME_FIELD: options['submitter']})
+            else:
+                submitter = User.objects.filter(is_superuser=True).order_by('pk')[:1].get()
+        except User.DoesNotExist:
+            raise CommandError("No submitter found; create a superuser or pass --submitter")
+
+        try:
+            if options['parent']:
+                parent = Page.objects.get(pk=options['parent'])
+            else:
+                parent = Site.objects.get(is_default_site=True).root_page
+        except (Page.DoesNotExist, Site.DoesNotExist):
+            raise CommandError("No parent page found; pass the ID of an existing page as --parent")
+
+        try:
+            page_model = apps.get_model(options['page_type'])
+        except (LookupError, ValueError):
+            raise CommandError("Unknown page type '%s'; pass it as app_label.ModelName" % options['page_type'])
+        if not issubclass(page_model, Page):
+            raise CommandError("'%s' is not a page type" % options['page_type'])
+
+        # distinguishes the pages and users from those made by other runs of the command
+        run_id = uuid.uuid4().hex[:8]
+
+        with transaction.atomic():
+            users = []
+            for i in range(options['users']):
+                user = User(
+                    username='seed-%s-%d' % (run_id, i),
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                    email='seed-%s-%d@example.com' % (run_id, i),
+                )
+                user.set_unusable_password()
+                users.append(user)
+            bulk_create(users)
+
+            reviews = []
+            parent = parent.specific
+            for i in range(options['pages']):
+                page = parent.add_child(instance=page_model(
+                    title="Review seed page %d" % (i + 1), slug='review-seed-%s-%d' % (run_id, i + 1), live=False
+                ))
+                for j in range(options['reviews_per_page']):
+                    reviews.append(Review(
+                        page_revision=page.save_revision(user=submitter, log_action=False),
+                        page=page,
+                        submitter=submitter,
+                        # only the most recent review of each page is still open
+                        status='open' if j == options['reviews_per_page'] - 1 else 'closed',
+                    ))
+                parent.refresh_from_db()
+            bulk_create(reviews)
+
+            reviewers = []
+            for review in reviews:
+                reviewers.append(Reviewer(
+                    review=review, user=submitter, response_token=generate_token(), view_token=generate_token()
+                ))
+                for j in range(options['reviewers_per_review']):
+                    # a mix of reviewers with user accounts and external reviewers identified by email address
+                    if users and j % 2 == 0:
+                        reviewer = Reviewer(review=review, user=rng.choice(users))
+                    else:
+                        reviewer = Reviewer(review=review, email='reviewer-%s-%d@example.com' % (run_id, rng.randrange(10 ** 6)))
+                    reviewer.response_token = generate_token()
+                    reviewer.view_token = generate_token()
+                    reviewers.append(reviewer)
+            bulk_create(reviewers)
+
+            responding_reviewers = [
+                reviewer for reviewer in reviewers
+                if reviewer.user_id != submitter.pk and rng.random() < options['response_rate']
+            ]
+            bulk_create([
+                Response(reviewer=reviewer, result=rng.choice(RESULT_CHOICES)[0], comment=self.make_text(rng, 12))
+                for reviewer in responding_reviewers
+            ])
+
+            annotations = [
+                Annotation(reviewer=reviewer, quote=self.make_text(rng, 6), text=self.make_text(rng, 10))
+                for reviewer in reviewers if reviewer.user_id != submitter.pk
+                for i in range(options['annotations_per_reviewer'])
+            ]
+            bulk_create(annotations)
+
+            bulk_create([
+                AnnotationRange(
+                    annotation=annotation, start='/div[1]/p[%d]' % (i + 1), start_offset=0,
+                    end='/div[1]/p[%d]' % (i + 1), end_offset=rng.randrange(1, 80)
+                )
+                for annotation in annotations
+                for i in range(options['ranges_per_annotation'])
+            ])
+
+            # bulk_create does not send the signals that keep the dashboard summaries up to date
+            PageReviewSummary.rebuild()
+
+        if options['verbosity'] >= 1:
+            self.stdout.write(
+                "Created %d pages, %d reviews, %d reviewers, %d responses and %d annotations." % (
+                    options['pages'], len(reviews), len(reviewers), len(responding_reviewers), len(annotations)
+                )
+            )
+
+    def make_text(self, rng, word_count):
+        return ' '.join(rng.choice(WORDS) for i in range(word_count)).capitalize() + '.'
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail_review.models import EmailOutbox
+
+
+class Command(BaseCommand):
+    help = "Send review notification emails queued in the outbox (when WAGTAILREVIEW_EMAIL_OUTBOX is enabled)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help="Number of emails to send over each SMTP connection"
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, checking for new emails to send every --interval seconds"
+        )
+        parser.add_argument(
+            '--interval', type=float, default=10,
+            help="Number of seconds to wait between checks for new emails in --loop mode"
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = EmailOutbox.send_queued_emails(batch_size=options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent + failed < options['batch_size']:
+                    break
+
+            if options['verbosity'] >= 1 and (total_sent or total_failed or not options['loop']):
+                self.stdout.write("Sent %d emails, %d failed." % (total_sent, total_failed))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
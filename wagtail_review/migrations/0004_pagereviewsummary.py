@@ -0,0 +1,64 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Q
+import django.db.models.deletion
+
+
+def populate_page_review_summaries(apps, schema_editor):
+    # Equivalent to PageReviewSummary.rebuild(), but using the historical models
+    app_label, model_name = settings.WAGTAILREVIEW_REVIEW_MODEL.split('.')
+    Review = apps.get_model(app_label, model_name)
+    Reviewer = apps.get_model('wagtail_review', 'Reviewer')
+    PageReviewSummary = apps.get_model('wagtail_review', 'PageReviewSummary')
+
+    summaries = {}
+    review_totals = Review.objects.order_by().values('page_revision__object_id').annotate(
+        last_review_requested_at=Max('created_at'),
+        open_review_count=Count('pk', filter=Q(status='open')),
+        closed_review_count=Count('pk', filter=Q(status='closed')),
+    )
+    for totals in review_totals:
+        page_id = int(totals.pop('page_revision__object_id'))
+        summaries[page_id] = PageReviewSummary(page_id=page_id, **totals)
+
+    reviewer_totals = (
+        Reviewer.objects.exclude(user=F('review__submitter'))
+        .order_by().values('review__page_revision__object_id').annotate(
+            reviewer_count=Count('pk', distinct=True),
+            pending_response_count=Count(
+                'pk', distinct=True, filter=Q(review__status='open', responses__isnull=True)
+            ),
+        )
+    )
+    for totals in reviewer_totals:
+        summary = summaries[int(totals['review__page_revision__object_id'])]
+        summary.reviewer_count = totals['reviewer_count']
+        summary.pending_response_count = totals['pending_response_count']
+
+    PageReviewSummary.objects.bulk_create(summaries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_review', '0003_response'),
+        ('wagtailcore', '0071_populate_revision_content_type'),
+        migrations.swappable_dependency(settings.WAGTAILREVIEW_REVIEW_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageReviewSummary',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='wagtailreview_summary', serialize=False, to='wagtailcore.page')),
+                ('last_review_requested_at', models.DateTimeField(db_index=True)),
+                ('open_review_count', models.PositiveIntegerField(default=0)),
+                ('closed_review_count', models.PositiveIntegerField(default=0)),
+                ('reviewer_count', models.PositiveIntegerField(default=0)),
+                ('pending_response_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_page_review_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_review', '0004_pagereviewsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedAnnotation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('annotation_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.WAGTAILREVIEW_REVIEW_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['review', 'deleted_at'], name='wagtail_rev_review__db0736_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_review', '0006_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['reviewer', 'updated_at', 'id'], name='wagtail_rev_reviewe_64fc08_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='response',
+            index=models.Index(fields=['reviewer', 'created_at'], name='wagtail_rev_reviewe_09c22f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewer',
+            index=models.Index(fields=['review', 'user'], name='wagtail_rev_review__300b7e_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.15 on 2026-10-18 20:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Cast
+
+
+def populate_review_pages(apps, schema_editor):
+    Review = apps.get_model('wagtail_review', 'Review')
+    if Review._meta.swapped:
+        # custom review models are populated by their own app's migrations
+        return
+
+    Revision = apps.get_model('wagtailcore', 'Revision')
+    Review.objects.filter(page__isnull=True).update(
+        page_id=Cast(
+            Subquery(Revision.objects.filter(pk=OuterRef('page_revision_id')).values('object_id')[:1]),
+            output_field=models.IntegerField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_review', '0007_query_indexes'),
+        ('wagtailcore', '0071_populate_revision_content_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='page',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailcore.page'),
+        ),
+        migrations.RunPython(populate_review_pages, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['page', 'status', 'created_at'], name='wagtail_rev_page_id_80174a_idx'),
+        ),
+    ]
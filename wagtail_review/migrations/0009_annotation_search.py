@@ -0,0 +1,98 @@
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+# Full text search indexes used by wagtail_review.annotation_search. These depend on the database
+# in use, so are created here rather than declared on the Annotation model.
+
+POSTGRES_SEARCH_CONFIG = 'english'
+
+POSTGRES_INDEXES = [
+    ('wagtail_rev_ann_text_fts', ['text']),
+    ('wagtail_rev_ann_quote_fts', ['quote']),
+    ('wagtail_rev_ann_fts', ['text', 'quote']),
+]
+
+SQLITE_CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE wagtail_review_annotation_fts USING fts5(
+        text, quote, content='wagtail_review_annotation', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER wagtail_review_annotation_fts_insert AFTER INSERT ON wagtail_review_annotation BEGIN
+        INSERT INTO wagtail_review_annotation_fts(rowid, text, quote) VALUES (new.id, new.text, new.quote);
+    END
+    """,
+    """
+    CREATE TRIGGER wagtail_review_annotation_fts_delete AFTER DELETE ON wagtail_review_annotation BEGIN
+        INSERT INTO wagtail_review_annotation_fts(wagtail_review_annotation_fts, rowid, text, quote)
+        VALUES ('delete', old.id, old.text, old.quote);
+    END
+    """,
+    """
+    CREATE TRIGGER wagtail_review_annotation_fts_update AFTER UPDATE OF text, quote ON wagtail_review_annotation BEGIN
+        INSERT INTO wagtail_review_annotation_fts(wagtail_review_annotation_fts, rowid, text, quote)
+        VALUES ('delete', old.id, old.text, old.quote);
+        INSERT INTO wagtail_review_annotation_fts(rowid, text, quote) VALUES (new.id, new.text, new.quote);
+    END
+    """,
+    # index any existing annotations
+    "INSERT INTO wagtail_review_annotation_fts(wagtail_review_annotation_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS wagtail_review_annotation_fts_insert",
+    "DROP TRIGGER IF EXISTS wagtail_review_annotation_fts_delete",
+    "DROP TRIGGER IF EXISTS wagtail_review_annotation_fts_update",
+    "DROP TABLE IF EXISTS wagtail_review_annotation_fts",
+]
+
+
+def get_postgres_indexes():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return [
+        GinIndex(SearchVector(*fields, config=POSTGRES_SEARCH_CONFIG), name=name)
+        for name, fields in POSTGRES_INDEXES
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        Annotation = apps.get_model('wagtail_review', 'Annotation')
+        for index in get_postgres_indexes():
+            schema_editor.add_index(Annotation, index)
+
+    elif vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                for sql in SQLITE_CREATE_SQL:
+                    schema_editor.execute(sql)
+        except OperationalError:
+            # SQLite was compiled without FTS5; annotation searches will scan the table instead
+            pass
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        Annotation = apps.get_model('wagtail_review', 'Annotation')
+        for index in get_postgres_indexes():
+            schema_editor.remove_index(Annotation, index)
+
+    elif vendor == 'sqlite':
+        for sql in SQLITE_DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_review', '0008_review_page'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -1,12 +1,15 @@
+import datetime
 import random
 import string
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Case, Value, When
-from django.template.loader import render_to_string
+from django.core.mail import get_connection
+from django.db import models, transaction
+from django.db.models import Count, ExpressionWrapper, F, Max, Q
+from django.template.loader import get_template, render_to_string
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
@@ -20,6 +23,7 @@ if WAGTAIL_VERSION >= (5, 1):
 else:
     from wagtail.models import UserPagePermissionsProxy
 
+from wagtail_review.mail import use_email_outbox
 from wagtail_review.text import user_display_name
 
 
@@ -34,28 +38,71 @@ REVIEW_STATUS_CHOICES = [
 
 
 revision_model = "wagtailcore.Revision"
-revision_page_fk_relation = "page_revision__object_id"
+
 
 class BaseReview(models.Model):
     """
     Abstract base class for Review models. Can be subclassed to specify application-specific fields, e.g. review type
     """
     page_revision = models.ForeignKey(revision_model, related_name='+', on_delete=models.CASCADE, editable=False)
+    # The page that page_revision belongs to; stored separately so that reviews can be looked up by page
+    # without joining on the revision's (string) object_id. Set from page_revision on save whenever that changes
+    page = models.ForeignKey('wagtailcore.Page', null=True, related_name='+', on_delete=models.CASCADE, editable=False)
     status = models.CharField(max_length=30, default='open', choices=REVIEW_STATUS_CHOICES, editable=False)
     submitter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._page_revision_id_for_page = instance.__dict__.get('page_revision_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # avoid fetching the revision again unless page_revision has been set since the page was last set
+        if self.page_revision_id is not None and (
+            self.page_id is None or self.page_revision_id != getattr(self, '_page_revision_id_for_page', None)
+        ):
+            self.page_id = int(self.page_revision.object_id)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'page'}
+        super().save(*args, **kwargs)
+        self._page_revision_id_for_page = self.page_revision_id
+
+    def get_request_email_context(self):
+        """
+        Return the parts of the review request email context that are common to all reviewers
+        """
+        return {
+            'review': self,
+            'page': self.revision_as_page,
+            'submitter': self.submitter,
+        }
+
     def send_request_emails(self):
-        # send request emails to all reviewers except the reviewer record for the user submitting the request
-        for reviewer in self.reviewers.exclude(user=self.submitter):
-            reviewer.send_request_email()
+        # send request emails to all reviewers except the reviewer record for the user submitting the request.
+        # The page revision is only deserialised once, and all emails are sent over one connection
+        shared_context = self.get_request_email_context()
+        subject_template = get_template('wagtail_review/email/request_review_subject.txt')
+        content_template = get_template('wagtail_review/email/request_review.txt')
+
+        send_review_emails([
+            reviewer.render_request_email(shared_context, subject_template, content_template)
+            for reviewer in self.reviewers.exclude(user=self.submitter).select_related('user')
+        ])
 
     @cached_property
     def revision_as_page(self):
         return self.page_revision.as_object()
 
     def get_annotations(self):
-        return Annotation.objects.filter(reviewer__review=self).prefetch_related('ranges')
+        return (
+            Annotation.objects.filter(reviewer__review=self)
+            .select_related('reviewer__user')
+            .only('id', 'quote', 'text', 'created_at', 'updated_at', 'reviewer__id', 'reviewer__email', 'reviewer__user')
+            .prefetch_related('ranges')
+        )
 
     def get_responses(self):
         return Response.objects.filter(reviewer__review=self).order_by('created_at').select_related('reviewer')
@@ -66,30 +113,23 @@ class BaseReview(models.Model):
     @classmethod
     def get_pages_with_reviews_for_user(cls, user):
         """
-        Return a queryset of pages which have reviews, for which the user has edit permission
+        Return a queryset of pages which have reviews, for which the user has edit permission,
+        annotated with last_review_requested_at and has_open_review
         """
         if WAGTAIL_VERSION >= (5, 1):
             editable_pages = PagePermissionPolicy().instances_user_has_permission_for(user, "change")
         else:
             editable_pages = UserPagePermissionsProxy(user).editable_pages()
 
-        reviewed_pages = (
-            cls.objects
-            .order_by('-created_at')
-            .values_list(revision_page_fk_relation, 'created_at')
-        )
-        # Annotate datetime when a review was last created for this page
-        last_review_requested_at = Case(
-            *[
-                When(pk=pk, then=Value(created_at))
-                for pk, created_at in reviewed_pages
-            ],
-            output_field=models.DateTimeField(),
-        )
         return (
             editable_pages
-            .filter(pk__in=(page[0] for page in reviewed_pages))
-            .annotate(last_review_requested_at=last_review_requested_at)
+            .filter(wagtailreview_summary__isnull=False)
+            .annotate(
+                last_review_requested_at=F('wagtailreview_summary__last_review_requested_at'),
+                has_open_review=ExpressionWrapper(
+                    Q(wagtailreview_summary__open_review_count__gt=0), output_field=models.BooleanField()
+                ),
+            )
             .order_by('-last_review_requested_at')
         )
 
@@ -100,6 +140,29 @@ class BaseReview(models.Model):
 class Review(BaseReview):
     class Meta:
         swappable = swapper.swappable_setting('wagtail_review', 'Review')
+        indexes = [
+            # reviews of a page by status, in order of creation
+            models.Index(fields=['page', 'status', 'created_at']),
+        ]
+
+
+def send_review_emails(emails):
+    """
+    Send a list of notification emails, given as (subject, message, recipient) tuples, over a single
+    connection - or add them to the outbox if WAGTAILREVIEW_EMAIL_OUTBOX is enabled
+    """
+    if not emails:
+        return
+
+    if use_email_outbox():
+        EmailOutbox.objects.bulk_create([
+            EmailOutbox(recipient=recipient, subject=subject, message=message)
+            for subject, message, recipient in emails
+        ])
+    else:
+        with get_connection() as connection:
+            for subject, message, recipient in emails:
+                send_mail(subject, message, [recipient], connection=connection)
 
 
 def generate_token():
@@ -119,6 +182,11 @@ class Reviewer(models.Model):
         help_text="Secret token this user must supply to be allowed to view the page revision being reviewed"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['review', 'user']),
+        ]
+
     def clean(self):
         if self.user is None and not self.email:
             raise ValidationError("A reviewer must have either an email address or a user account")
@@ -149,33 +217,63 @@ class Reviewer(models.Model):
             url = settings.WAGTAILADMIN_BASE_URL + url
         return url
 
-    def send_request_email(self):
+    def render_request_email(self, shared_context=None, subject_template=None, content_template=None):
+        """
+        Return a (subject, content, recipient) tuple for the review request email to this reviewer.
+        When rendering emails for several reviewers of the same review, the shared context (as
+        returned by Review.get_request_email_context) and templates can be passed in.
+        """
         email_address = self.get_email_address()
 
-        context = {
+        context = dict(shared_context or self.review.get_request_email_context())
+        context.update({
             'email': email_address,
             'user': self.user,
-            'review': self.review,
-            'page': self.review.revision_as_page,
-            'submitter': self.review.submitter,
             'respond_url': self.get_respond_url(absolute=True),
             'view_url': self.get_view_url(absolute=True),
-        }
+        })
+
+        subject_template = subject_template or get_template('wagtail_review/email/request_review_subject.txt')
+        content_template = content_template or get_template('wagtail_review/email/request_review.txt')
+        email_subject = subject_template.render(context).strip()
+        email_content = content_template.render(context).strip()
 
-        email_subject = render_to_string('wagtail_review/email/request_review_subject.txt', context).strip()
-        email_content = render_to_string('wagtail_review/email/request_review.txt', context).strip()
+        return (email_subject, email_content, email_address)
 
-        send_mail(email_subject, email_content, [email_address])
+    def send_request_email(self):
+        send_review_emails([self.render_request_email()])
 
 
 class Annotation(models.Model):
+    # On SQLite, migration 0009_annotation_search indexes text and quote in an FTS5 table kept up to
+    # date by triggers on this table. Django rebuilds the table for most schema changes on SQLite,
+    # which drops the triggers, so any later migration altering this model must recreate them (the
+    # search falls back to scanning the table, and test_sqlite_search_index_installed fails, until it does).
     reviewer = models.ForeignKey(Reviewer, related_name='annotations', on_delete=models.CASCADE)
     quote = models.TextField(blank=True)
     text = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def as_json_data(self):
+    class Meta:
+        indexes = [
+            models.Index(fields=['reviewer', 'updated_at', 'id']),
+        ]
+
+    def as_json_data(self, reviewer_names=None):
+        """
+        Return the Annotator JSON representation of this annotation. When serialising several
+        annotations, pass the same (initially empty) dict as reviewer_names to all of them, so that
+        each reviewer's display name is only determined once.
+        """
+        if reviewer_names is None:
+            reviewer_name = self.reviewer.get_name()
+        else:
+            try:
+                reviewer_name = reviewer_names[self.reviewer_id]
+            except KeyError:
+                reviewer_name = reviewer_names[self.reviewer_id] = self.reviewer.get_name()
+
         return {
             'id': self.id,
             'annotator_schema_version': 'v1.0',
@@ -184,12 +282,22 @@ class Annotation(models.Model):
             'text': self.text,
             'quote': self.quote,
             'user': {
-                'id': self.reviewer.id,
-                'name': self.reviewer.get_name(),
+                'id': self.reviewer_id,
+                'name': reviewer_name,
             },
             'ranges': [r.as_json_data() for r in self.ranges.all()],
         }
 
+    @staticmethod
+    def as_json_data_list(annotations):
+        """
+        Return the Annotator JSON representations of the given annotations, resolving each reviewer's
+        display name once. To avoid further queries, annotations should be fetched with
+        select_related('reviewer__user') and prefetch_related('ranges'), as BaseReview.get_annotations does.
+        """
+        reviewer_names = {}
+        return [annotation.as_json_data(reviewer_names) for annotation in annotations]
+
 
 class AnnotationRange(models.Model):
     annotation = models.ForeignKey(Annotation, related_name='ranges', on_delete=models.CASCADE)
@@ -198,6 +306,17 @@ class AnnotationRange(models.Model):
     end = models.TextField()
     end_offset = models.IntegerField()
 
+    @classmethod
+    def from_json_data(cls, data, **kwargs):
+        """
+        Return an unsaved AnnotationRange from its Annotator JSON representation
+        """
+        return cls(
+            start=data['start'], start_offset=int(data['startOffset']),
+            end=data['end'], end_offset=int(data['endOffset']),
+            **kwargs
+        )
+
     def as_json_data(self):
         return {
             'start': self.start,
@@ -207,6 +326,38 @@ class AnnotationRange(models.Model):
         }
 
 
+class DeletedAnnotation(models.Model):
+    """
+    Record of an annotation that has been deleted, so that clients syncing a review's annotations
+    incrementally can remove it
+    """
+    review = models.ForeignKey(swapper.get_model_name('wagtail_review', 'Review'), related_name='+', on_delete=models.CASCADE)
+    annotation_id = models.IntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['review', 'deleted_at']),
+        ]
+
+    @classmethod
+    def get_retention_cutoff(cls):
+        """
+        Return the time before which deletion records may have been pruned. Clients whose sync
+        cursor is older than this have to reload all annotations.
+        """
+        retention = getattr(settings, 'WAGTAILREVIEW_DELETED_ANNOTATION_RETENTION', 60 * 60 * 24 * 30)
+        return timezone.now() - datetime.timedelta(seconds=retention)
+
+    @classmethod
+    def prune(cls):
+        """
+        Delete the records older than the retention period, returning the number deleted
+        """
+        count, _ = cls.objects.filter(deleted_at__lt=cls.get_retention_cutoff()).delete()
+        return count
+
+
 RESULT_CHOICES = (
     ('approve', 'Approved'),
     ('comment', 'Comment'),
@@ -219,6 +370,11 @@ class Response(models.Model):
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['reviewer', 'created_at']),
+        ]
+
     def send_notification_to_submitter(self):
         submitter = self.reviewer.review.submitter
         if submitter.email:
@@ -234,4 +390,197 @@ class Response(models.Model):
             email_subject = render_to_string('wagtail_review/email/response_received_subject.txt', context).strip()
             email_content = render_to_string('wagtail_review/email/response_received.txt', context).strip()
 
-            send_mail(email_subject, email_content, [submitter.email])
+            send_review_emails([(email_subject, email_content, submitter.email)])
+
+
+class PageReviewSummary(models.Model):
+    """
+    Denormalised per-page totals of review activity, used for dashboard listings so that they do not
+    need to join through all reviews and revisions. Kept up to date by the signal handlers in
+    wagtail_review.signal_handlers, and can be rebuilt in full with the
+    wagtail_review_rebuild_summaries management command.
+    """
+    page = models.OneToOneField(
+        'wagtailcore.Page', primary_key=True, on_delete=models.CASCADE, related_name='wagtailreview_summary'
+    )
+    last_review_requested_at = models.DateTimeField(db_index=True)
+    open_review_count = models.PositiveIntegerField(default=0)
+    closed_review_count = models.PositiveIntegerField(default=0)
+    # reviewers and pending responses exclude the reviewer records of the review submitters;
+    # responses are only counted as pending for open reviews
+    reviewer_count = models.PositiveIntegerField(default=0)
+    pending_response_count = models.PositiveIntegerField(default=0)
+
+    TOTAL_FIELDS = [
+        'last_review_requested_at', 'open_review_count', 'closed_review_count', 'reviewer_count',
+        'pending_response_count',
+    ]
+
+    @classmethod
+    def build_summaries(cls, page_ids=None):
+        """
+        Return a dict of unsaved PageReviewSummary instances keyed by page ID, calculated from the
+        review records for the given page IDs (or all pages, if page_ids is None)
+        """
+        Review = swapper.load_model('wagtail_review', 'Review')
+        reviews = Review.objects.filter(page__isnull=False)
+        if page_ids is not None:
+            reviews = reviews.filter(page__in=page_ids)
+
+        summaries = {}
+        review_totals = (
+            reviews.order_by().values('page').annotate(
+                last_review_requested_at=Max('created_at'),
+                open_review_count=Count('pk', filter=Q(status='open')),
+                closed_review_count=Count('pk', filter=Q(status='closed')),
+            )
+        )
+        for totals in review_totals:
+            page_id = totals.pop('page')
+            summaries[page_id] = cls(page_id=page_id, **totals)
+
+        reviewer_totals = (
+            Reviewer.objects.filter(review__in=reviews)
+            .exclude(user=F('review__submitter'))
+            .order_by().values('review__page').annotate(
+                reviewer_count=Count('pk', distinct=True),
+                pending_response_count=Count(
+                    'pk', distinct=True, filter=Q(review__status='open', responses__isnull=True)
+                ),
+            )
+        )
+        for totals in reviewer_totals:
+            summary = summaries[totals.pop('review__page')]
+            summary.reviewer_count = totals['reviewer_count']
+            summary.pending_response_count = totals['pending_response_count']
+
+        return summaries
+
+    @classmethod
+    def update_for_pages(cls, page_ids):
+        """
+        Recalculate the summaries for the given pages, deleting those of pages that no longer have any reviews
+        """
+        page_ids = set(page_ids)
+        with transaction.atomic():
+            # lock the existing summaries first, so that concurrent updates of the same page are applied
+            # in turn, each calculated from the review records as they stand once the lock is held
+            list(cls.objects.select_for_update().filter(page_id__in=page_ids).values_list('pk', flat=True))
+            summaries = cls.build_summaries(page_ids)
+
+            cls.objects.filter(page_id__in=page_ids - summaries.keys()).delete()
+            for page_id, summary in summaries.items():
+                # update_or_create handles another transaction creating the same summary at the same time
+                cls.objects.update_or_create(page_id=page_id, defaults={
+                    field: getattr(summary, field) for field in cls.TOTAL_FIELDS
+                })
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Replace all summaries with ones recalculated from the review records
+        """
+        summaries = cls.build_summaries()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(summaries.values(), batch_size=1000)
+        return len(summaries)
+
+
+class EmailOutbox(models.Model):
+    """
+    Notification email waiting to be sent by the wagtail_review_send_emails management command,
+    when WAGTAILREVIEW_EMAIL_OUTBOX is enabled
+    """
+    # number of attempts to send a message before giving up
+    MAX_ATTEMPTS = 8
+    # delay before retrying after the first failure, doubled on each subsequent failure
+    RETRY_DELAY = datetime.timedelta(minutes=1)
+    # time for which a worker has claimed the messages it is sending
+    LEASE_DURATION = datetime.timedelta(minutes=10)
+
+    recipient = models.EmailField()
+    subject = models.TextField()
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # null once the message has been sent, or has failed MAX_ATTEMPTS times
+    next_attempt_at = models.DateTimeField(null=True, default=timezone.now, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = "email outbox"
+
+    def record_failure(self, error, now):
+        self.attempts += 1
+        self.last_error = str(error) or error.__class__.__name__
+        if self.attempts < self.MAX_ATTEMPTS:
+            self.next_attempt_at = now + self.RETRY_DELAY * (2 ** (self.attempts - 1))
+        else:
+            self.next_attempt_at = None
+
+    @classmethod
+    def claim_queued_emails(cls, batch_size, now):
+        """
+        Return up to batch_size messages that are due to be sent, having moved their next attempt
+        LEASE_DURATION into the future so that other workers skip them while they are being sent.
+        If the worker dies before recording the outcome, they become due again when the lease expires.
+        """
+        with transaction.atomic():
+            # skip_locked allows several workers to claim messages at once
+            outbox_messages = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(next_attempt_at__lte=now).order_by('next_attempt_at', 'pk')[:batch_size]
+            )
+            if outbox_messages:
+                cls.objects.filter(pk__in=[outbox_message.pk for outbox_message in outbox_messages]).update(
+                    next_attempt_at=now + cls.LEASE_DURATION
+                )
+        return outbox_messages
+
+    @classmethod
+    def send_queued_emails(cls, batch_size=100):
+        """
+        Send up to batch_size messages that are due to be sent, over a single connection.
+        Returns a tuple of the number of messages sent and the number that failed.
+        """
+        now = timezone.now()
+        sent = failed = 0
+
+        # messages are claimed in a short transaction, so that no locks are held while connecting
+        # to the mail server and sending
+        outbox_messages = cls.claim_queued_emails(batch_size, now)
+        if not outbox_messages:
+            return (0, 0)
+
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            for outbox_message in outbox_messages:
+                outbox_message.record_failure(e, now)
+            failed = len(outbox_messages)
+        else:
+            try:
+                for outbox_message in outbox_messages:
+                    try:
+                        send_mail(
+                            outbox_message.subject, outbox_message.message, [outbox_message.recipient],
+                            connection=connection
+                        )
+                    except Exception as e:
+                        outbox_message.record_failure(e, now)
+                        failed += 1
+                    else:
+                        outbox_message.attempts += 1
+                        outbox_message.sent_at = timezone.now()
+                        outbox_message.next_attempt_at = None
+                        sent += 1
+            finally:
+                connection.close()
+
+        cls.objects.bulk_update(
+            outbox_messages, ['attempts', 'sent_at', 'next_attempt_at', 'last_error']
+        )
+        return (sent, failed)
@@ -0,0 +1,236 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage, storages
+from django.http import FileResponse, HttpResponse
+from django.middleware.csrf import get_token as get_csrf_token
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import salted_hmac
+
+from wagtail_review.credentials import get_api_token
+from wagtail_review.events import get_events_url
+from wagtail_review.forms import ResponseForm
+
+# Output of the {% wagtailreview %} tag when rendering a page for the preview cache; replaced
+# with the reviewer-specific annotation UI each time the cached preview is served
+PREVIEW_PLACEHOLDER = '<!-- wagtailreview -->'
+
+SNAPSHOT_CHUNK_SIZE = 8192
+
+
+def get_preview_cache_timeout():
+    # Off by default, as cached previews are rendered without the reviewer's request, so pages
+    # that depend on the request (user, site or cookies) would show the same content to everyone
+    return getattr(settings, 'WAGTAILREVIEW_PREVIEW_CACHE_TIMEOUT', 0)
+
+
+def get_preview_cache_key(revision_id, mode):
+    return 'wagtail_review:preview:%s:%s' % (revision_id, mode)
+
+
+def use_preview_snapshots():
+    # Snapshots of unpublished pages must not be publicly served, so they are only enabled when a
+    # (private) storage is named for them, rather than falling back to the default storage
+    return bool(getattr(settings, 'WAGTAILREVIEW_SNAPSHOT_STORAGE', None))
+
+
+def get_snapshot_storage():
+    return storages[settings.WAGTAILREVIEW_SNAPSHOT_STORAGE]
+
+
+def get_snapshot_path(revision_id, mode):
+    # Include a hash in the file name as a second line of defence, so that snapshots of
+    # unpublished revisions cannot be found by guessing if the storage is exposed by mistake
+    digest = salted_hmac('wagtail_review.preview.snapshot', '%s:%s' % (revision_id, mode)).hexdigest()
+    return 'wagtail_review/snapshots/%s-%s-%s.html' % (revision_id, mode, digest[:20])
+
+
+def get_review_ui_context(mode, reviewer):
+    """
+    Return the template context for the annotation UI (wagtail_review/annotate.html)
+    """
+    if mode == 'respond' or mode == 'comment':
+        return {
+            'mode': mode,
+            'allow_annotations': (reviewer.review.status != 'closed'),
+            'show_closed': (reviewer.review.status == 'closed'),
+            'allow_responses': (mode == 'respond' and reviewer.review.status != 'closed'),
+            'reviewer': reviewer,
+            'token': get_api_token(reviewer, mode),
+            'events_url': get_events_url(),
+            'response_form': ResponseForm()
+        }
+    elif mode == 'view':
+        return {
+            'mode': mode,
+            'show_closed': False,
+            'allow_annotations': False,
+            'allow_responses': False,
+            'reviewer': reviewer,
+            'token': get_api_token(reviewer, mode),
+            'events_url': get_events_url(),
+        }
+    else:
+        return {'mode': None}
+
+
+def render_preview(revision, mode):
+    """
+    Render the page revision with a placeholder in place of the annotation UI, returning a
+    dict of content and content type suitable for caching, or None if the page did not
+    return a cacheable response (e.g. a redirect)
+    """
+    page = revision.as_object()
+    # No original request is passed, so that the rendered page does not depend on the
+    # cookies or session of whoever happens to view it first
+    response = page.make_preview_request(
+        extra_request_attrs={
+            'wagtailreview_mode': mode,
+            'wagtailreview_placeholder': True,
+        }
+    )
+    if response.status_code != 200 or response.streaming:
+        return None
+
+    return {
+        'content': response.content.decode(response.charset),
+        'content_type': response['Content-Type'],
+    }
+
+
+def save_snapshot(revision, mode):
+    """
+    Render the page revision to a file in the snapshot storage. Returns False if the page
+    did not return a response that can be snapshotted.
+    """
+    preview = render_preview(revision, mode)
+    if preview is None:
+        return False
+
+    write_snapshot(get_snapshot_storage(), get_snapshot_path(revision.id, mode), preview['content'].encode('utf-8'))
+    return True
+
+
+def write_snapshot(storage, path, content):
+    """
+    Write a snapshot file, replacing any existing file in one step, so that two requests saving
+    the same snapshot at once cannot leave a partly-written file or a renamed duplicate
+    """
+    if not isinstance(storage, FileSystemStorage):
+        # Other storages (such as S3) replace the stored object when the file is closed
+        with storage.open(path, 'wb') as snapshot_file:
+            snapshot_file.write(content)
+        return
+
+    full_path = storage.path(path)
+    directory = os.path.dirname(full_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as snapshot_file:
+            snapshot_file.write(content)
+        if getattr(storage, 'file_permissions_mode', None) is not None:
+            os.chmod(temp_path, storage.file_permissions_mode)
+        os.replace(temp_path, full_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def delete_snapshots(revision_id):
+    storage = get_snapshot_storage()
+    for mode in ('respond', 'view', 'comment'):
+        path = get_snapshot_path(revision_id, mode)
+        if storage.exists(path):
+            storage.delete(path)
+
+
+def render_review_ui(request, reviewer, mode):
+    # Render without the request, so that URLs are not reversed against the current
+    # (possibly admin) URL namespace; only the CSRF token is needed from it
+    context = get_review_ui_context(mode, reviewer)
+    context['csrf_token'] = get_csrf_token(request)
+    return render_to_string('wagtail_review/annotate.html', context)
+
+
+def _iter_snapshot(snapshot_file, review_ui):
+    """
+    Yield the contents of a snapshot file with the placeholder replaced by the annotation UI,
+    holding back enough of each chunk to catch a placeholder split across two reads
+    """
+    placeholder = PREVIEW_PLACEHOLDER.encode('utf-8')
+    review_ui = review_ui.encode('utf-8')
+    keep = len(placeholder) - 1
+    pending = b''
+
+    with snapshot_file:
+        for chunk in iter(lambda: snapshot_file.read(SNAPSHOT_CHUNK_SIZE), b''):
+            pending = (pending + chunk).replace(placeholder, review_ui)
+            if len(pending) > keep:
+                yield pending[:-keep]
+                pending = pending[-keep:]
+
+    if pending:
+        yield pending
+
+
+def serve_snapshot(request, reviewer, mode):
+    """
+    Return a response streaming the snapshot file for the review's page revision, creating
+    the snapshot first if it does not exist yet. Returns None if no snapshot can be made.
+    """
+    review = reviewer.review
+    storage = get_snapshot_storage()
+    path = get_snapshot_path(review.page_revision_id, mode)
+    if not storage.exists(path) and not save_snapshot(review.page_revision, mode):
+        return None
+
+    response = FileResponse(
+        _iter_snapshot(storage.open(path, 'rb'), render_review_ui(request, reviewer, mode)),
+        content_type='text/html; charset=utf-8'
+    )
+    patch_cache_control(response, private=True)
+    return response
+
+
+def serve_review_preview(request, reviewer, mode):
+    """
+    Return a response showing the page revision under review, with the annotation UI for the
+    given reviewer and mode. The page itself is rendered once per revision and mode, and
+    shared between all reviewers through the cache or a snapshot file.
+    """
+    if use_preview_snapshots():
+        response = serve_snapshot(request, reviewer, mode)
+        if response is not None:
+            return response
+
+    review = reviewer.review
+    timeout = get_preview_cache_timeout()
+
+    if timeout:
+        cache_key = get_preview_cache_key(review.page_revision_id, mode)
+        preview = cache.get(cache_key)
+        if preview is None:
+            preview = render_preview(review.page_revision, mode)
+            if preview is not None:
+                cache.set(cache_key, preview, timeout)
+
+        if preview is not None:
+            response = HttpResponse(
+                preview['content'].replace(PREVIEW_PLACEHOLDER, render_review_ui(request, reviewer, mode)),
+                content_type=preview['content_type']
+            )
+            patch_cache_control(response, private=True)
+            return response
+
+    page = review.page_revision.as_object()
+    return page.make_preview_request(
+        original_request=request,
+        extra_request_attrs={
+            'wagtailreview_mode': mode,
+            'wagtailreview_reviewer': reviewer,
+        }
+    )
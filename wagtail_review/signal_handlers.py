@@ -0,0 +1,162 @@
+import weakref
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+import swapper
+
+from wagtail.models import GroupPagePermission
+
+from wagtail_review.cache import invalidate_reviews_menu, invalidate_user_search_index
+from wagtail_review.events import notify_review_changed
+from wagtail_review.models import Annotation, DeletedAnnotation, PageReviewSummary, Response, Reviewer
+from wagtail_review.preview import delete_snapshots, use_preview_snapshots
+
+Review = swapper.load_model('wagtail_review', 'Review')
+
+
+def schedule_summary_update(page_id):
+    """
+    Recalculate the dashboard summary of the page once the current transaction is committed. Pages
+    changed within one transaction (e.g. when a review is submitted with several reviewers, or deleted
+    along with its reviewers and responses) are collected and recalculated together, once.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        PageReviewSummary.update_for_pages([page_id])
+        return
+
+    if not hasattr(connection, 'wagtailreview_summary_page_ids'):
+        connection.wagtailreview_summary_page_ids = set()
+        connection.wagtailreview_update_summaries = None
+    page_ids = connection.wagtailreview_summary_page_ids
+
+    # Only a weak reference to the pending callback is kept, so that it is gone once Django discards
+    # it on rolling back the transaction (or the savepoint it was added in). The pages collected for it
+    # were rolled back too, and a new callback is needed for the next change.
+    if connection.wagtailreview_update_summaries is None or connection.wagtailreview_update_summaries() is None:
+        page_ids.clear()
+
+    if not page_ids:
+        def update_summaries():
+            pending_page_ids = set(page_ids)
+            page_ids.clear()
+            PageReviewSummary.update_for_pages(pending_page_ids)
+
+        connection.wagtailreview_update_summaries = weakref.ref(update_summaries)
+        transaction.on_commit(update_summaries)
+
+    page_ids.add(page_id)
+
+
+def schedule_summary_update_for_review(**review_filter):
+    page_id = Review.objects.filter(**review_filter).values_list('page', flat=True).first()
+    if page_id is not None:
+        schedule_summary_update(page_id)
+
+
+def review_changed(sender, instance, **kwargs):
+    if instance.page_id is not None:
+        schedule_summary_update(instance.page_id)
+
+
+def review_created_or_deleted(sender, instance, created=True, **kwargs):
+    # a new or deleted review can change the 'Reviews' menu visibility for any user who can edit the page.
+    # The menu is checked against the page summaries, so this waits until they have been updated on commit
+    if created:
+        transaction.on_commit(invalidate_reviews_menu)
+
+
+def review_deleted(sender, instance, **kwargs):
+    # snapshots of the revision are no longer needed once no review of it remains
+    if use_preview_snapshots() and not Review.objects.filter(page_revision_id=instance.page_revision_id).exists():
+        delete_snapshots(instance.page_revision_id)
+
+
+def page_permissions_changed(sender, **kwargs):
+    invalidate_reviews_menu()
+
+
+def group_saved(sender, **kwargs):
+    # Wagtail's group edit view saves the group and then adds its page permissions with bulk_create,
+    # which sends no signals. The permissions are written within the same request, well before the
+    # next page load checks the menu, and on commit if the request runs in a transaction.
+    transaction.on_commit(invalidate_reviews_menu)
+
+
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # covers changes to is_superuser / is_active, but not the last_login update on every login
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        invalidate_reviews_menu(instance)
+        invalidate_user_search_index()
+
+
+def user_deleted(sender, instance, **kwargs):
+    invalidate_user_search_index()
+
+
+def user_groups_changed(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # the user list of a group has changed
+        invalidate_reviews_menu()
+    else:
+        invalidate_reviews_menu(instance)
+
+
+def reviewer_changed(sender, instance, **kwargs):
+    schedule_summary_update_for_review(pk=instance.review_id)
+
+
+def response_changed(sender, instance, **kwargs):
+    schedule_summary_update_for_review(reviewers=instance.reviewer_id)
+
+
+def annotation_deleted(sender, instance, origin=None, **kwargs):
+    # Annotations deleted along with their review (or page, etc) don't need a record, as the
+    # review is going too
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model not in (Annotation, Reviewer):
+        return
+
+    review_id = Reviewer.objects.filter(pk=instance.reviewer_id).values_list('review_id', flat=True).first()
+    if review_id is not None:
+        DeletedAnnotation.objects.create(review_id=review_id, annotation_id=instance.id)
+        notify_review_changed(review_id)
+
+
+def annotation_saved(sender, instance, **kwargs):
+    if Annotation.reviewer.is_cached(instance):
+        review_id = instance.reviewer.review_id
+    else:
+        review_id = Reviewer.objects.filter(pk=instance.reviewer_id).values_list('review_id', flat=True).first()
+    notify_review_changed(review_id)
+
+
+def register_signal_handlers():
+    post_save.connect(review_changed, sender=Review)
+    post_delete.connect(review_changed, sender=Review)
+    post_save.connect(review_created_or_deleted, sender=Review)
+    post_delete.connect(review_created_or_deleted, sender=Review)
+    post_delete.connect(review_deleted, sender=Review)
+    post_save.connect(reviewer_changed, sender=Reviewer)
+    post_delete.connect(reviewer_changed, sender=Reviewer)
+    post_save.connect(response_changed, sender=Response)
+    post_delete.connect(response_changed, sender=Response)
+    post_save.connect(annotation_saved, sender=Annotation)
+    post_delete.connect(annotation_deleted, sender=Annotation)
+
+    post_save.connect(page_permissions_changed, sender=GroupPagePermission)
+    post_delete.connect(page_permissions_changed, sender=GroupPagePermission)
+    post_save.connect(group_saved, sender=Group)
+
+    User = get_user_model()
+    post_save.connect(user_changed, sender=User)
+    post_delete.connect(user_deleted, sender=User)
+    if hasattr(User, 'groups'):
+        m2m_changed.connect(user_groups_changed, sender=User.groups.through)
@@ -9,6 +9,124 @@
     }
 
     window.annotatorExt = {
+        'loadAnnotations': function(app, pageSize) {
+            /* Load annotations from the search endpoint a page at a time, drawing each page as it arrives.
+            Resolves to the last annotation loaded (or null if there are none). */
+            var lastLoaded = null;
+
+            function loadPage(cursor) {
+                var query = {'limit': pageSize};
+                if (cursor) {
+                    query.after = cursor;
+                }
+                return app.annotations.query(query).then(function(data) {
+                    app.runHook('annotationsLoaded', [data.results]);
+                    if (data.results.length) {
+                        lastLoaded = data.results[data.results.length - 1];
+                    }
+                    if (data.meta.next) {
+                        return loadPage(data.meta.next);
+                    }
+                    return lastLoaded;
+                });
+            }
+            return loadPage(null);
+        },
+        'liveUpdates': function(options) {
+            /* Apply annotations created, updated or deleted by other reviewers. If an eventsUrl option is
+            given and the browser supports EventSource, changes are received from the server-sent events
+            endpoint (passing the credentials option as query parameters); otherwise the search endpoint is
+            polled every 'interval' milliseconds. Updates begin when the 'startLiveUpdates' hook is run,
+            passing the last annotation loaded by loadAnnotations. */
+            var interval = (options && options.interval) || 10000;
+            var eventsUrl = options && options.eventsUrl;
+            var credentials = (options && options.credentials) || {};
+            var app;
+            var annotations = {};
+            var cursor = '';
+
+            function remember(annotation) {
+                if (annotation.id) {
+                    annotations[annotation.id] = annotation;
+                }
+            }
+
+            function applyChanges(rows, deleted, reset) {
+                var added = [];
+                if (reset) {
+                    /* the cursor was too old for the server to know what has been deleted since, so
+                    it is sending all annotations again; remove the ones shown so far */
+                    Object.keys(annotations).forEach(function(id) {
+                        app.runHook('annotationDeleted', [annotations[id]]);
+                    });
+                }
+                rows.forEach(function(row) {
+                    var annotation = annotations[row.id];
+                    if (annotation) {
+                        annotator.util.$.extend(annotation, row);
+                        app.runHook('annotationUpdated', [annotation]);
+                    } else {
+                        added.push(row);
+                    }
+                });
+                if (added.length) {
+                    app.runHook('annotationsLoaded', [added]);
+                }
+                deleted.forEach(function(id) {
+                    var annotation = annotations[id];
+                    if (annotation) {
+                        app.runHook('annotationDeleted', [annotation]);
+                    }
+                });
+            }
+
+            function poll() {
+                app.annotations.query({'since': cursor}).then(function(data) {
+                    applyChanges(data.results, data.meta.deleted, data.meta.reset);
+                    cursor = data.meta.cursor;
+                }).then(schedule, schedule);
+            }
+
+            function schedule() {
+                window.setTimeout(poll, interval);
+            }
+
+            function listen() {
+                /* EventSource reconnects by itself when the server ends the stream, sending the ID of
+                the last event received as the cursor to continue from */
+                var source = new EventSource(eventsUrl + '?' + annotator.util.$.param(
+                    annotator.util.$.extend({'since': cursor}, credentials)
+                ));
+                source.addEventListener('annotations', function(event) {
+                    var data = JSON.parse(event.data);
+                    applyChanges(data.rows, data.deleted, data.reset);
+                    cursor = data.cursor;
+                });
+            }
+
+            return {
+                start: function(annotatorApp) {
+                    app = annotatorApp;
+                },
+                annotationsLoaded: function(anns) {
+                    anns.forEach(remember);
+                },
+                annotationCreated: remember,
+                annotationDeleted: function(annotation) {
+                    delete annotations[annotation.id];
+                },
+                startLiveUpdates: function(lastLoaded) {
+                    if (lastLoaded) {
+                        cursor = lastLoaded.updated + ',' + lastLoaded.id;
+                    }
+                    if (eventsUrl && window.EventSource) {
+                        listen();
+                    } else {
+                        schedule();
+                    }
+                }
+            };
+        },
         'viewerWithUsernames': function(viewer) {
             viewer.setRenderer(renderWithUsername);
         },
@@ -34,6 +152,12 @@
                 },
                 annotationsLoaded: function (anns) {
                     ui.highlighter.drawAll(anns);
+                },
+                annotationUpdated: function (ann) {
+                    ui.highlighter.redraw(ann);
+                },
+                annotationDeleted: function (ann) {
+                    ui.highlighter.undraw(ann);
                 }
             };
         }
@@ -1,6 +1,4 @@
 from django import template
-from django.contrib.contenttypes.models import ContentType
-from wagtail.models import Page
 
 import swapper
 
@@ -13,9 +11,7 @@ register = template.Library()
 
 @register.simple_tag
 def page_has_open_review(page):
-    return bool(Review.objects.filter(
-        page_revision__object_id=str(page.pk), page_revision__base_content_type=ContentType.objects.get_for_model(Page), status='open'
-    ))
+    return Review.objects.filter(page_id=page.pk, status='open').exists()
 
 
 register.filter(user_display_name)
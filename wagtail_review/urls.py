@@ -10,6 +10,8 @@ urlpatterns = [
     path('respond/<int:reviewer_id>/<slug:token>/', frontend.respond, name='respond'),
     path('api/', annotations_api.root, name='annotations_api_root'),
     path('api/search/', annotations_api.search, name='annotations_api_search'),
+    path('api/events/', annotations_api.events, name='annotations_api_events'),
     path('api/annotations/', annotations_api.index, name='annotations_api_index'),
+    path('api/annotations/batch/', annotations_api.batch, name='annotations_api_batch'),
     path('api/annotations/<int:id>/', annotations_api.item, name='annotations_api_item'),
 ]
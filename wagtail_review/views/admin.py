@@ -1,9 +1,10 @@
 from django.contrib.auth import get_user_model
-from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.db.models import Prefetch
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.http import require_POST
 from django.views.generic.detail import DetailView
@@ -11,12 +12,15 @@ from django.views.generic.detail import DetailView
 import swapper
 
 from wagtail.admin import messages
+from wagtail.admin.forms.search import SearchForm
 from wagtail.admin.modal_workflow import render_modal_workflow
 from wagtail.admin.views import generic
-from wagtail.models import Page
 
+from wagtail_review.annotation_search import get_annotation_search_backend
+from wagtail_review.autocomplete import get_autocomplete_limit, get_user_search_backend
 from wagtail_review.forms import get_review_form_class, ReviewerFormSet
-from wagtail_review.models import Reviewer
+from wagtail_review.models import Annotation, Response, Reviewer
+from wagtail_review.preview import serve_review_preview
 from wagtail_review.text import user_display_name
 
 
@@ -58,30 +62,11 @@ def create_review(request):
 
 
 def autocomplete_users(request):
-    q = request.GET.get('q', '')
-
-    terms = q.split()
+    terms = request.GET.get('q', '').split()
     if terms:
-        conditions = Q()
-
-        model_fields = [f.name for f in User._meta.get_fields()]
-
-        for term in terms:
-            if 'username' in model_fields:
-                conditions |= Q(username__icontains=term)
-
-            if 'first_name' in model_fields:
-                conditions |= Q(first_name__icontains=term)
-
-            if 'last_name' in model_fields:
-                conditions |= Q(last_name__icontains=term)
-
-            if 'email' in model_fields:
-                conditions |= Q(email__icontains=term)
-
-        users = User.objects.filter(conditions)
+        users = get_user_search_backend().search(terms, get_autocomplete_limit())
     else:
-        users = User.objects.none()
+        users = []
 
     result_data = [
         {
@@ -109,6 +94,7 @@ class AuditTrailView(DetailView):
     page_title = _("Audit trail")
     header_icon = 'doc-empty-inverse'
     context_object_name = 'page'
+    reviews_per_page = 20
 
     def get_queryset(self):
         return Review.get_pages_with_reviews_for_user(self.request.user)
@@ -119,15 +105,57 @@ class AuditTrailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context['reviews'] = Review.objects.filter(
-            page_revision__object_id=str(self.object.pk),
-            page_revision__base_content_type=ContentType.objects.get_for_model(Page)
-        ).order_by('created_at').select_related('submitter').prefetch_related('reviewers__responses')
+        reviews = Review.objects.filter(page_id=self.object.pk).order_by('created_at', 'pk')
+        reviews = reviews.select_related('submitter').prefetch_related(
+            Prefetch('reviewers', queryset=Reviewer.objects.select_related('user').order_by('pk')),
+            Prefetch('reviewers__responses', queryset=Response.objects.order_by('created_at', 'pk')),
+        )
+        reviews_page = Paginator(reviews, self.reviews_per_page).get_page(self.request.GET.get('p'))
+
+        # Build the response listings from the prefetched reviewers, as Review.get_responses and
+        # Review.get_non_responding_reviewers would start fresh queries for every review
+        for review in reviews_page:
+            reviewers = review.reviewers.all()
+            review.audit_trail_responses = sorted(
+                (response for reviewer in reviewers for response in reviewer.responses.all()),
+                key=lambda response: (response.created_at, response.pk)
+            )
+            review.audit_trail_non_responding_reviewers = [
+                reviewer for reviewer in reviewers
+                if not reviewer.responses.all() and reviewer.user_id != review.submitter_id
+            ]
+
+        context['reviews'] = reviews_page
         context['page_permissions'] = self.object.permissions_for_user(self.request.user)
 
         return context
 
 
+ANNOTATIONS_PER_PAGE = 20
+
+
+def search_annotations(request):
+    """
+    Search the comments made in all reviews of pages the user can edit
+    """
+    form = SearchForm(request.GET or None, placeholder=_("Search comments"))
+    query = None
+    annotations = Annotation.objects.none()
+
+    if form.is_valid() and form.cleaned_data['q']:
+        query = form.cleaned_data['q']
+        pages = Review.get_pages_with_reviews_for_user(request.user)
+        annotations = get_annotation_search_backend().search(
+            Annotation.objects.filter(reviewer__review__page__in=pages.values('pk')), query
+        ).select_related('reviewer__user', 'reviewer__review__page').order_by('-updated_at', '-id')
+
+    return TemplateResponse(request, 'wagtail_review/admin/annotation_search.html', {
+        'search_form': form,
+        'query': query,
+        'annotations': Paginator(annotations, ANNOTATIONS_PER_PAGE).get_page(request.GET.get('p')),
+    })
+
+
 def view_review_page(request, review_id=None):
     review = get_object_or_404(Review, id=review_id)
 
@@ -151,19 +179,12 @@ def view_review_page(request, review_id=None):
         except Reviewer.DoesNotExist:
             raise PermissionDenied
 
-    page = review.page_revision.as_object()
     if reviewer.user == request.user:
         review_mode = 'comment'
     else:
         review_mode = 'view'
 
-    return page.make_preview_request(
-        original_request=request,
-        extra_request_attrs={
-            'wagtailreview_reviewer': reviewer,
-            'wagtailreview_mode': review_mode,
-        }
-    )
+    return serve_review_preview(request, reviewer, review_mode)
 
 
 @require_POST
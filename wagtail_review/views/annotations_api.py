@@ -1,32 +1,175 @@
+import datetime
+import hashlib
 import json
+import time
+from functools import wraps
 
+from django.conf import settings
+from django.core import signing
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponseNotAllowed, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.views.decorators.cache import never_cache
+from django.utils import timezone
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.vary import vary_on_headers
 
-from wagtail_review.models import Annotation, Reviewer
+from wagtail_review.annotation_search import get_annotation_search_backend
+from wagtail_review.credentials import (
+    check_reviewer_token, check_signed_token, is_signed_token, use_signed_credentials
+)
+from wagtail_review.events import get_event_backend, get_events_max_age, notify_review_changed
+from wagtail_review.models import Annotation, AnnotationRange, DeletedAnnotation, Reviewer
 
 
-def _check_reviewer_credentials(request):
+def _get_credentials(request):
+    """
+    Return the (mode, reviewer ID, token) passed in the request headers or query string
+    """
     try:
         mode = request.META.get('HTTP_X_WAGTAILREVIEW_MODE') or request.GET['mode']
         reviewer_id = request.META.get('HTTP_X_WAGTAILREVIEW_REVIEWER') or request.GET['reviewer']
         token = request.META.get('HTTP_X_WAGTAILREVIEW_TOKEN') or request.GET['token']
-        reviewer = Reviewer.objects.get(id=reviewer_id)
-    except (KeyError, Reviewer.DoesNotExist):
+    except KeyError:
         raise PermissionDenied
 
-    if (mode == 'respond' or mode == 'comment') and token == reviewer.response_token:
-        pass
-    elif mode == 'view' and token == reviewer.view_token:
-        pass
+    return mode, reviewer_id, token
+
+
+def _get_signed_token_reviewer(reviewer_id, review_id):
+    # The token is sufficient proof of the reviewer's identity, so avoid fetching the reviewer
+    # record; only the reviewer and review IDs are populated
+    reviewer = Reviewer(id=int(reviewer_id), review_id=review_id)
+    reviewer._state.adding = False
+    return reviewer
+
+
+def _check_reviewer_credentials(request):
+    # credentials may already have been checked for this request while computing the ETag
+    if hasattr(request, '_wagtailreview_credentials'):
+        return request._wagtailreview_credentials
+
+    mode, reviewer_id, token = _get_credentials(request)
+
+    if use_signed_credentials() and is_signed_token(token):
+        try:
+            review_id = check_signed_token(token, reviewer_id, mode)
+        except signing.BadSignature:
+            raise PermissionDenied
+
+        reviewer = _get_signed_token_reviewer(reviewer_id, review_id)
     else:
-        raise PermissionDenied
+        try:
+            reviewer = Reviewer.objects.get(id=reviewer_id)
+        except (ValueError, Reviewer.DoesNotExist):
+            raise PermissionDenied
 
+        if not check_reviewer_token(reviewer, mode, token):
+            raise PermissionDenied
+
+    request._wagtailreview_credentials = (reviewer, mode)
     return (reviewer, mode)
 
 
+# aggregates over the annotations in a review that change whenever an annotation is created, updated or deleted
+ETAG_AGGREGATES = {
+    'last_updated_at': Max('updated_at'),
+    'count': Count('id'),
+}
+
+
+def _annotations_etag(request, *args, **kwargs):
+    """
+    ETag for annotation API responses, which changes whenever any annotation in the reviewer's review
+    is created, updated or deleted. Responses vary by URL and query string, so these are included too.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+
+    reviewer, mode = _check_reviewer_credentials(request)
+    stats = Annotation.objects.filter(reviewer__review_id=reviewer.review_id).aggregate(**ETAG_AGGREGATES)
+    return _get_etag(request, reviewer.review_id, stats)
+
+
+def _get_etag(request, review_id, stats):
+    key = '%s|%s|%d|%s|%d' % (
+        request.path, request.GET.urlencode(), review_id,
+        stats['last_updated_at'].isoformat() if stats['last_updated_at'] else '', stats['count']
+    )
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def annotations_api_view(view_func):
+    """
+    Decorator for annotation API views that read annotations: allows clients to cache responses
+    privately and revalidate them with If-None-Match, answering with 304 Not Modified when no
+    annotation in the review has changed
+    """
+    @wraps(view_func)
+    @cache_control(private=True, no_cache=True)
+    @vary_on_headers('X-WagtailReview-Mode', 'X-WagtailReview-Reviewer', 'X-WagtailReview-Token')
+    @condition(etag_func=_annotations_etag)
+    def wrapped_view(request, *args, **kwargs):
+        return view_func(request, *args, **kwargs)
+
+    return wrapped_view
+
+
+# number of annotations to fetch from the database at a time when streaming responses
+STREAMING_CHUNK_SIZE = 500
+
+
+def _use_streaming_responses():
+    return getattr(settings, 'WAGTAILREVIEW_STREAM_ANNOTATIONS', False)
+
+
+def _json_dumps(data):
+    # matches the encoding used by JsonResponse, so that streamed responses are byte-for-byte identical
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def _stream_annotations_array(annotations, state=None):
+    """
+    Generator yielding the JSON list representation of the given annotation queryset in chunks,
+    fetching annotations from the database STREAMING_CHUNK_SIZE at a time. If a 'state' dict is
+    passed, it is updated with the number of annotations output and the last annotation seen.
+    """
+    state = _start_annotations_array(state)
+    yield '['
+    for annotation in annotations.iterator(chunk_size=STREAMING_CHUNK_SIZE):
+        yield _format_annotations_array_item(annotation, state)
+    yield ']'
+
+
+def _start_annotations_array(state=None):
+    """
+    Initialise (or create) the state dict used by _format_annotations_array_item
+    """
+    if state is None:
+        state = {}
+    state.update(count=0, last_annotation=None, reviewer_names={})
+    return state
+
+
+def _format_annotations_array_item(annotation, state):
+    """
+    Return the JSON for an annotation as an item of a streamed array, preceded by a separator if it
+    is not the first, and record it in the state dict returned by _start_annotations_array. Shared
+    by the synchronous and asynchronous streaming views.
+    """
+    chunk = (', ' if state['count'] else '') + _json_dumps(annotation.as_json_data(state['reviewer_names']))
+    state['count'] += 1
+    state['last_annotation'] = annotation
+    return chunk
+
+
+def _streaming_json_response(chunks):
+    return StreamingHttpResponse(chunks, content_type='application/json')
+
+
 def root(request):
     return JsonResponse({
         "name": "Annotator Store API",
@@ -34,15 +177,15 @@ def root(request):
     })
 
 
-@never_cache
+@annotations_api_view
 def index(request):
     reviewer, mode = _check_reviewer_credentials(request)
 
     if request.method == 'GET':
-        results = [
-            annotation.as_json_data()
-            for annotation in reviewer.review.get_annotations()
-        ]
+        if _use_streaming_responses():
+            return _streaming_json_response(_stream_annotations_array(reviewer.review.get_annotations()))
+
+        results = Annotation.as_json_data_list(reviewer.review.get_annotations())
         return JsonResponse(results, safe=False)
 
     elif request.method == 'POST':
@@ -52,45 +195,565 @@ def index(request):
         if reviewer.review.status == 'closed':
             raise PermissionDenied
 
-        data = json.loads(request.body)
-
-        annotation = reviewer.annotations.create(quote=data['quote'], text=data['text'])
-        for r in data['ranges']:
-            annotation.ranges.create(
-                start=r['start'], start_offset=r['startOffset'], end=r['end'], end_offset=r['endOffset']
-            )
-
+        annotation = _create_annotation(reviewer, json.loads(request.body))
         return redirect('wagtail_review:annotations_api_item', annotation.id)
     else:
         return HttpResponseNotAllowed(['GET', 'POST'], "Method not allowed")
 
 
+def _create_annotation(reviewer, data):
+    with transaction.atomic():
+        annotation = reviewer.annotations.create(quote=data['quote'], text=data['text'])
+        AnnotationRange.objects.bulk_create([
+            AnnotationRange.from_json_data(r, annotation=annotation) for r in data['ranges']
+        ])
+    return annotation
+
+
+# maximum number of annotations that can be created in one call to the batch endpoint
+MAX_BATCH_SIZE = 500
+
+
 @never_cache
+@require_POST
+def batch(request):
+    """
+    Create multiple annotations from a JSON list of Annotator annotations, returning their IDs in
+    the same order. All annotations and ranges are inserted with bulk_create in a single transaction.
+    """
+    reviewer, mode = _check_reviewer_credentials(request)
+
+    if mode not in ('respond', 'comment'):
+        raise PermissionDenied
+
+    if reviewer.review.status == 'closed':
+        raise PermissionDenied
+
+    try:
+        annotations, ranges = _parse_batch(reviewer, json.loads(request.body))
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest("Invalid annotation data")
+
+    _bulk_create_annotations(reviewer, annotations, ranges)
+    return JsonResponse({'ids': [annotation.id for annotation in annotations]}, status=201)
+
+
+def _parse_batch(reviewer, data):
+    """
+    Build unsaved annotations from the batch endpoint's JSON data, returning a list of annotations
+    and a list of the ranges for each one
+    """
+    if not isinstance(data, list) or len(data) > MAX_BATCH_SIZE:
+        raise ValueError("expected a list of at most %d annotations" % MAX_BATCH_SIZE)
+
+    annotations = []
+    ranges = []
+    for annotation_data in data:
+        _check_annotation_data(annotation_data)
+        annotation = Annotation(reviewer=reviewer, quote=annotation_data['quote'], text=annotation_data['text'])
+        annotations.append(annotation)
+        ranges.append([AnnotationRange.from_json_data(r) for r in annotation_data['ranges']])
+    return annotations, ranges
+
+
+def _check_annotation_data(data, partial=False):
+    """
+    Raise ValueError unless the Annotator JSON data for an annotation is an object with strings for
+    'quote' and 'text', and a list of range objects for 'ranges'. If partial is true, any of these
+    fields may be omitted.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("expected an annotation object")
+
+    for field in ('quote', 'text', 'ranges'):
+        if field not in data:
+            if not partial:
+                raise ValueError("%s is required" % field)
+        elif field == 'ranges':
+            if not isinstance(data[field], list) or not all(isinstance(r, dict) for r in data[field]):
+                raise ValueError("ranges must be a list of range objects")
+        elif not isinstance(data[field], str):
+            raise ValueError("%s must be a string" % field)
+
+
+def _bulk_create_annotations(reviewer, annotations, ranges):
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Annotation.objects.bulk_create(annotations)
+        else:
+            # the database can't tell us the IDs of bulk-inserted rows, which we need for the ranges
+            for annotation in annotations:
+                annotation.save()
+
+        for annotation, annotation_ranges in zip(annotations, ranges):
+            for annotation_range in annotation_ranges:
+                annotation_range.annotation = annotation
+        AnnotationRange.objects.bulk_create(
+            [annotation_range for annotation_ranges in ranges for annotation_range in annotation_ranges],
+            batch_size=1000
+        )
+        # bulk_create does not send post_save signals
+        notify_review_changed(reviewer.review_id)
+
+
+@annotations_api_view
 def item(request, id):
     reviewer, mode = _check_reviewer_credentials(request)
 
     if request.method == 'GET':
-        annotation = get_object_or_404(Annotation, id=id)
+        annotation = get_object_or_404(
+            Annotation.objects.select_related('reviewer__user').prefetch_related('ranges'), id=id
+        )
 
         # only allow retrieving annotations within the same review as the current user's credentials
-        if reviewer.review != annotation.reviewer.review:
+        if reviewer.review_id != annotation.reviewer.review_id:
             raise PermissionDenied
 
         return JsonResponse(annotation.as_json_data())
 
+    elif request.method in ('PUT', 'PATCH', 'DELETE'):
+        if mode not in ('respond', 'comment'):
+            raise PermissionDenied
+
+        if reviewer.review.status == 'closed':
+            raise PermissionDenied
+
+        annotation = get_object_or_404(
+            Annotation.objects.select_related('reviewer__user').prefetch_related('ranges'), id=id
+        )
+
+        # reviewers can only change their own annotations
+        if annotation.reviewer_id != reviewer.id:
+            raise PermissionDenied
+
+        if request.method == 'DELETE':
+            annotation.delete()
+            return HttpResponse(status=204)
+
+        try:
+            data = json.loads(request.body)
+            with transaction.atomic():
+                _update_annotation(annotation, data)
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest("Invalid annotation data")
+
+        return JsonResponse(annotation.as_json_data())
+
     else:
-        return HttpResponseNotAllowed(['GET'], "Method not allowed")
+        return HttpResponseNotAllowed(['GET', 'PUT', 'PATCH', 'DELETE'], "Method not allowed")
 
 
-@never_cache
+def _update_annotation(annotation, data):
+    """
+    Update an annotation (fetched with its ranges prefetched) from Annotator JSON data, which may
+    omit fields that are not being changed. Ranges are compared with the existing ones, so that only
+    those that have been removed or added are deleted or inserted, in one query each. Raises
+    ValueError if the data is invalid (see _check_annotation_data).
+    """
+    _check_annotation_data(data, partial=True)
+
+    if 'quote' in data:
+        annotation.quote = data['quote']
+    if 'text' in data:
+        annotation.text = data['text']
+
+    if 'ranges' in data:
+        new_ranges = [AnnotationRange.from_json_data(r, annotation=annotation) for r in data['ranges']]
+        old_ranges = list(annotation.ranges.all())
+
+        def range_key(annotation_range):
+            return tuple(sorted(annotation_range.as_json_data().items()))
+
+        # match up new ranges with identical existing ones, leaving the unmatched ones to be deleted
+        unmatched_ranges = {}
+        for old_range in old_ranges:
+            unmatched_ranges.setdefault(range_key(old_range), []).append(old_range)
+        ranges_to_create = []
+        for new_range in new_ranges:
+            matches = unmatched_ranges.get(range_key(new_range))
+            if matches:
+                matches.pop(0)
+            else:
+                ranges_to_create.append(new_range)
+        ranges_to_delete = [r.id for matches in unmatched_ranges.values() for r in matches]
+
+        if ranges_to_delete:
+            AnnotationRange.objects.filter(id__in=ranges_to_delete).delete()
+        if ranges_to_create:
+            AnnotationRange.objects.bulk_create(ranges_to_create)
+
+        # discard the prefetched ranges so that they are re-fetched when the annotation is serialised
+        annotation._prefetched_objects_cache.pop('ranges', None)
+
+    # always save, so that updated_at changes even if only the ranges have been changed
+    annotation.save(update_fields=['quote', 'text', 'updated_at'])
+
+
+# Annotator store field filters supported by the search endpoint, as a mapping of
+# query parameter to queryset lookup
+SEARCH_FIELD_FILTERS = {
+    'user': 'reviewer_id',
+}
+
+# full text search filters supported by the search endpoint, as a mapping of query
+# parameter to the annotation fields searched
+SEARCH_TEXT_FILTERS = {
+    'quote': ('quote', ),
+    'text': ('text', ),
+    'any': ('text', 'quote'),
+}
+
+# upper bound on the 'limit' parameter of the search endpoint
+MAX_SEARCH_LIMIT = 500
+
+
+def _get_int_param(params, name, default=None):
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+
+    value = int(value)
+    if value < 0:
+        raise ValueError("%s must not be negative" % name)
+    return value
+
+
+def _encode_cursor(updated_at, id):
+    return '%s,%d' % (updated_at.isoformat(), id)
+
+
+def _decode_cursor(cursor):
+    """
+    Parse a cursor as returned by _encode_cursor into an (updated_at, id) tuple
+    """
+    updated_at, id = cursor.rsplit(',', 1)
+    updated_at = datetime.datetime.fromisoformat(updated_at)
+    if timezone.is_naive(updated_at):
+        raise ValueError("cursor timestamp must include a timezone")
+    return updated_at, int(id)
+
+
+@annotations_api_view
 def search(request):
+    """
+    Annotator store search endpoint. Accepts the optional parameters:
+
+    * limit / offset - return at most 'limit' annotations, skipping the first 'offset'
+    * after - only return annotations following this cursor, as given in the 'next' field of a previous
+      response; this paginates by (updated_at, id) without the cost of a large offset
+    * quote / text / any - only return annotations containing all the words given in the quote, the
+      text, or either of them (see wagtail_review.annotation_search)
+    * user - only return annotations by this reviewer ID
+    * since - switch to incremental sync mode (see _sync_annotations)
+
+    'total' in the response is the number of matching annotations ignoring limit, offset and after.
+    """
     reviewer, mode = _check_reviewer_credentials(request)
 
-    results = [
-        annotation.as_json_data()
-        for annotation in reviewer.review.get_annotations()
-    ]
-    return JsonResponse({
+    try:
+        annotations, limit, offset, after, since = _parse_search_params(
+            request, reviewer.review.get_annotations().order_by('updated_at', 'id')
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid search parameters")
+
+    if 'since' in request.GET:
+        return _sync_annotations(reviewer, annotations, since, limit)
+
+    is_paginated = (limit is not None or offset or after)
+    streaming = _use_streaming_responses()
+    if is_paginated or streaming:
+        total = annotations.count()
+
+    annotations, limit = _paginate_search_results(annotations, limit, offset, after)
+
+    if streaming:
+        return _streaming_json_response(_stream_search_results(total, annotations, limit))
+
+    annotations = list(annotations)
+    results = Annotation.as_json_data_list(annotations)
+    if not is_paginated:
+        total = len(results)
+
+    data = {
+        'total': total,
+        'rows': results,
+    }
+    if limit is not None:
+        data['next'] = _get_next_cursor(annotations[-1] if annotations else None, len(annotations), limit)
+
+    return JsonResponse(data)
+
+
+def _parse_search_params(request, annotations):
+    """
+    Apply the field filters in the search endpoint's query string to the annotations queryset, returning
+    it along with the limit, offset, after and since parameters. Raises ValueError if any are invalid.
+    """
+    for param, lookup in SEARCH_FIELD_FILTERS.items():
+        if param in request.GET:
+            annotations = annotations.filter(**{lookup: request.GET[param]})
+
+    for param, fields in SEARCH_TEXT_FILTERS.items():
+        if request.GET.get(param):
+            annotations = get_annotation_search_backend().search(annotations, request.GET[param], fields)
+
+    limit = _get_int_param(request.GET, 'limit')
+    offset = _get_int_param(request.GET, 'offset', 0)
+    after = _decode_cursor(request.GET['after']) if request.GET.get('after') else None
+    since = _decode_cursor(request.GET['since']) if request.GET.get('since') else None
+    return annotations, limit, offset, after, since
+
+
+def _paginate_search_results(annotations, limit, offset, after):
+    """
+    Return the page of the annotations queryset given by the search parameters, along with the limit
+    capped to MAX_SEARCH_LIMIT
+    """
+    if after:
+        updated_at, id = after
+        annotations = annotations.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=id))
+
+    if limit is None:
+        return annotations[offset:], None
+
+    limit = min(limit, MAX_SEARCH_LIMIT)
+    return annotations[offset:offset + limit], limit
+
+
+def _get_next_cursor(last_annotation, count, limit):
+    # a full page of results means there may be more to fetch
+    if last_annotation is not None and count == limit:
+        return _encode_cursor(last_annotation.updated_at, last_annotation.id)
+
+
+def _stream_search_results(total, annotations, limit):
+    yield _format_search_results_start(total)
+    state = {}
+    yield from _stream_annotations_array(annotations, state)
+    yield _format_search_results_end(state, limit)
+
+
+def _format_search_results_start(total):
+    return '{"total": %s, "rows": ' % _json_dumps(total)
+
+
+def _format_search_results_end(state, limit):
+    """
+    Return the end of a streamed search response, following the array of annotations output with
+    the given state dict
+    """
+    if limit is None:
+        return '}'
+    return ', "next": %s}' % _json_dumps(_get_next_cursor(state['last_annotation'], state['count'], limit))
+
+
+def _get_sync_safety_window():
+    return getattr(settings, 'WAGTAILREVIEW_SYNC_SAFETY_WINDOW', 60)
+
+
+def _get_annotation_changes(review_id, annotations, since, limit):
+    """
+    Return a list of the annotations created or updated after the 'since' cursor (or all annotations,
+    if the cursor is empty), a list of (annotation ID, deleted_at) tuples for annotations deleted
+    since then, the cursor to continue from, and whether the cursor was too old to continue from
+    (in which case all annotations are returned, and the client should discard the ones it has).
+    """
+    since, reset = _check_changes_cursor(since)
+    annotations, limit = _get_changed_annotations(annotations, since, limit)
+    annotations = list(annotations)
+    deleted = list(_get_deleted_annotations(review_id, since)) if since else []
+    return annotations, deleted, _get_changes_cursor(annotations, deleted, since, limit), reset
+
+
+def _check_changes_cursor(since):
+    # deletions older than the retention period may have been pruned, so a cursor from before then
+    # can't be continued from; start again from the beginning instead
+    if since and since[0] < DeletedAnnotation.get_retention_cutoff():
+        return None, True
+    return since, False
+
+
+def _get_changed_annotations(annotations, since, limit):
+    # returns the queryset of annotations changed after the 'since' cursor, and the limit capped to MAX_SEARCH_LIMIT
+    if since:
+        updated_at, id = since
+        annotations = annotations.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=id))
+
+    limit = MAX_SEARCH_LIMIT if limit is None else min(limit, MAX_SEARCH_LIMIT)
+    return annotations[:limit], limit
+
+
+def _get_deleted_annotations(review_id, since):
+    return (
+        DeletedAnnotation.objects.filter(review_id=review_id, deleted_at__gt=since[0])
+        .order_by('deleted_at').values_list('annotation_id', 'deleted_at')
+    )
+
+
+def _get_changes_cursor(annotations, deleted, since, limit):
+    cursor = since
+    if annotations:
+        cursor = (annotations[-1].updated_at, annotations[-1].id)
+
+    if len(annotations) < limit:
+        # Only move the cursor past the deletions if all updates up to that point have been returned
+        if deleted and deleted[-1][1] > cursor[0]:
+            cursor = (deleted[-1][1], 0)
+
+        # Timestamps are taken when a row is written rather than when its transaction commits, so a
+        # change that becomes visible after this sync may be older than the last one returned. Once
+        # the client has caught up, hold the cursor back by the safety window so that such changes
+        # are picked up next time, at the cost of returning the changes within the window again.
+        horizon = (timezone.now() - datetime.timedelta(seconds=_get_sync_safety_window()), 0)
+        if cursor is None or cursor > horizon:
+            cursor = horizon
+
+    return cursor
+
+
+def _changes_as_json_data(annotations, deleted, cursor, reset=False):
+    results = Annotation.as_json_data_list(annotations)
+    return {
         'total': len(results),
-        'rows': results
-    })
+        'rows': results,
+        'deleted': [annotation_id for annotation_id, deleted_at in deleted],
+        'cursor': _encode_cursor(*cursor) if cursor else '',
+        'reset': reset,
+    }
+
+
+def _get_unsent_changes(annotations, deleted, sent):
+    """
+    Filter out the changes that an event stream has already sent, as each sync repeats those made
+    within the safety window. 'sent' is a set of the (ID, timestamp) pairs sent so far for updated
+    and deleted annotations, and is updated with the changes returned.
+    """
+    annotations = [
+        annotation for annotation in annotations if ('updated', annotation.id, annotation.updated_at) not in sent
+    ]
+    deleted = [
+        (annotation_id, deleted_at) for annotation_id, deleted_at in deleted
+        if ('deleted', annotation_id, deleted_at) not in sent
+    ]
+    sent.update(('updated', annotation.id, annotation.updated_at) for annotation in annotations)
+    sent.update(('deleted', annotation_id, deleted_at) for annotation_id, deleted_at in deleted)
+    return annotations, deleted
+
+
+def _sync_annotations(reviewer, annotations, since, limit):
+    """
+    Return the annotations created or updated after the 'since' cursor (or all annotations, if the
+    cursor is empty), along with the IDs of annotations deleted since then, and a new cursor to pass
+    as 'since' on the next call. Clients can start from an empty cursor or from the 'updated' and
+    'id' fields of the last annotation they loaded, formatted as '<updated>,<id>'.
+
+    The cursor is held back by WAGTAILREVIEW_SYNC_SAFETY_WINDOW seconds, so recent changes may be
+    returned more than once. If the cursor is older than WAGTAILREVIEW_DELETED_ANNOTATION_RETENTION,
+    'reset' is true in the response, and all annotations are returned from the beginning.
+    """
+    return JsonResponse(_changes_as_json_data(*_get_annotation_changes(reviewer.review_id, annotations, since, limit)))
+
+
+# seconds of inactivity after which a comment is sent to keep an event stream connection open
+EVENTS_KEEPALIVE_INTERVAL = 15
+
+
+def _format_changes_event(changes, sent):
+    """
+    Given the result of _get_annotation_changes, return a tuple of the server-sent event for the
+    changes that have not already been sent (or None if there are none), the cursor to fetch the
+    next changes from, and whether more changes may be waiting beyond MAX_SEARCH_LIMIT. 'sent' is
+    updated as in _get_unsent_changes.
+    """
+    annotations, deleted, cursor, reset = changes
+    more_changes = (len(annotations) == MAX_SEARCH_LIMIT)
+    annotations, deleted = _get_unsent_changes(annotations, deleted, sent)
+    if not (annotations or deleted or reset):
+        return None, cursor, more_changes
+
+    data = _changes_as_json_data(annotations, deleted, cursor, reset)
+    return 'id: %s\nevent: annotations\ndata: %s\n\n' % (data['cursor'], _json_dumps(data)), cursor, more_changes
+
+
+def _get_keepalive_event(now, last_sent):
+    """
+    Return a keepalive comment if an event stream has sent nothing for EVENTS_KEEPALIVE_INTERVAL
+    seconds, otherwise None
+    """
+    if now - last_sent >= EVENTS_KEEPALIVE_INTERVAL:
+        return ': keepalive\n\n'
+    return None
+
+
+def _get_events_wait_timeout(now, deadline):
+    """
+    Return how long an event stream should wait for a change before sending a keepalive
+    """
+    return min(EVENTS_KEEPALIVE_INTERVAL, deadline - now)
+
+
+@never_cache
+def events(request):
+    """
+    Server-sent events stream of changes to the annotations in the reviewer's review, for clients
+    that would otherwise poll the search endpoint with 'since'. Each 'annotations' event contains
+    the same data as an incremental sync response, and its ID is the cursor to continue from, so
+    that a reconnecting EventSource (sending Last-Event-ID) picks up where it left off. The initial
+    cursor can be given as the 'since' parameter. Credentials may be passed as query parameters,
+    as EventSource cannot send custom headers.
+
+    The stream ends after WAGTAILREVIEW_EVENTS_MAX_AGE seconds (default 300), after which the client
+    is expected to reconnect; this stops connections from being held open indefinitely.
+    """
+    reviewer, mode = _check_reviewer_credentials(request)
+
+    try:
+        since = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+        since = _decode_cursor(since) if since else None
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    review = reviewer.review
+    subscription = get_event_backend().subscribe(review.pk)
+    response = StreamingHttpResponse(_stream_events(review, subscription, since), content_type='text/event-stream')
+    # stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _stream_events(review, subscription, since):
+    deadline = time.monotonic() + get_events_max_age()
+    last_sent = time.monotonic()
+    # look for changes made before the stream was opened
+    changed = True
+    sent = set()
+
+    try:
+        while True:
+            more_changes = False
+            if changed:
+                changes = _get_annotation_changes(
+                    review.pk, review.get_annotations().order_by('updated_at', 'id'), since, None
+                )
+                event, since, more_changes = _format_changes_event(changes, sent)
+                if event:
+                    yield event
+                    last_sent = time.monotonic()
+
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            if more_changes:
+                changed = True
+                continue
+
+            keepalive = _get_keepalive_event(now, last_sent)
+            if keepalive:
+                yield keepalive
+                last_sent = now
+
+            changed = subscription.wait(_get_events_wait_timeout(now, deadline))
+    finally:
+        subscription.close()
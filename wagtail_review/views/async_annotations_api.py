@@ -0,0 +1,390 @@
+"""
+Asynchronous versions of the views in wagtail_review.views.annotations_api, for ASGI deployments
+(see wagtail_review.async_urls). Reads go through Django's async ORM interface; writes that need a
+transaction are run through sync_to_async, as Django does not yet support async transactions.
+"""
+import json
+import time
+from functools import wraps
+
+import swapper
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+)
+from django.shortcuts import redirect
+from django.utils.cache import (
+    add_never_cache_headers, get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+)
+
+from wagtail_review.annotation_search import get_annotation_search_backend
+from wagtail_review.credentials import check_reviewer_token, check_signed_token, is_signed_token, use_signed_credentials
+from wagtail_review.events import get_event_backend, get_events_max_age
+from wagtail_review.models import Annotation, Reviewer
+from wagtail_review.views.annotations_api import (
+    ETAG_AGGREGATES, SEARCH_TEXT_FILTERS, STREAMING_CHUNK_SIZE, _bulk_create_annotations, _changes_as_json_data,
+    _check_changes_cursor, _create_annotation, _decode_cursor, _format_annotations_array_item,
+    _format_changes_event, _format_search_results_end, _format_search_results_start, _get_changed_annotations,
+    _get_changes_cursor, _get_credentials, _get_deleted_annotations, _get_etag, _get_events_wait_timeout,
+    _get_keepalive_event, _get_next_cursor, _get_signed_token_reviewer, _paginate_search_results, _parse_batch,
+    _parse_search_params, _start_annotations_array, _update_annotation, _use_streaming_responses
+)
+
+Review = swapper.load_model('wagtail_review', 'Review')
+
+
+async def root(request):
+    return JsonResponse({
+        "name": "Annotator Store API",
+        "version": "2.0.0"
+    })
+
+
+async def _check_reviewer_credentials(request):
+    # credentials may already have been checked for this request while computing the ETag
+    if hasattr(request, '_wagtailreview_credentials'):
+        return request._wagtailreview_credentials
+
+    mode, reviewer_id, token = _get_credentials(request)
+
+    if use_signed_credentials() and is_signed_token(token):
+        try:
+            # the revocation check may need to look up the reviewer record
+            review_id = await sync_to_async(check_signed_token)(token, reviewer_id, mode)
+        except signing.BadSignature:
+            raise PermissionDenied
+
+        reviewer = _get_signed_token_reviewer(reviewer_id, review_id)
+    else:
+        try:
+            reviewer = await Reviewer.objects.aget(id=reviewer_id)
+        except (ValueError, Reviewer.DoesNotExist):
+            raise PermissionDenied
+
+        if not check_reviewer_token(reviewer, mode, token):
+            raise PermissionDenied
+
+    request._wagtailreview_credentials = (reviewer, mode)
+    return (reviewer, mode)
+
+
+async def _get_review(reviewer):
+    """
+    Fetch the reviewer's review, which cannot be loaded lazily through reviewer.review in async code
+    """
+    if not Reviewer.review.is_cached(reviewer):
+        reviewer.review = await Review.objects.aget(pk=reviewer.review_id)
+    return reviewer.review
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _annotations_etag(request):
+    if request.method not in ('GET', 'HEAD'):
+        return None
+
+    reviewer, mode = await _check_reviewer_credentials(request)
+    stats = await Annotation.objects.filter(reviewer__review_id=reviewer.review_id).aaggregate(**ETAG_AGGREGATES)
+    return _get_etag(request, reviewer.review_id, stats)
+
+
+def annotations_api_view(view_func):
+    """
+    Asynchronous equivalent of annotations_api.annotations_api_view. Django's cache_control,
+    vary_on_headers and condition decorators cannot be used, as they either do not support async views
+    on all supported Django versions or compute the ETag synchronously.
+    """
+    @wraps(view_func)
+    async def wrapped_view(request, *args, **kwargs):
+        etag = await _annotations_etag(request)
+        etag = quote_etag(etag) if etag else None
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = await view_func(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+
+        patch_vary_headers(response, ('X-WagtailReview-Mode', 'X-WagtailReview-Reviewer', 'X-WagtailReview-Token'))
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapped_view
+
+
+async def _iter_annotations(annotations):
+    """
+    Iterate over an annotations queryset, fetching STREAMING_CHUNK_SIZE at a time along with their
+    ranges (aiterator() does not support prefetch_related on Django 4.2)
+    """
+    chunk = []
+    async for annotation in annotations.prefetch_related(None).aiterator(chunk_size=STREAMING_CHUNK_SIZE):
+        chunk.append(annotation)
+        if len(chunk) == STREAMING_CHUNK_SIZE:
+            await sync_to_async(prefetch_related_objects)(chunk, 'ranges')
+            for prefetched_annotation in chunk:
+                yield prefetched_annotation
+            chunk = []
+
+    if chunk:
+        await sync_to_async(prefetch_related_objects)(chunk, 'ranges')
+        for prefetched_annotation in chunk:
+            yield prefetched_annotation
+
+
+async def _stream_annotations_array(annotations, state=None):
+    state = _start_annotations_array(state)
+    yield '['
+    async for annotation in _iter_annotations(annotations):
+        yield _format_annotations_array_item(annotation, state)
+    yield ']'
+
+
+@annotations_api_view
+async def index(request):
+    reviewer, mode = await _check_reviewer_credentials(request)
+
+    if request.method == 'GET':
+        annotations = (await _get_review(reviewer)).get_annotations()
+        if _use_streaming_responses():
+            return StreamingHttpResponse(_stream_annotations_array(annotations), content_type='application/json')
+
+        results = Annotation.as_json_data_list(await _alist(annotations))
+        return JsonResponse(results, safe=False)
+
+    elif request.method == 'POST':
+        if mode not in ('respond', 'comment'):
+            raise PermissionDenied
+
+        if (await _get_review(reviewer)).status == 'closed':
+            raise PermissionDenied
+
+        annotation = await sync_to_async(_create_annotation)(reviewer, json.loads(request.body))
+        return redirect('wagtail_review:annotations_api_item', annotation.id)
+    else:
+        return HttpResponseNotAllowed(['GET', 'POST'], "Method not allowed")
+
+
+async def batch(request):
+    """
+    Asynchronous version of annotations_api.batch
+    """
+    if request.method != 'POST':
+        response = HttpResponseNotAllowed(['POST'])
+    else:
+        response = await _batch(request)
+
+    add_never_cache_headers(response)
+    return response
+
+
+async def _batch(request):
+    reviewer, mode = await _check_reviewer_credentials(request)
+
+    if mode not in ('respond', 'comment'):
+        raise PermissionDenied
+
+    if (await _get_review(reviewer)).status == 'closed':
+        raise PermissionDenied
+
+    try:
+        annotations, ranges = _parse_batch(reviewer, json.loads(request.body))
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest("Invalid annotation data")
+
+    await sync_to_async(_bulk_create_annotations)(reviewer, annotations, ranges)
+    return JsonResponse({'ids': [annotation.id for annotation in annotations]}, status=201)
+
+
+async def _get_annotation(id):
+    try:
+        return await Annotation.objects.select_related('reviewer__user').prefetch_related('ranges').aget(id=id)
+    except Annotation.DoesNotExist:
+        raise Http404("No annotation matches the given query.")
+
+
+@sync_to_async
+def _update_annotation_atomically(annotation, data):
+    with transaction.atomic():
+        _update_annotation(annotation, data)
+
+
+@annotations_api_view
+async def item(request, id):
+    reviewer, mode = await _check_reviewer_credentials(request)
+
+    if request.method == 'GET':
+        annotation = await _get_annotation(id)
+
+        # only allow retrieving annotations within the same review as the current user's credentials
+        if reviewer.review_id != annotation.reviewer.review_id:
+            raise PermissionDenied
+
+        return JsonResponse(annotation.as_json_data())
+
+    elif request.method in ('PUT', 'PATCH', 'DELETE'):
+        if mode not in ('respond', 'comment'):
+            raise PermissionDenied
+
+        if (await _get_review(reviewer)).status == 'closed':
+            raise PermissionDenied
+
+        annotation = await _get_annotation(id)
+
+        # reviewers can only change their own annotations
+        if annotation.reviewer_id != reviewer.id:
+            raise PermissionDenied
+
+        if request.method == 'DELETE':
+            await annotation.adelete()
+            return HttpResponse(status=204)
+
+        try:
+            await _update_annotation_atomically(annotation, json.loads(request.body))
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest("Invalid annotation data")
+
+        # the ranges are re-fetched if they were changed
+        await sync_to_async(prefetch_related_objects)([annotation], 'ranges')
+        return JsonResponse(annotation.as_json_data())
+
+    else:
+        return HttpResponseNotAllowed(['GET', 'PUT', 'PATCH', 'DELETE'], "Method not allowed")
+
+
+@annotations_api_view
+async def search(request):
+    """
+    Asynchronous version of annotations_api.search
+    """
+    reviewer, mode = await _check_reviewer_credentials(request)
+
+    if any(request.GET.get(param) for param in SEARCH_TEXT_FILTERS):
+        # the default search backend is chosen by inspecting the database on first use
+        await sync_to_async(get_annotation_search_backend)()
+
+    try:
+        annotations, limit, offset, after, since = _parse_search_params(
+            request, (await _get_review(reviewer)).get_annotations().order_by('updated_at', 'id')
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Invalid search parameters")
+
+    if 'since' in request.GET:
+        changes = await _get_annotation_changes(reviewer.review_id, annotations, since, limit)
+        return JsonResponse(_changes_as_json_data(*changes))
+
+    is_paginated = (limit is not None or offset or after)
+    streaming = _use_streaming_responses()
+    if is_paginated or streaming:
+        total = await annotations.acount()
+
+    annotations, limit = _paginate_search_results(annotations, limit, offset, after)
+
+    if streaming:
+        return StreamingHttpResponse(_stream_search_results(total, annotations, limit), content_type='application/json')
+
+    annotations = await _alist(annotations)
+    results = Annotation.as_json_data_list(annotations)
+    if not is_paginated:
+        total = len(results)
+
+    data = {
+        'total': total,
+        'rows': results,
+    }
+    if limit is not None:
+        data['next'] = _get_next_cursor(annotations[-1] if annotations else None, len(annotations), limit)
+
+    return JsonResponse(data)
+
+
+async def _stream_search_results(total, annotations, limit):
+    yield _format_search_results_start(total)
+    state = {}
+    async for chunk in _stream_annotations_array(annotations, state):
+        yield chunk
+    yield _format_search_results_end(state, limit)
+
+
+async def _get_annotation_changes(review_id, annotations, since, limit):
+    """
+    Asynchronous version of annotations_api._get_annotation_changes
+    """
+    since, reset = _check_changes_cursor(since)
+    annotations, limit = _get_changed_annotations(annotations, since, limit)
+    annotations = await _alist(annotations)
+    deleted = await _alist(_get_deleted_annotations(review_id, since)) if since else []
+    return annotations, deleted, _get_changes_cursor(annotations, deleted, since, limit), reset
+
+
+async def events(request):
+    """
+    Asynchronous version of annotations_api.events. The stream waits for changes without holding a
+    thread, as long as the events backend's subscriptions implement await_change().
+    """
+    reviewer, mode = await _check_reviewer_credentials(request)
+
+    try:
+        since = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+        since = _decode_cursor(since) if since else None
+    except ValueError:
+        response = HttpResponseBadRequest("Invalid cursor")
+    else:
+        review = await _get_review(reviewer)
+        subscription = get_event_backend().subscribe(review.pk)
+        response = StreamingHttpResponse(_stream_events(review, subscription, since), content_type='text/event-stream')
+        # stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+
+    add_never_cache_headers(response)
+    return response
+
+
+async def _wait_for_change(subscription, timeout):
+    if hasattr(subscription, 'await_change'):
+        return await subscription.await_change(timeout)
+    return await sync_to_async(subscription.wait, thread_sensitive=False)(timeout)
+
+
+async def _stream_events(review, subscription, since):
+    deadline = time.monotonic() + get_events_max_age()
+    last_sent = time.monotonic()
+    # look for changes made before the stream was opened
+    changed = True
+    sent = set()
+
+    try:
+        while True:
+            more_changes = False
+            if changed:
+                changes = await _get_annotation_changes(
+                    review.pk, review.get_annotations().order_by('updated_at', 'id'), since, None
+                )
+                event, since, more_changes = _format_changes_event(changes, sent)
+                if event:
+                    yield event
+                    last_sent = time.monotonic()
+
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            if more_changes:
+                changed = True
+                continue
+
+            keepalive = _get_keepalive_event(now, last_sent)
+            if keepalive:
+                yield keepalive
+                last_sent = now
+
+            changed = await _wait_for_change(subscription, _get_events_wait_timeout(now, deadline))
+    finally:
+        subscription.close()
@@ -0,0 +1,44 @@
+"""
+Asynchronous versions of the views in wagtail_review.views.frontend, for ASGI deployments (see
+wagtail_review.async_urls). Rendering the page preview and saving responses are synchronous
+operations in Wagtail and Django, so these are run through sync_to_async.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.middleware.csrf import get_token as get_csrf_token
+
+from wagtail_review.credentials import check_reviewer_token
+from wagtail_review.models import Reviewer
+from wagtail_review.preview import serve_review_preview
+from wagtail_review.views.frontend import submit_response
+
+
+async def _get_reviewer(reviewer_id, mode, token):
+    try:
+        reviewer = await Reviewer.objects.select_related('review').aget(id=reviewer_id)
+    except Reviewer.DoesNotExist:
+        raise Http404("No reviewer matches the given query.")
+
+    if not check_reviewer_token(reviewer, mode, token):
+        raise PermissionDenied
+
+    return reviewer
+
+
+async def view(request, reviewer_id, token):
+    reviewer = await _get_reviewer(reviewer_id, 'view', token)
+    return await sync_to_async(serve_review_preview)(request, reviewer, 'view')
+
+
+async def respond(request, reviewer_id, token):
+    reviewer = await _get_reviewer(reviewer_id, 'respond', token)
+
+    if request.method == 'POST':
+        return await sync_to_async(submit_response)(request, reviewer)
+
+    else:
+        # see frontend.respond
+        get_csrf_token(request)
+
+        return await sync_to_async(serve_review_preview)(request, reviewer, 'respond')
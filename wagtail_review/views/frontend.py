@@ -5,54 +5,49 @@ from django.middleware.csrf import get_token as get_csrf_token
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 
+from wagtail_review.credentials import check_reviewer_token
 from wagtail_review.forms import ResponseForm
 from wagtail_review.models import Response, Reviewer
+from wagtail_review.preview import serve_review_preview
 
 SUCCESS_RESPONSE_MESSAGE = "Thank you, your review has been received."
 
 
 def view(request, reviewer_id, token):
     reviewer = get_object_or_404(Reviewer, id=reviewer_id)
-    if token != reviewer.view_token:
+    if not check_reviewer_token(reviewer, 'view', token):
         raise PermissionDenied
 
-    page = reviewer.review.page_revision.as_object()
-    return page.make_preview_request(
-        original_request=request,
-        extra_request_attrs={
-            'wagtailreview_mode': 'view',
-            'wagtailreview_reviewer': reviewer,
-        }
-    )
+    return serve_review_preview(request, reviewer, 'view')
 
 
 def respond(request, reviewer_id, token):
     reviewer = get_object_or_404(Reviewer, id=reviewer_id)
-    if token != reviewer.response_token:
+    if not check_reviewer_token(reviewer, 'respond', token):
         raise PermissionDenied
 
     if request.method == 'POST':
-        response = Response(reviewer=reviewer)
-        form = ResponseForm(request.POST, instance=response)
-        if form.is_valid() and reviewer.review.status != 'closed':
-            form.save()
-            response.send_notification_to_submitter()
-            if request.user.has_perm('wagtailadmin.access_admin'):
-                messages.success(request, SUCCESS_RESPONSE_MESSAGE)
-                return redirect(reverse('wagtail_review_admin:dashboard'))
-            return HttpResponse(SUCCESS_RESPONSE_MESSAGE)
+        return submit_response(request, reviewer)
 
     else:
-        page = reviewer.review.page_revision.as_object()
         # Fetch the CSRF token so that Django will return a set-cookie header in the case that this is
         # the user's first request, and ensure that the dummy request (where the submit-review form is
         # rendered) is using the same token
         get_csrf_token(request)
 
-        return page.make_preview_request(
-            original_request=request,
-            extra_request_attrs={
-                'wagtailreview_mode': 'respond',
-                'wagtailreview_reviewer': reviewer,
-            }
-        )
+        return serve_review_preview(request, reviewer, 'respond')
+
+
+def submit_response(request, reviewer):
+    """
+    Handle the submit-review form posted to the respond view
+    """
+    response = Response(reviewer=reviewer)
+    form = ResponseForm(request.POST, instance=response)
+    if form.is_valid() and reviewer.review.status != 'closed':
+        form.save()
+        response.send_notification_to_submitter()
+        if request.user.has_perm('wagtailadmin.access_admin'):
+            messages.success(request, SUCCESS_RESPONSE_MESSAGE)
+            return redirect(reverse('wagtail_review_admin:dashboard'))
+        return HttpResponse(SUCCESS_RESPONSE_MESSAGE)
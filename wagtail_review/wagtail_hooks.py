@@ -1,6 +1,7 @@
 from django.conf.urls import include
 from django.urls import re_path
 from django.contrib import messages as django_messages
+from django.core.cache import cache
 from django.templatetags.static import static
 from django.shortcuts import redirect
 from django.urls import reverse
@@ -15,6 +16,7 @@ from wagtail.admin.menu import MenuItem
 from wagtail import hooks
 
 from wagtail_review import admin_urls
+from wagtail_review.cache import get_reviews_menu_cache_key, get_reviews_menu_cache_timeout
 from wagtail_review.forms import get_review_form_class, ReviewerFormSet
 
 Review = swapper.load_model('wagtail_review', 'Review')
@@ -92,7 +94,12 @@ hooks.register('after_edit_page', handle_submit_for_review)
 
 class ReviewsMenuItem(MenuItem):
     def is_shown(self, request):
-        return bool(Review.get_pages_with_reviews_for_user(request.user))
+        cache_key = get_reviews_menu_cache_key(request.user)
+        is_shown = cache.get(cache_key)
+        if is_shown is None:
+            is_shown = Review.get_pages_with_reviews_for_user(request.user).exists()
+            cache.set(cache_key, is_shown, get_reviews_menu_cache_timeout())
+        return is_shown
 
 
 @hooks.register('register_admin_menu_item')